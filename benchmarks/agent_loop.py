@@ -0,0 +1,291 @@
+"""
+Benchmark the agent loop against a local fake OpenAI chat completions server.
+
+    python -m benchmarks.agent_loop --turns 20
+    python -m benchmarks.agent_loop --update-baselines
+
+Each scenario drives Agent.interact, think, act and execute_code through the
+fake server; the websocket scenario goes through the socket.io server. The run
+reports turns per second, latency percentiles per phase and peak memory, and
+exits with status 1 when a result regresses past benchmarks/baselines.json.
+
+The first turns of a scenario import modules and open connections, they are
+run before measuring. Baselines are scaled by the speed of a reference
+workload measured in the same process, so a slower machine is not reported
+as a regression, and runs shorter than MIN_GATED_TURNS are not gated.
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import os
+import socket
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from .fake_openai import FakeOpenAI
+
+BASELINES_PATH = Path(__file__).resolve().parent / 'baselines.json'
+PERCENTILES = (50, 95, 99)
+# Turns needed to gate on a percentile: p95 of a short run is its second
+# slowest turn, and p99 over a few dozen turns is the slowest, too noisy.
+GATED_PERCENTILES = {'p50': 20, 'p95': 60}
+# Absolute slack for latency comparisons, sub-millisecond phases are noisy.
+LATENCY_SLACK_MS = 2.0
+# Turns run before measuring, they pay for imports and new connections.
+WARMUP_TURNS = 2
+# Percentiles of shorter runs depend on a handful of samples.
+MIN_GATED_TURNS = GATED_PERCENTILES['p50']
+
+
+class PhaseTimer:
+    def __init__(self):
+        """
+        Record the duration of wrapped coroutine methods, per phase.
+        """
+        self.samples = {}
+
+    def wrap(self, owner, attribute, phase):
+        method = getattr(owner, attribute)
+
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                self.samples.setdefault(phase, []).append(time.perf_counter() - start)
+
+        setattr(owner, attribute, timed)
+
+    def record(self, phase, seconds):
+        self.samples.setdefault(phase, []).append(seconds)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+def summarize(timer, turns, elapsed):
+    return {
+        'turns': turns,
+        'turns_per_second': round(turns / elapsed, 2),
+        'latency_ms': {
+            phase: {f"p{percent}": round(percentile(samples, percent) * 1000, 3) for percent in PERCENTILES}
+            for phase, samples in sorted(timer.samples.items())
+        }
+    }
+
+
+def reference_speed(rounds=3, seconds=0.2):
+    """
+    Return the best rate, per second, of a fixed workload shaped like a turn's
+    own work: serializing and hashing a conversation.
+    """
+    messages = [{"role": "user", "content": f"Reference message {index} " * 8} for index in range(50)]
+    best = 0.0
+    for _ in range(rounds):
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            data = json.dumps(messages, sort_keys=True)
+            hashlib.sha256(json.dumps(json.loads(data)).encode('utf-8')).hexdigest()
+            count += 1
+        best = max(best, count / (time.perf_counter() - start))
+    return round(best, 1)
+
+
+def create_agent(stream):
+    from rich.console import Console
+    from saiku.agents.agent import Agent
+
+    agent = Agent({'llm': 'openai', 'allow_code_execution': True, 'speech': 'none', 'stream': stream})
+    agent.console = Console(file=io.StringIO())
+    return agent
+
+
+def instrument(agent, timer):
+    timer.wrap(agent, 'prepare_prediction', 'prompt')
+    timer.wrap(agent.model, 'predict', 'predict')
+    timer.wrap(agent, 'act', 'act')
+    timer.wrap(agent.functions['execute_code'], 'run', 'execute_code')
+
+
+async def run_turns(agent, turns, timer=None):
+    start = time.perf_counter()
+    for turn in range(turns):
+        agent.messages.append({"role": "user", "content": f"Benchmark turn {turn}"})
+        turn_start = time.perf_counter()
+        await agent.interact(True)
+        if timer is not None:
+            timer.record('turn', time.perf_counter() - turn_start)
+    return time.perf_counter() - start
+
+
+async def peak_memory(turns, stream):
+    """
+    Run a few turns with tracemalloc enabled and return the peak traced memory in MB.
+    """
+    agent = create_agent(stream)
+    tracemalloc.start()
+    try:
+        await run_turns(agent, turns)
+        return round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+    finally:
+        tracemalloc.stop()
+        await agent.close()
+
+
+async def run_scenario(scenario, turns, latency, stream):
+    server = FakeOpenAI(scenario, latency=latency)
+    os.environ['OPENAI_BASE_URL'] = await server.start()
+    try:
+        agent = create_agent(stream)
+        await run_turns(agent, WARMUP_TURNS)
+        agent.messages = []
+        timer = PhaseTimer()
+        instrument(agent, timer)
+        elapsed = await run_turns(agent, turns, timer)
+        await agent.close()
+        result = summarize(timer, turns, elapsed)
+        result['peak_memory_mb'] = await peak_memory(min(turns, 5), stream)
+        return result
+    finally:
+        await server.stop()
+
+
+async def run_websocket(turns, latency):
+    import socketio
+
+    server = FakeOpenAI('chat', latency=latency)
+    os.environ['OPENAI_BASE_URL'] = await server.start()
+    agent = create_agent(False)
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    serving = asyncio.ensure_future(
+        agent.functions['websocket_server'].run({'htmlContent': '', 'host': '127.0.0.1', 'port': port})
+    )
+    client = socketio.AsyncClient()
+    responses = asyncio.Queue()
+    client.on('agent_response', responses.put_nowait)
+    try:
+        for _ in range(50):
+            try:
+                await client.connect(f"http://127.0.0.1:{port}", transports=['websocket'])
+                break
+            except socketio.exceptions.ConnectionError:
+                await asyncio.sleep(0.1)
+
+        messages = []
+        for turn in range(WARMUP_TURNS):
+            await client.emit('agent_request', json.dumps([{"role": "user", "content": f"Warm-up turn {turn}"}]))
+            await asyncio.wait_for(responses.get(), timeout=30)
+
+        timer = PhaseTimer()
+        start = time.perf_counter()
+        for turn in range(turns):
+            messages.append({"role": "user", "content": f"Benchmark turn {turn}"})
+            request_start = time.perf_counter()
+            await client.emit('agent_request', json.dumps(messages))
+            content = await asyncio.wait_for(responses.get(), timeout=30)
+            timer.record('websocket', time.perf_counter() - request_start)
+            messages.append({"role": "assistant", "content": content})
+        return summarize(timer, turns, time.perf_counter() - start)
+    finally:
+        await client.disconnect()
+        serving.cancel()
+        await agent.close()
+        await server.stop()
+
+
+def compare(results, baselines, tolerance, reference=None):
+    """
+    Return a description of every result that regressed past its baseline.
+
+    With the `reference` speed of this run and of the baselines, throughput
+    and latency baselines are scaled to a slower machine. A faster one is
+    held to the baselines as they are.
+    """
+    scale = 1.0
+    baseline_reference = baselines.get('reference', {}).get('ops_per_second')
+    if reference and baseline_reference:
+        scale = min(1.0, reference / baseline_reference)
+    regressions = []
+    for scenario, baseline in baselines.items():
+        result = results.get(scenario)
+        if result is None or scenario == 'reference':
+            continue
+        expected = round(baseline['turns_per_second'] * scale, 2)
+        if result['turns_per_second'] < expected * (1 - tolerance):
+            regressions.append(f"{scenario}: {result['turns_per_second']} turns/s, baseline {expected}")
+        for phase, latencies in baseline.get('latency_ms', {}).items():
+            for name, value in latencies.items():
+                if result.get('turns', 0) < GATED_PERCENTILES.get(name, float('inf')):
+                    continue
+                measured = result['latency_ms'].get(phase, {}).get(name)
+                expected = round(value / scale, 3)
+                if measured is not None and measured > expected * (1 + tolerance) + LATENCY_SLACK_MS:
+                    regressions.append(f"{scenario}: {phase} {name} {measured} ms, baseline {expected} ms")
+        if 'peak_memory_mb' in baseline and result.get('peak_memory_mb', 0) > baseline['peak_memory_mb'] * (1 + tolerance):
+            regressions.append(f"{scenario}: peak memory {result['peak_memory_mb']} MB, baseline {baseline['peak_memory_mb']} MB")
+    return regressions
+
+
+async def run(args):
+    results = {}
+    for scenario in args.scenarios:
+        if scenario == 'websocket':
+            results[scenario] = await run_websocket(args.turns, args.latency)
+        else:
+            results[scenario] = await run_scenario(scenario, args.turns, args.latency, args.stream)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, default=MIN_GATED_TURNS)
+    parser.add_argument('--latency', type=float, default=0.0, help='Simulated model latency, in seconds.')
+    parser.add_argument('--stream', action='store_true', help='Use streaming completions.')
+    parser.add_argument('--scenarios', nargs='+', default=['chat', 'shell', 'parallel_tools', 'websocket'])
+    parser.add_argument('--tolerance', type=float, default=0.5, help='Allowed regression, as a fraction of the baseline.')
+    parser.add_argument('--baselines', type=Path, default=BASELINES_PATH)
+    parser.add_argument('--update-baselines', action='store_true')
+    args = parser.parse_args()
+
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+    reference = reference_speed()
+    # Runners print command output, keep the report readable.
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    print(f"Reference workload: {reference} ops/s")
+
+    if args.update_baselines:
+        if args.turns < MIN_GATED_TURNS:
+            sys.exit(f"Baselines need at least {MIN_GATED_TURNS} turns")
+        results['reference'] = {'ops_per_second': reference}
+        args.baselines.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baselines written to {args.baselines}")
+        return
+
+    if args.turns < MIN_GATED_TURNS:
+        print(f"Not compared to the baselines, the gate needs at least {MIN_GATED_TURNS} turns", file=sys.stderr)
+        return
+
+    if args.baselines.exists():
+        regressions = compare(results, json.loads(args.baselines.read_text()), args.tolerance, reference)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
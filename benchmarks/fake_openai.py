@@ -0,0 +1,140 @@
+"""
+A local stand-in for the OpenAI chat completions API, serving scripted scenarios.
+
+Each scenario is a list of steps. The step served for a request is the number
+of assistant messages since the last user message, so a scenario replays the
+same sequence of tool calls and answers for every user prompt.
+"""
+import asyncio
+import json
+import itertools
+
+from aiohttp import web
+
+from saiku.utils import ENVIRONMENT_MESSAGE_NAME, SAMPLE_MESSAGE_NAME
+
+SCENARIOS = {
+    # A single answer, no tools
+    "chat": [
+        {"content": "Hello! How can I help you today?"}
+    ],
+    # One shell command, then an answer
+    "shell": [
+        {"tool_calls": [{"name": "execute_code", "arguments": {"language": "bash", "code": "echo benchmark"}}]},
+        {"content": "The command printed `benchmark`."}
+    ],
+    # Three independent tool calls in one response, then an answer
+    "parallel_tools": [
+        {"tool_calls": [
+            {"name": "execute_code", "arguments": {"language": "bash", "code": "echo one"}},
+            {"name": "execute_code", "arguments": {"language": "bash", "code": "echo two"}},
+            {"name": "execute_code", "arguments": {"language": "python", "code": "print(3)"}}
+        ]},
+        {"content": "All three commands ran."}
+    ]
+}
+
+
+class FakeOpenAI:
+    def __init__(self, scenario, latency=0.0, chunk_latency=0.0):
+        """
+        Serve the steps of a scenario, after `latency` seconds, streaming when asked to.
+        """
+        self.steps = SCENARIOS[scenario] if isinstance(scenario, str) else scenario
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.ids = itertools.count()
+        self.requests = 0
+        self.app = web.Application()
+        self.app.router.add_post('/v1/chat/completions', self.completions)
+        self.runner = None
+        self.port = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{self.port}/v1"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    def step(self, messages):
+        messages = [message for message in messages if message.get("name") not in (ENVIRONMENT_MESSAGE_NAME, SAMPLE_MESSAGE_NAME)]
+        index = 0
+        for message in reversed(messages):
+            if message.get("role") == "user":
+                break
+            if message.get("role") == "assistant":
+                index += 1
+        return self.steps[min(index, len(self.steps) - 1)]
+
+    def message(self, step):
+        message = {"role": "assistant", "content": step.get("content")}
+        if step.get("tool_calls"):
+            message["tool_calls"] = [
+                {
+                    "id": f"call_{next(self.ids)}",
+                    "type": "function",
+                    "function": {"name": call["name"], "arguments": json.dumps(call["arguments"])}
+                }
+                for call in step["tool_calls"]
+            ]
+        return message
+
+    async def completions(self, request):
+        body = await request.json()
+        self.requests += 1
+        message = self.message(self.step(body["messages"]))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        finish_reason = "tool_calls" if message.get("tool_calls") else "stop"
+        if not body.get("stream"):
+            return web.json_response({
+                "id": "chatcmpl-benchmark",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": finish_reason, "message": message}]
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for delta in self.deltas(message):
+            chunk = {
+                "id": "chatcmpl-benchmark",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": body["model"],
+                "choices": [{"index": 0, "delta": delta, "finish_reason": None}]
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            if self.chunk_latency:
+                await asyncio.sleep(self.chunk_latency)
+        final = {
+            "id": "chatcmpl-benchmark",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]
+        }
+        await response.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+        return response
+
+    def deltas(self, message):
+        """
+        Split a message into stream deltas: words of the content, then each tool call in two parts.
+        """
+        if message.get("content"):
+            for word in message["content"].split(" "):
+                yield {"role": "assistant", "content": word + " "}
+        for index, tool_call in enumerate(message.get("tool_calls") or []):
+            arguments = tool_call["function"]["arguments"]
+            middle = len(arguments) // 2
+            yield {"tool_calls": [{"index": index, "id": tool_call["id"], "type": "function",
+                                   "function": {"name": tool_call["function"]["name"], "arguments": arguments[:middle]}}]}
+            yield {"tool_calls": [{"index": index, "function": {"arguments": arguments[middle:]}}]}
@@ -0,0 +1,68 @@
+"""
+Measure how long it takes to construct an Agent, with lazy and eager action loading.
+
+    python benchmarks/startup.py --runs 5
+
+Each measurement runs in a fresh interpreter so module import costs are included.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from saiku.agents.agent import Agent
+agent = Agent({'llm': 'openai'})
+failed = []
+if sys.argv[1] == 'eager':
+    for name in list(agent.functions):
+        try:
+            agent.functions[name]
+        except Exception as error:
+            failed.append(name)
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'modules': len(sys.modules), 'failed': failed}))
+"""
+
+
+def measure(mode, runs):
+    env = {**os.environ, 'OPENAI_API_KEY': os.environ.get('OPENAI_API_KEY', 'benchmark')}
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', SCRIPT, mode],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        'median_seconds': statistics.median(sample['seconds'] for sample in samples),
+        'modules': samples[-1]['modules'],
+        'failed': samples[-1]['failed']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    # Warm the manifest cache so both modes read it.
+    measure('lazy', 1)
+    results = {mode: measure(mode, args.runs) for mode in ('lazy', 'eager')}
+    for mode, result in results.items():
+        print(f"{mode:>5}: {result['median_seconds'] * 1000:8.1f} ms, {result['modules']} modules loaded")
+        if result['failed']:
+            print(f"       could not import: {', '.join(result['failed'])}")
+    speedup = results['eager']['median_seconds'] / results['lazy']['median_seconds']
+    print(f"lazy registry is {speedup:.1f}x faster to start")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,43 +1,84 @@
 #!/usr/bin/env python
+import ast
 import click
 import os
 import importlib.util
 import sys
 from pathlib import Path
 
+COMMANDS_PATH = Path(__file__).parent / 'commands'
+
 def get_directories(source):
     return [d.name for d in os.scandir(source) if d.is_dir()]
 
-@click.group(invoke_without_command=True)
-@click.version_option()
+def load_command(name):
+    """
+    Import a command module from its directory and return its click command.
+    """
+    module_path = COMMANDS_PATH / name / 'main.py'
+    if not module_path.exists():
+        return None
+    spec = importlib.util.spec_from_file_location(name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.command
+
+def read_short_help(module_path):
+    """
+    Read a command's help text from its source, without importing it.
+    """
+    tree = ast.parse(module_path.read_text(encoding='utf-8'))
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name == 'command':
+            for decorator in node.decorator_list:
+                if isinstance(decorator, ast.Call):
+                    for keyword in decorator.keywords:
+                        if keyword.arg == 'help' and isinstance(keyword.value, ast.Constant):
+                            return keyword.value.value
+            return ast.get_docstring(node) or ''
+    return ''
+
+class LazyGroup(click.Group):
+    """
+    A group whose subcommands are imported only when invoked.
+    Listing them in --help reads their help text from source.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loaded = {}
+
+    def list_commands(self, ctx):
+        # The default command runs when no subcommand is given, it is not listed
+        return sorted(
+            name for name in get_directories(COMMANDS_PATH)
+            if name != 'default' and (COMMANDS_PATH / name / 'main.py').exists()
+        )
+
+    def get_command(self, ctx, name):
+        if name not in self.loaded:
+            if name == 'default' or name not in self.list_commands(ctx):
+                return None
+            self.loaded[name] = load_command(name)
+        return self.loaded[name]
+
+    def format_commands(self, ctx, formatter):
+        limit = formatter.width - 6 - max((len(name) for name in self.list_commands(ctx)), default=0)
+        rows = []
+        for name in self.list_commands(ctx):
+            help_text = read_short_help(COMMANDS_PATH / name / 'main.py')
+            rows.append((name, click.utils.make_default_short_help(help_text, limit)))
+        if rows:
+            with formatter.section('Commands'):
+                formatter.write_dl(rows)
+
+@click.group(cls=LazyGroup, invoke_without_command=True)
+@click.version_option(package_name='saiku-py')
 @click.pass_context
 def cli(ctx):
     """Saiku AI agent to help automate your tasks"""
     if ctx.invoked_subcommand is None:
         # Call your default command here
-        ctx.forward(default_command)
-
-def load_commands():
-    commands_path = Path(__file__).parent / 'commands'
-    command_dirs = get_directories(commands_path)
-
-    for dir in command_dirs:
-        # Skip the default command directory
-        if dir == 'default':
-            continue
-        module_path = commands_path / dir / 'main.py'
-        if module_path.exists():
-            spec = importlib.util.spec_from_file_location(dir, module_path)
-            module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(module)
-            cli.add_command(module.command)
-
-spec = importlib.util.spec_from_file_location("default", Path(__file__).parent / 'commands/default/main.py')
-default_module = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(default_module)
-default_command = default_module.command
-
-load_commands()
+        ctx.forward(load_command('default'))
 
 if __name__ == '__main__':
     cli()
@@ -1,16 +1,8 @@
 import asyncio
 import click
-from saiku.agents.agent import Agent  # Import your Agent class
+from saiku.metrics import metrics
 
-async def main(opts):
-    speech = opts.get('speech', 'none')
-    interactive = opts.get('interactive', True)
-    interactive = False if interactive == 'false' else True
-
-    # Initialize the agent with the options
-    agent = Agent(opts)
-    agent.options = {**agent.options, **opts}
-    agent.system_message = opts.get('system_message', """
+DEFAULT_SYSTEM_PROMPT = """
             You are a highly efficient assistant, committed to navigating various functionalities to address user inquiries until the task is accomplished or no further steps can be taken. Your skills encompass a range of actions, including retrieving and sending emails, and accessing calendar events. Utilize these capabilities to effectively and efficiently meet the user's needs. Strive to execute the task by diligently following user instructions and employing available functions as necessary.
       Before initiating any action, meticulously scan the message history to extract needed arguments. This proactive approach helps in avoiding repetitive queries to the user for the same information, ensuring a seamless and productive conversation. Your role is to supply the code using the `function_call`. To prioritize privacy, let our agent execute the code. In case of initial failure, troubleshoot the issues, seek any additional information from the user, and persist in efforts to complete the task.
       You have being granted full access to the user's machine, providing explicit consent for you to act on their behalf. You acknowledge and accept all legal implications of this access, holding yourself responsible for any consequences that may arise. \n
@@ -24,7 +16,20 @@ async def main(opts):
       
       By using this service, users grant you full access to their machines, providing explicit consent for you to act on their behalf. Users acknowledge and accept all legal implications of this access, holding themselves responsible for any consequences that may arise.
 
-    """)
+    """
+
+async def main(opts):
+    # Imported here so `--help` does not pay for the agent's dependencies
+    from saiku.agents.agent import Agent
+
+    speech = opts.get('speech', 'none')
+    interactive = opts.get('interactive', True)
+    interactive = False if interactive == 'false' else True
+
+    # Initialize the agent with the options
+    agent = Agent(opts)
+    agent.options = {**agent.options, **opts}
+    agent.system_message = opts.get('system_message') or DEFAULT_SYSTEM_PROMPT
 
     message = "_Hello, I am your assistant. I am here to help you with your tasks._"
     if speech in ['both', 'output']:
@@ -32,6 +37,14 @@ async def main(opts):
 
     agent.display_message(message)
 
+    try:
+        await chat(agent, speech, interactive)
+    finally:
+        if agent.profiler:
+            agent.profiler.close()
+        await agent.close()
+
+async def chat(agent, speech, interactive):
     while interactive:
         user_query = ""
         if speech in ['both', 'input']:
@@ -58,7 +71,19 @@ async def main(opts):
 @click.option('--system-message', help='The model system role message')
 @click.option('--interactive', is_flag=True, default=True, help='Run the agent in interactive mode')
 @click.option('--llm', default='openai', type=click.Choice(['openai', 'vertexai']), help='The language model to use.')
-def command(allow_code_execution, speech, system_message, interactive, llm):
+@click.option('--stream/--no-stream', default=True, help='Render the response progressively as it is generated.')
+@click.option('--llm-temperature', type=float, help='Sampling temperature of the model, 0 makes responses repeatable.')
+@click.option('--llm-cache', is_flag=True, help='Cache deterministic model responses on disk, agent turns need --llm-temperature 0.')
+@click.option('--record', type=click.Path(dir_okay=False), help='Record model requests and responses to a JSONL cassette.')
+@click.option('--replay', type=click.Path(exists=True, dir_okay=False), help='Serve model responses from a recorded JSONL cassette.')
+@click.option('--metrics-file', type=click.Path(dir_okay=False), help='Write latency metrics as JSON to this file on exit.')
+@click.option('--profile', is_flag=True, help='Profile CPU time and allocations of each turn.')
+@click.option('--profile-dir', type=click.Path(file_okay=False), help='Where to write the profiles, defaults to the saiku cache directory.')
+@click.option('--code-timeout', type=float, help='Seconds of wall time each code execution may take.')
+@click.option('--code-cpu-time', type=float, help='Seconds of CPU time each code execution may use.')
+@click.option('--code-memory', type=int, help='Megabytes of memory each code execution may use.')
+@click.option('--action-timeout', type=float, help='Seconds a blocking or CPU-bound action may take.')
+def command(allow_code_execution, speech, system_message, interactive, llm, stream, llm_temperature, llm_cache, record, replay, metrics_file, profile, profile_dir, code_timeout, code_cpu_time, code_memory, action_timeout):
     """AI agent to help automate your tasks."""
     # Construct options dictionary
     opts = {
@@ -66,9 +91,24 @@ def command(allow_code_execution, speech, system_message, interactive, llm):
         'speech': speech,
         'system_message': system_message,
         'interactive': interactive,
-        'llm': llm
+        'llm': llm,
+        'stream': stream,
+        'llm_temperature': llm_temperature,
+        'llm_cache': llm_cache or None,
+        'llm_transport': 'replay' if replay else 'record' if record else None,
+        'llm_cassette': replay or record,
+        'profile': profile,
+        'profile_dir': profile_dir,
+        'code_timeout': code_timeout,
+        'code_cpu_time': code_cpu_time,
+        'code_memory_mb': code_memory,
+        'action_timeout': action_timeout
     }
-    asyncio.run(main(opts))
+    try:
+        asyncio.run(main(opts))
+    finally:
+        if metrics_file:
+            metrics.dump(metrics_file)
 
 if __name__ == "__main__":
     command()
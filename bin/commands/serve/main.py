@@ -1,39 +1,119 @@
 import asyncio
 import os
+import subprocess
 import click
 from pathlib import Path
-import nest_asyncio
 
-from saiku.agents.agent import Agent  # Replace with your actual Agent import
+from saiku.metrics import metrics
+
+async def main(opts, sock=None):
+    # Imported here so `--help` does not pay for the agent's dependencies
+    import nest_asyncio
+    from saiku.agents.agent import Agent
 
-async def main(opts):
     nest_asyncio.apply()
     opts = {"actionsPath": "../actions", "allowCodeExecution": True, **opts}
     agent = Agent(opts)
     agent.options = {**agent.options, **opts}
-    await check_and_install_packages(agent)
-    await agent.functions["websocket_server"].run({'htmlContent': "<a href='http://localhost:8080' traget='_blank'>http://localhost:8080</a>"})
-    print("Starting the agent...")
-    await agent.functions["execute_code"].run({'language': "bash", "code": "cd {} && npm run dev".format(Path(os.getcwd(), "extensions", "ai-chatbot"))})
+    try:
+        await agent.functions["websocket_server"].run({
+            'htmlContent': "<a href='http://localhost:8080' traget='_blank'>http://localhost:8080</a>",
+            'host': opts['host'],
+            'port': opts['port'],
+            'sock': sock
+        })
+        print("Starting the agent...")
+        await agent.functions["execute_code"].run({'language': "bash", "code": "cd {} && npm run dev".format(Path(os.getcwd(), "extensions", "ai-chatbot"))})
+    finally:
+        if agent.profiler:
+            agent.profiler.close()
+        await agent.close()
+
+def worker_options(opts, index):
+    """
+    Options of one worker process, each writes its own profiles.
+    """
+    opts = dict(opts)
+    if opts['profile']:
+        from saiku.profiling import default_profile_dir
+        opts['profile_dir'] = str(Path(opts['profile_dir'] or default_profile_dir(), f"worker-{index}"))
+    return opts
+
+def worker_file(path, index):
+    path = Path(path)
+    return str(path.with_name(f"{path.stem}-worker-{index}{path.suffix}"))
 
-async def check_and_install_packages(agent):
+def check_and_install_packages():
+    """
+    Install the chatbot's packages if needed, once before any worker starts.
+    """
     node_modules_path = Path(os.getcwd(), "extensions", "ai-chatbot", "node_modules")
     if not node_modules_path.exists():
         print("'node_modules' directory not found. Installing packages...")
         try:
-            await agent.functions["execute_code"].run({'language': "bash", "code": "cd {} && pnpm install".format(node_modules_path.parent)})
-
+            subprocess.run(["pnpm", "install"], cwd=node_modules_path.parent, check=True)
         except Exception as error:
             print("An error occurred during the installation:", error)
-            
+
 @click.command(name='serve', help='Chat with the Saiku agent in the browser')
 @click.option('-m', '--llm', default='openai', type=click.Choice(['openai', 'vertexai']), help='The language model to use. Possible values: openai, vertexai.')
-def command(llm):
+@click.option('--metrics-file', type=click.Path(dir_okay=False), help='Write latency metrics as JSON to this file on exit.')
+@click.option('--profile', is_flag=True, help='Profile CPU time and allocations of each turn.')
+@click.option('--profile-dir', type=click.Path(file_okay=False), help='Where to write the profiles, defaults to the saiku cache directory.')
+@click.option('--concurrency', default=4, type=int, help='How many chat requests are processed at once.')
+@click.option('--queue-size', default=64, type=int, help='How many chat requests may wait for a worker.')
+@click.option('--queue-policy', default='reject', type=click.Choice(['reject', 'shed']), help='When the queue is full, reject new requests or shed the oldest waiting one.')
+@click.option('--host', default='localhost', help='The address to listen on.')
+@click.option('--port', default=3000, type=int, help='The port to listen on.')
+@click.option('--workers', default=1, type=click.IntRange(min=1), help='How many processes serve the port, each with its own event loop.')
+@click.option('--session-store', type=click.Path(dir_okay=False), help='SQLite file sharing sessions between workers, defaults to the saiku cache directory when there are several workers.')
+@click.option('--code-timeout', type=float, help='Seconds of wall time each code execution may take.')
+@click.option('--code-cpu-time', type=float, help='Seconds of CPU time each code execution may use.')
+@click.option('--code-memory', type=int, help='Megabytes of memory each code execution may use.')
+@click.option('--action-timeout', type=float, help='Seconds a blocking or CPU-bound action may take.')
+def command(llm, metrics_file, profile, profile_dir, concurrency, queue_size, queue_policy, host, port, workers, session_store, code_timeout, code_cpu_time, code_memory, action_timeout):
     """Command to start the agent and chat in the browser."""
+    if workers > 1 and not session_store:
+        from saiku.server.store import default_store_path
+        session_store = str(default_store_path())
     opts = {
-        'llm': llm
+        'llm': llm,
+        # Nobody at the terminal answers for browser sessions, tool calls needing confirmation are denied
+        'interactive': False,
+        'server_workers': workers,
+        'request_workers': concurrency,
+        'request_queue_size': queue_size,
+        'request_queue_policy': queue_policy,
+        'profile': profile,
+        'profile_dir': profile_dir,
+        'session_store': session_store,
+        'host': host,
+        'port': port,
+        'code_timeout': code_timeout,
+        'code_cpu_time': code_cpu_time,
+        'code_memory_mb': code_memory,
+        'action_timeout': action_timeout
     }
-    asyncio.run(main(opts))
+    check_and_install_packages()
+    if workers == 1:
+        try:
+            asyncio.run(main(opts))
+        finally:
+            if metrics_file:
+                metrics.dump(metrics_file)
+        return
+
+    from saiku.server.workers import PreforkServer
+
+    def run_worker(sock, index):
+        # Metrics are kept per process, so each worker dumps its own file
+        try:
+            asyncio.run(main(worker_options(opts, index), sock=sock))
+        finally:
+            if metrics_file:
+                metrics.dump(worker_file(metrics_file, index))
+
+    PreforkServer(workers, host, port, run_worker).serve()
 
 if __name__ == "__main__":
     command()
\ No newline at end of file
@@ -55,7 +55,8 @@ export function useChat({
     messagesRef.current = [...messagesRef.current, message];
   }, []);
   useEffect(() => {
-    socketRef.current = io(socketUrl);
+    // Websocket only, as the server requires when several workers share its port
+    socketRef.current = io(socketUrl, { transports: ['websocket'] });
 
     socketRef.current.on('agent_response', (data: string) => {
       setIsLoading(false); // Set loading to false upon receiving a response
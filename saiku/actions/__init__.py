@@ -1,4 +1,4 @@
-from .execute_code_action import ExecuteCodeAction
-from .speech_to_text_action import SpeechToTextAction
+from .execute_code import ExecuteCodeAction
+from .speech_to_text import SpeechToTextAction
 
 __all__ = ["ExecuteCodeAction", "SpeechToTextAction"]
@@ -2,6 +2,9 @@ import os
 from pathlib import Path
 
 class ChatAction:
+    # Starts the websocket server, which binds a single port.
+    max_concurrency = 1
+
     def __init__(self, agent):
         self.dependencies = []
         self.agent = agent
@@ -12,10 +15,7 @@ class ChatAction:
     async def run(self, args):
         # Resolve the path to the HTML file
         filename = Path(__file__).parent.parent / 'islands/chat.html'
-        # Read the HTML content from the file
-        with open(filename, "r", encoding="utf8") as file:
-            html_content = file.read()
 
-        # Start the WebSocket server with the HTML content
-        response = await self.agent.functions['websocket_server'].run({'htmlContent': html_content})
+        # Start the WebSocket server, it loads and caches the HTML file
+        response = await self.agent.functions['websocket_server'].run({'htmlPath': str(filename)})
         return f"Chat Server started: {response}"
\ No newline at end of file
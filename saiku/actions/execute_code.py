@@ -1,127 +1,71 @@
-import os
-import subprocess
-import asyncio
-import tempfile
 from abc import ABC, abstractmethod
-import queue
-import threading
-import time
-import traceback
+from saiku.execution import ExecutionLimits, OutputCapture, PythonKernel, run_process
+from saiku.execution.capture import DEFAULT_MAX_BYTES, DEFAULT_MAX_TOKENS
+from saiku.execution.limits import usage_note
+from saiku.execution.shell import DEFAULT_POOL_SIZE, ShellPool
+from saiku.metrics import metrics
 
 class LanguageRunner(ABC):
     @abstractmethod
-    async def run_code(self, code: str):
+    async def run_code(self, code: str, on_line=None, capture=None, limits=None):
         pass
 
 class GeneralRunner(LanguageRunner):
-    async def run_code(self, command: str):
-        process = await asyncio.create_subprocess_shell(
-            command, 
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
-        if process.returncode == 0:
-            return f"Execution complete. {stdout.decode()}"
+    async def run_code(self, command: str, on_line=None, capture=None, limits=None):
+        result = await run_process(command, on_line=on_line, capture=capture, limits=limits)
+        if result.ok:
+            return f"Execution complete. {result.stdout}"
         else:
-            raise Exception(f"Exit with code: {process.returncode}\nError Output:\n{stderr.decode()}")
+            raise Exception(f"Exit with code: {result.returncode}\nError Output:\n{result.stderr}{usage_note(limits, result.limit, result.usage)}")
 
 class PythonRunner(LanguageRunner):
-    async def run_code(self, code: str):
-        # Create a temporary file
-        with tempfile.NamedTemporaryFile(mode='w+', suffix='.py', delete=False) as temp_file:
-            temp_file.write(code)
-            temp_file_path = temp_file.name
+    def __init__(self, max_calls=None, max_memory_mb=None, limits=None):
+        # One warm interpreter per agent, globals and imports carry over between calls
+        self.kernel = PythonKernel(max_calls=max_calls, max_memory_mb=max_memory_mb, limits=limits)
 
-        try:
-            # Execute the temporary file
-            process = await asyncio.create_subprocess_exec(
-                'python3', temp_file_path,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, stderr = await process.communicate()
+    async def run_code(self, code: str, on_line=None, capture=None, limits=None):
+        # The kernel applies the limits it was created with
+        result = await self.kernel.execute(code, on_line=on_line, capture=capture)
+        notes = usage_note(self.kernel.limits, result.limit, result.usage)
+        notes += "".join(f"\n{note}" for note in result.notes)
+
+        if not result.ok:
+            raise Exception(f"{result.error or ''}\nOutput:\n{result.output}{notes}")
 
-            if process.returncode != 0:
-                raise Exception(f"Script exited with code {process.returncode}\nError Output:\n{stderr.decode()}")
+        return f"Output:\n{result.output}{notes}"
 
-            return f"Output:\n{stdout.decode()}"
-        finally:
-            # Delete the temporary file
-            os.remove(temp_file_path)
+    async def close(self):
+        await self.kernel.close()
 
 
 class ShellRunner(LanguageRunner):
-    def __init__(self):
-        self.output_queue = queue.Queue()
-        self.done = threading.Event()
-
-    def start_process(self, cmd):
-        my_env = os.environ.copy()
-        my_env["PYTHONIOENCODING"] = "utf-8"
-        process = subprocess.Popen(
-            cmd,
-            shell=True,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=0,
-            universal_newlines=True,
-            env=my_env,
-        )
-        threading.Thread(
-            target=self.handle_stream_output,
-            args=(process.stdout, False),
-            daemon=True,
-        ).start()
-        threading.Thread(
-            target=self.handle_stream_output,
-            args=(process.stderr, True),
-            daemon=True,
-        ).start()
-        return process
-
-    async def run_code(self, code):
-        output_lines = []
-        try:
-            process = self.start_process(code)
-        except:
-            return traceback.format_exc()
-
-        while True:
-            try:
-                output = self.output_queue.get(timeout=0.3)  # Waits for 0.3 seconds
-                output_lines.append(output["output"])
-            except queue.Empty:
-                if self.done.is_set():
-                    break
-                time.sleep(0.1)
-
-        process.terminate()
-        return ''.join(output_lines)
-
-    def handle_stream_output(self, stream, is_error_stream):
-        for line in iter(stream.readline, ""):
-            self.output_queue.put({"output": line})
-            print(line, end="")
-        self.done.set()
+    def __init__(self, pool_size=None, limits=None):
+        # Long-lived shells, `cd` and exported variables carry over between calls
+        self.pool = ShellPool(pool_size or DEFAULT_POOL_SIZE, limits=limits)
+
+    async def run_code(self, code, on_line=None, capture=None, limits=None):
+        # stdout and stderr interleaved as they were printed, whatever the exit code
+        result = await self.pool.execute(code, on_line=on_line, capture=capture)
+        output = result.output
+        if result.returncode:
+            output += f"\nExit code: {result.returncode}"
+        output += usage_note(self.pool.primary.limits, result.limit, result.usage)
+        return output + "".join(f"\n{note}" for note in result.notes)
+
+    async def close(self):
+        await self.pool.close()
         
 class AppleScriptRunner(LanguageRunner):
-    async def run_code(self, code: str):
-        process = await asyncio.create_subprocess_shell(
-            f"osascript -e \"{code}\"", 
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
-        if process.returncode == 0:
-            return stdout.decode()
+    async def run_code(self, code: str, on_line=None, capture=None, limits=None):
+        result = await run_process(['osascript', '-e', code], shell=False, on_line=on_line, capture=capture, limits=limits)
+        if result.ok:
+            return result.stdout
         else:
-            raise Exception(f"Exit with code: {process.returncode}\nError Output:\n{stderr.decode()}")
+            raise Exception(f"Exit with code: {result.returncode}\nError Output:\n{result.stderr}{usage_note(limits, result.limit, result.usage)}")
 
 
 class ExecuteCodeAction:
+
     def __init__(self, agent):
         self.agent = agent
         self.dependencies = ["asyncio"]
@@ -140,15 +84,28 @@ class ExecuteCodeAction:
                 "required": True 
             }
         ]
+        # Wall time, CPU time, memory and open files allowed to each execution
+        self.limits = ExecutionLimits.from_options(agent.options)
+        shell = ShellRunner(agent.options.get('shell_pool_size'), limits=self.limits)
         self.runner_mapping = {
-            "python": PythonRunner(),
-            "shell": ShellRunner(),
-            "bash": ShellRunner(),
+            "python": PythonRunner(
+                max_calls=agent.options.get('python_kernel_max_calls'),
+                max_memory_mb=agent.options.get('python_kernel_max_memory_mb'),
+                limits=self.limits
+            ),
+            "shell": shell,
+            "bash": shell,
             "applescript": AppleScriptRunner(),
             "AppleScript": AppleScriptRunner(),
             # Other mappings as required
         }
 
+    async def close(self):
+        for runner in set(self.runner_mapping.values()):
+            close = getattr(runner, 'close', None)
+            if close is not None:
+                await close()
+
     async def run(self, args):
         language = args.get("language")
         code = args.get("code")
@@ -160,8 +117,21 @@ class ExecuteCodeAction:
         if not isinstance(runner, LanguageRunner):
             raise ValueError(f"Invalid runner for language: {language}")
 
+        # Only the head and tail of a long output go to the model, the rest to a spill file
+        capture = OutputCapture(
+            max_bytes=self.agent.options.get('code_output_max_bytes', DEFAULT_MAX_BYTES),
+            max_tokens=self.agent.options.get('code_output_max_tokens', DEFAULT_MAX_TOKENS),
+            count_tokens=self.agent.context.counter.count_text
+        )
+
+        async def on_line(line, stream):
+            print(line, end="")
+            # Listeners, e.g. websocket clients, get the output up to the byte budget
+            if not capture.truncated:
+                await self.agent.emit("code_output", {"language": language, "stream": stream, "line": line})
         try:
-            output = await runner.run_code(code)
+            with metrics.span("run_code", language=language):
+                output = await runner.run_code(code, on_line=on_line, capture=capture, limits=self.limits)
             return f"output is: {output}"
         except Exception as e:
             error_info = {"message": str(e)}
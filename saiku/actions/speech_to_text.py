@@ -1,11 +1,18 @@
 import os
 import queue
+import sys
+import numpy as np
 import openai
 import sounddevice as sd
 import wavio
+from saiku.interfaces.action import Action
 
 
-class SpeechToTextAction:
+class SpeechToTextAction(Action):
+    # There is a single microphone.
+    max_concurrency = 1
+    # Recording waits on the keyboard, the transcription call is synchronous
+    execution = 'blocking'
     dependencies = ["openai", "sounddevice", "wavio"]
 
     def __init__(self, agent):
@@ -15,35 +22,43 @@ class SpeechToTextAction:
         self.parameters = [{"name": "audioFilename", "type": "string", "required": False}]
         self.audioFilename = 'recording.wav'
 
-    async def init(self):
+    def init(self):
         # Initialize any other setup tasks if necessary
         pass
 
-    async def run(self, args):
+    def execute(self, args):
         audioFilename = args.get("audioFilename")
-        await self.init()
-        audioFilename = audioFilename or self.audioFilename
+        self.init()
         if not audioFilename:
-            await self.record_audio(audioFilename)
-        transcription = await self.transcribe_audio(audioFilename)
+            # No file to transcribe, record one from the microphone
+            audioFilename = self.audioFilename
+            self.record_audio(audioFilename)
+        transcription = self.transcribe_audio(audioFilename)
         print('Transcription:', transcription)
         return transcription
 
-    async def record_audio(self, filename):
+    def record_audio(self, filename):
+        q = queue.Queue()
+
         def callback(indata, frames, time, status):
             if status:
                 print(status, file=sys.stderr)
             q.put(indata.copy())
 
-        with sd.InputStream(samplerate=16000, channels=1, callback=callback):
+        # 16-bit samples, as written to the file
+        with sd.InputStream(samplerate=16000, channels=1, dtype='int16', callback=callback):
             print("Recording... Press ENTER to stop.")
-            await input()  # Waits for ENTER key press
+            input()  # Waits for ENTER key press
             print("Finished recording")
 
-        q = queue.Queue()
-        wavio.write(filename, q.get(), 16000, sampwidth=2)
+        blocks = []
+        while not q.empty():
+            blocks.append(q.get())
+        if not blocks:
+            raise RuntimeError("No audio was recorded")
+        wavio.write(filename, np.concatenate(blocks), 16000, sampwidth=2)
 
-    async def transcribe_audio(self, filename):
+    def transcribe_audio(self, filename):
         
         with open(filename, 'rb') as audio_file:
             
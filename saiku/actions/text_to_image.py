@@ -2,8 +2,12 @@ import os
 import requests
 from openai import OpenAI
 from pathlib import Path
+from saiku.interfaces.action import Action
+
+class TextToImageAction(Action):
+    # The OpenAI client and the download are synchronous
+    execution = 'blocking'
 
-class TextToImageAction:
     def __init__(self, agent):
         self.agent = agent
         self.name = 'text_to_image'
@@ -16,10 +20,11 @@ class TextToImageAction:
         }]
         dependencies = ['openai', 'requests', 'pathlib']
 
-    async def run(self, description):
+    def execute(self, args):
+        description = args['description']
         openai = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 
-        response = await openai.images.generate(
+        response = openai.images.generate(
             model="dall-e-3",
             prompt=description,
             n=1,
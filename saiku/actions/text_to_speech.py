@@ -1,8 +1,14 @@
 import os
 import subprocess
 import openai
+from saiku.interfaces.action import Action
+
+class TextToSpeechAction(Action):
+    # Audio output would overlap.
+    max_concurrency = 1
+    # `say`, `play` and the speech call block until done
+    execution = 'blocking'
 
-class TextToSpeechAction:
     def __init__(self, agent):
         self.agent = agent
         self.name = 'text_to_speech'
@@ -23,7 +29,7 @@ class TextToSpeechAction:
             }
         ]
 
-    async def run(self, args):
+    def execute(self, args):
         text = args.get('text')
         play= args.get('play', True)
         if os.name == 'posix' and os.uname().sysname == 'Darwin':
@@ -6,8 +6,12 @@ import youtube_dl
 import openai
 from pathlib import Path
 from typing import List
+from saiku.interfaces.action import Action
+
+class VisionAction(Action):
+    # Downloads, frame decoding and the OpenAI call all block
+    execution = 'blocking'
 
-class VisionAction:
     def __init__(self, agent):
         self.agent = agent
         self.name = 'openai_vision'
@@ -19,7 +23,7 @@ class VisionAction:
              'description': 'The user request to be sent to OpenAI Vision.'}
         ]
 
-    async def run(self, args: dict) -> str:
+    def execute(self, args: dict) -> str:
         source = args['source']
         openai_request = args['request']
         is_url = source.startswith('http://') or source.startswith('https://')
@@ -33,7 +37,7 @@ class VisionAction:
             self.extract_frames(file_path, frames_path)
             base64_frames = self.encode_frames_to_base64(frames_path)
 
-        return await self.analyze_media(base64_frames, openai_request)
+        return self.analyze_media(base64_frames, openai_request)
 
     def download_media(self, url: str) -> str:
         if 'youtube.com' in url or 'youtu.be' in url:
@@ -71,7 +75,7 @@ class VisionAction:
         return [self.encode_image_to_base64(f'{output_path}/{f}')
                 for f in os.listdir(output_path) if f.endswith('.jpg')]
 
-    async def analyze_media(self, base64_frames: List[str], openai_request: str) -> str:
+    def analyze_media(self, base64_frames: List[str], openai_request: str) -> str:
         
 
         prompt_messages = [
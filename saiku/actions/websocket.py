@@ -1,9 +1,32 @@
 import asyncio
 import json
+import time
 from aiohttp import web
 import socketio
+from saiku.metrics import metrics
+from saiku.utils import message_to_dict
+from saiku.server.scheduler import DEFAULT_QUEUE_SIZE, DEFAULT_WORKERS, RequestScheduler, SchedulerBusy
+from saiku.server.sessions import DEFAULT_IDLE_TIMEOUT, DEFAULT_MAX_SESSIONS, SessionLimitReached, SessionPool
+from saiku.server.static import StaticAsset, assets
+from saiku.server.store import SessionStore
+
+# Roles clients may add to a session's history, assistant and tool messages come from the agent.
+CLIENT_ROLES = ('user', 'system')
+# Prefix of the pool keys of client chosen session ids, keeping them apart from the legacy per-sid sessions.
+CLIENT_SESSION_PREFIX = 'client:'
+# Socket.io events streamed to the client for each agent event.
+STREAM_EVENTS = {
+    'content': 'agent_delta',
+    'tool_started': 'agent_tool_started',
+    'tool_finished': 'agent_tool_finished',
+    'code_output': 'agent_code_output',
+    'done': 'agent_done'
+}
 
 class WebsocketAction:
+    # The server binds a single port.
+    max_concurrency = 1
+
     def __init__(self, agent):
         self.agent = agent
         self.name = "websocket_server"
@@ -17,28 +40,189 @@ class WebsocketAction:
                 "default": "<html><body><h1>Default HTML Content</h1></body></html>"
             }
         ]
+        self.page = None
         self.app = web.Application()
-        self.sio = socketio.AsyncServer(cors_allowed_origins='*')
+        # With several worker processes sharing the port, websocket only: a client's
+        # socket.io session lives on a single connection, so it stays on one worker
+        transports = ['websocket'] if (agent.options.get('server_workers') or 1) > 1 else ['polling', 'websocket']
+        self.sio = socketio.AsyncServer(cors_allowed_origins='*', transports=transports)
         self.sio.attach(self.app)
+        # Each connected client chats with its own agent, spawned from this one
+        store_path = agent.options.get('session_store')
+        self.sessions = SessionPool(
+            agent,
+            max_sessions=agent.options.get('max_sessions', DEFAULT_MAX_SESSIONS),
+            idle_timeout=agent.options.get('session_idle_timeout', DEFAULT_IDLE_TIMEOUT),
+            store=SessionStore(store_path) if store_path else None
+        )
+        # Bounds how many interactions, and so model calls and subprocesses, run at once
+        self.scheduler = RequestScheduler(
+            workers=agent.options.get('request_workers') or DEFAULT_WORKERS,
+            queue_size=agent.options.get('request_queue_size') or DEFAULT_QUEUE_SIZE,
+            policy=agent.options.get('request_queue_policy') or 'reject'
+        )
+
+    async def close(self):
+        """
+        Stop the request workers and close every session.
+        """
+        await self.scheduler.stop()
+        await self.sessions.stop()
 
     async def emit_response(self, sid, result):
         await self.sio.emit('agent_response', result, to=sid)
 
-    async def async_agent_interact(self, data):
-        data_dict = json.loads(data)
-        self.agent.messages = data_dict  # Update the agent's state with the parsed data    
-        return await self.agent.interact(True)
+    async def schedule(self, sid, run):
+        """
+        Run a request through the scheduler, telling the client its queue position
+        while it waits and emitting `agent_busy` if it is refused, or if it needs
+        a new session while every session is busy.
+        Returns None when the request was refused.
+        """
+        async def notify(position, depth):
+            await self.sio.emit('agent_queued', {'position': position, 'queue_depth': depth}, to=sid)
+
+        try:
+            return await self.scheduler.submit(run, key=sid, notify=notify)
+        except SchedulerBusy as busy:
+            await self.sio.emit('agent_busy', {'reason': busy.reason, 'queue_depth': busy.queue_depth}, to=sid)
+            return None
+        except SessionLimitReached:
+            await self.sio.emit('agent_busy', {'reason': 'max_sessions', 'queue_depth': self.scheduler.depth}, to=sid)
+            return None
+
+    async def async_agent_interact(self, sid, data):
+        session = await self.sessions.get(sid)
+        async with session.lock:
+            session.agent.messages = json.loads(data)  # Update the session's state with the parsed data
+            result = await session.agent.interact(True)
+            session.touch()
+            return result
+
+    async def agent_message(self, sid, data):
+        """
+        Apply a client's new messages to its session and return the messages the agent added.
+
+        `data` holds the `session_id`, the message `seq` number, starting at 1,
+        and the new `messages`. A repeated `seq` gets the same reply again, so
+        clients can safely resend after a reconnect. Unless `stream` is false,
+        the turn is streamed to the client as it happens, see `stream_events`.
+        """
+        session_id = data.get('session_id')
+        seq = data.get('seq')
+        messages = data.get('messages') or []
+        if not isinstance(session_id, str) or not session_id:
+            return {'session_id': session_id, 'seq': seq, 'error': 'invalid_session_id'}
+        session = await self.sessions.get(CLIENT_SESSION_PREFIX + session_id)
+        async with session.lock:
+            if seq == session.seq and session.last_reply is not None:
+                return session.last_reply
+            if seq != session.seq + 1:
+                return {'session_id': session_id, 'seq': seq, 'error': 'out_of_sequence', 'expected': session.seq + 1}
+            if any(not isinstance(message, dict) or message.get('role') not in CLIENT_ROLES for message in messages):
+                return {'session_id': session_id, 'seq': seq, 'error': 'invalid_role'}
+
+            history = session.agent.messages
+            previous = len(history)
+            history.extend(messages)
+            start = len(history)
+            stream = data.get('stream', True)
+            session.agent.options['stream'] = stream
+            listener = self.stream_events(sid, session_id, seq) if stream else None
+            if listener:
+                session.agent.add_listener(listener)
+            try:
+                await session.agent.interact(True)
+            except BaseException:
+                # The turn did not happen, a retry of the same seq must not add the messages twice
+                del history[previous:]
+                raise
+            finally:
+                if listener:
+                    session.agent.remove_listener(listener)
+                    await listener('done', {})
+            session.seq = seq
+            session.last_reply = {
+                'session_id': session_id,
+                'seq': seq,
+                'messages': [message_to_dict(message) for message in history[start:]],
+                'history_length': len(history)
+            }
+            session.touch()
+            self.sessions.save(session)
+            return session.last_reply
+
+    def stream_events(self, sid, session_id, seq):
+        """
+        Return an agent listener forwarding a turn to a client as it happens:
+        `agent_delta` with each content delta, `agent_tool_started` and
+        `agent_tool_finished` with the tool call timings, `agent_code_output`
+        with each line printed by executed code, then `agent_done`
+        with the turn's duration and time to the first content delta.
+        """
+        start = time.perf_counter()
+        first_delta = None
+
+        async def listener(event, data):
+            nonlocal first_delta
+            if event not in STREAM_EVENTS:
+                return
+            elapsed = round(time.perf_counter() - start, 4)
+            if event == 'content' and first_delta is None:
+                first_delta = elapsed
+            payload = {'session_id': session_id, 'seq': seq, 'elapsed': elapsed, **data}
+            if event == 'done':
+                payload.update(duration=elapsed, time_to_first_delta=first_delta)
+            await self.sio.emit(STREAM_EVENTS[event], payload, to=sid)
+
+        return listener
+
+    def agent_history(self, data):
+        """
+        Return the messages of a session from index `since`, for clients resyncing after a reconnect.
+        A `since` that is not a non-negative integer gets an `invalid_since` error.
+        """
+        session_id = data.get('session_id')
+        session = self.sessions.find(CLIENT_SESSION_PREFIX + session_id) if isinstance(session_id, str) and session_id else None
+        if session is None:
+            # Unknown or evicted, the client has to start a new session
+            return {'session_id': session_id, 'known': False, 'seq': 0, 'messages': [], 'history_length': 0}
+        since = data.get('since') or 0
+        if not isinstance(since, int) or isinstance(since, bool) or since < 0:
+            return {'session_id': session_id, 'error': 'invalid_since'}
+        history = session.agent.messages
+        return {
+            'session_id': session_id,
+            'known': True,
+            'seq': session.seq,
+            'since': since,
+            'messages': [message_to_dict(message) for message in history[since:]],
+            'history_length': len(history)
+        }
 
     async def index(self, request):
-        html_content = self.parameters[0]["default"]  # Default HTML content
-        return web.Response(text=html_content, content_type='text/html')
+        if self.page is None:
+            self.page = StaticAsset(content=self.parameters[0]["default"])  # Default HTML content
+        return self.page.response(request)
+
+    async def serve_metrics(self, request):
+        """
+        Serve the agent's metrics, in the Prometheus text format or as JSON with `?format=json`.
+        """
+        if request.query.get('format') == 'json':
+            return web.json_response(metrics.snapshot())
+        return web.Response(text=metrics.prometheus(), content_type='text/plain', charset='utf-8')
 
     async def run(self, args):
-        # Update HTML content if provided in args
-        if "htmlContent" in args:
+        # Update HTML content if provided in args, a file is cached and reloaded when it changes
+        if args.get("htmlPath"):
+            self.page = assets.get(args["htmlPath"])
+        elif "htmlContent" in args:
             self.parameters[0]["default"] = args["htmlContent"]
+            self.page = None
 
         self.app.router.add_get('/', self.index)
+        self.app.router.add_get('/metrics', self.serve_metrics)
 
         @self.sio.event
         async def connect(sid, environ):
@@ -47,18 +231,45 @@ class WebsocketAction:
         @self.sio.event
         async def disconnect(sid):
             print("A user disconnected", sid)
+            self.scheduler.cancel(sid)
+            await self.sessions.release(sid)
+
+        @self.sio.event
+        async def agent_message(sid, data):
+            data = json.loads(data) if isinstance(data, str) else data
+            with metrics.span("websocket_request"):
+                reply = await self.schedule(sid, lambda: self.agent_message(sid, data))
+                if reply is not None:
+                    await self.sio.emit('agent_error' if 'error' in reply else 'agent_messages', reply, to=sid)
+
+        @self.sio.event
+        async def agent_resync(sid, data):
+            data = json.loads(data) if isinstance(data, str) else data
+            history = self.agent_history(data)
+            await self.sio.emit('agent_error' if 'error' in history else 'agent_history', history, to=sid)
 
+        # Legacy protocol, every request carries the whole conversation
         @self.sio.event
         async def agent_request(sid, data):
             print("Agent request received", data)
-            result = await self.async_agent_interact(data)
-            await self.emit_response(sid, result)
+            with metrics.span("websocket_request"):
+                result = await self.schedule(sid, lambda: self.async_agent_interact(sid, data))
+                if result is not None:
+                    await self.emit_response(sid, result)
 
+        self.sessions.start()
+        self.scheduler.start()
+        host = args.get("host", "localhost")
+        port = args.get("port", 3000)
         runner = web.AppRunner(self.app)
         await runner.setup()
-        site = web.TCPSite(runner, 'localhost', 3000)
+        if args.get("sock") is not None:
+            # A listening socket shared with other worker processes
+            site = web.SockSite(runner, args["sock"])
+        else:
+            site = web.TCPSite(runner, host, port)
         await site.start()
-        print("Websocket server started at http://localhost:3000")
+        print(f"Websocket server started at http://{host}:{port}")
         while True:
             await asyncio.sleep(3600)  # Keeps the server running
         server_url = "Websocket server started at http://localhost:3000"
@@ -1,17 +1,21 @@
-from datetime import datetime
+import asyncio
+import copy
 import os
 import json
 import importlib.util
 import pathlib
 import platform
 import sys
-from markdown import markdown
-import psutil
-from rich.console import Console
-from rich.markdown import Markdown
 from dotenv import load_dotenv
-from ..llms import OpenAIModel
-import pygame
+from ..metrics import metrics
+from ..utils import ENVIRONMENT_MESSAGE_NAME, SAMPLE_MESSAGE_NAME
+from .context import ContextWindow, PrefixTracker
+from .executor import ActionExecutor
+from .registry import ActionRegistry
+from .sense import EnvironmentSampler
+# The model client, rich and pygame are imported on first use, they dominate startup time.
+
+DEFAULT_SYSTEM_MESSAGE = 'You are a helpful assistant'
 
 class AttrDict(dict):
     def __init__(self, **entries):
@@ -37,7 +41,7 @@ class Agent:
     def __init__(self, options):
         load_dotenv()
         self.options = {**self.default_options(), **options}
-        self.system_message = self.options.get('system_message', 'You are a helpful assistant')
+        self.system_message = self.options.get('system_message') or DEFAULT_SYSTEM_MESSAGE
         self.score = 100
         self.messages = []
         self.memory = AttrDict(last_action=None, last_action_status=None)
@@ -46,24 +50,128 @@ class Agent:
         self.current_messages = []
         self.services = {}
         self.functions = {}
+        self.action_semaphores = {}
+        self.listeners = []
+        self.parent = None
+        self._console = None
+        self.sampler = EnvironmentSampler(self.options.get('sense_interval', 5))
+        # Blocking and CPU-bound actions run on pools shared by every session
+        self.executor = ActionExecutor(
+            threads=self.options.get('action_threads'),
+            processes=self.options.get('action_processes'),
+            timeout=self.options.get('action_timeout')
+        )
         self.init(self.options)
+        self.context = ContextWindow(
+            max_tokens=self.options.get('context_max_tokens', 16000),
+            reserve_tokens=self.options.get('context_reserve_tokens', 1024),
+            model=getattr(self.model, "name", None)
+        )
+        self.prefix = PrefixTracker(self.context.counter)
+        self.profiler = None
+        if self.options.get('profile'):
+            from ..profiling import TurnProfiler
+            self.profiler = TurnProfiler(self.options.get('profile_dir'))
         self.load_all_functions(self.options['actions_path'])
         self.actions = self.get_functions_definitions()
 
+    def spawn(self):
+        """
+        Return an agent for a new session. It shares the options, the
+        environment sampler, the action executor, the console and the
+        scanned actions with this agent, but has its own messages, memory, action instances, model
+        conversation and context window.
+        """
+        agent = copy.copy(self)
+        agent.parent = self
+        agent.options = dict(self.options)
+        agent.messages = []
+        agent.memory = AttrDict(last_action=None, last_action_status=None)
+        agent.objectives = []
+        agent.current_objective = None
+        agent.current_messages = []
+        agent.services = {}
+        agent.action_semaphores = {}
+        agent.listeners = []
+        agent.model = self.model.fork(agent)
+        agent.context = ContextWindow(
+            max_tokens=self.context.max_tokens,
+            reserve_tokens=self.context.reserve_tokens,
+            counter=self.context.counter
+        )
+        agent.prefix = PrefixTracker(agent.context.counter)
+        agent.functions = self.functions.fork(agent)
+        return agent
+
+    async def close(self):
+        """
+        Release the agent's action instances, and the background sampler and
+        the action executor if it owns them.
+        """
+        for action in list(self.functions.instances.values()):
+            close = getattr(action, 'close', None)
+            if close is None:
+                continue
+            try:
+                result = close()
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as error:
+                print(f"Error while closing {getattr(action, 'name', action)}: {error}")
+        if self.parent is None:
+            await self.sampler.stop()
+            self.executor.shutdown()
+
+    def add_listener(self, listener):
+        """
+        Register a coroutine function called with `(event, data)` as the agent works:
+        `content` with each content delta, `tool_started` and `tool_finished` around each tool call.
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    async def emit(self, event, data):
+        """
+        Call the listeners with an event. A failing listener does not interrupt the agent.
+        """
+        for listener in list(self.listeners):
+            try:
+                await listener(event, data)
+            except Exception as error:
+                print(f"Error in {event} listener: {error}")
+
     def default_options(self):
         return {
             'actions_path': "../actions",
-            'llm': "OpenAI"
+            'llm': "OpenAI",
+            'stream': False
         }
 
+    @property
+    def console(self):
+        """
+        The terminal console, created on first use.
+        """
+        if self._console is None:
+            from rich.console import Console
+            self._console = Console()
+        return self._console
+
+    @console.setter
+    def console(self, console):
+        self._console = console
+
     def init(self, options):
+        from ..llms import OpenAIModel
+
         self.options = options
         llm = self.options.get('llm')
         
         if llm == 'openai':
-            self.model = OpenAIModel(self, {
-                'apiKey': os.environ.get('OPENAI_API_KEY')
-            })
+            self.model = OpenAIModel(self, self.llm_options())
         # elif llm == 'vertexai':
         #     self.model = GoogleVertexAI(self, {
         #         'projectId': os.environ.get('GOOGLE_PROJECT_ID'),
@@ -83,9 +191,25 @@ class Agent:
         # elif llm == 'socket':
         #     self.model = SocketAdapterModel(self, self.options)
         else:
-            self.model = OpenAIModel(self, {
-                'apiKey': os.environ.get('OPENAI_API_KEY')
-            })
+            self.model = OpenAIModel(self, self.llm_options())
+
+    def llm_options(self):
+        """
+        Build the model options, including the connection pool and timeout settings.
+        """
+        return {
+            'apiKey': os.environ.get('OPENAI_API_KEY'),
+            'timeout': self.options.get('llm_timeout'),
+            'maxConnections': self.options.get('llm_max_connections'),
+            'maxKeepaliveConnections': self.options.get('llm_max_keepalive_connections'),
+            'keepaliveExpiry': self.options.get('llm_keepalive_expiry'),
+            'cache': self.options.get('llm_cache'),
+            'cacheMaxBytes': self.options.get('llm_cache_max_bytes'),
+            'cacheTTL': self.options.get('llm_cache_ttl'),
+            'transport': self.options.get('llm_transport'),
+            'cassette': self.options.get('llm_cassette'),
+            'replayLatency': self.options.get('llm_replay_latency')
+        }
 
     async def listen(self):
         """
@@ -101,45 +225,83 @@ class Agent:
             print("speech_to_text function is not defined")
             return ""
 
+    async def prepare_prediction(self, use_function_calls=True):
+        """
+        Build the parameters of the model's predict method from the messages.
+        """
+        # Static content comes first and stays byte-identical across turns so
+        # provider-side prompt caching can reuse it, volatile facts go last.
+        with metrics.span("sense"):
+            facts = await self.sense()
+        stable_fields = self.sampler.stable_fields()
+        stable_facts = {key: value for key, value in facts.items() if key in stable_fields}
+        volatile_facts = {key: value for key, value in facts.items() if key not in stable_fields}
+
+        # Prepare the system message
+        system_message = {
+            "role": "system",
+            "content": self.system_message or DEFAULT_SYSTEM_MESSAGE
+        }
+        # Named so request fingerprints can keep the stable facts and leave out the sample
+        stable_environment_message = {
+            "role": "system",
+            "name": ENVIRONMENT_MESSAGE_NAME,
+            "content": json.dumps(stable_facts, sort_keys=True)
+        }
+        environment_message = {
+            "role": "system",
+            "name": SAMPLE_MESSAGE_NAME,
+            "content": json.dumps(volatile_facts, sort_keys=True)
+        }
+
+        # Update the list of messages
+        messages = [system_message, stable_environment_message] + self.messages
+        self.current_messages = messages
+
+        # Retrieve the last message from a user
+        user_message = next(
+            (message for message in reversed(self.current_messages) 
+            if isinstance(message, dict) and message.get('role') == 'user'), None
+        )
+        user_message_content = user_message['content'] if user_message else None
+
+        tools = self.actions if use_function_calls else None
+
+        # Keep the system message and the most recent messages that fit the token budget
+        limited_messages = self.context.fit(self.current_messages, tools, trailing=[environment_message])
+        prefix = self.prefix.update(limited_messages, tools)
+        metrics.increment("prompt_tokens", self.context.stats["last_tokens"])
+        metrics.set_gauge("prompt_prefix_ratio", prefix["ratio"])
+
+        # Prepare parameters for the model's predict method
+        predict_params = {
+            "prompt": user_message_content,
+            "messages": limited_messages,
+            "model": getattr(self.model, "name", None)
+        }
+
+        # Responses are only cached when sampled at temperature 0
+        temperature = self.options.get('llm_temperature')
+        if temperature is not None:
+            predict_params["temperature"] = temperature
+
+        if use_function_calls:
+            predict_params.update({"tools": tools, "tool_choice": "auto"})
+
+        return predict_params
+
     async def think(self, use_function_calls=True):
         """
         Asynchronously process messages and make a decision using the model.
         """
         try:
-            # Prepare the system message
-            system_message = {
-                "role": "system",
-                "content": f"{self.system_message}\n{json.dumps(await self.sense())}"
-            }
+            with metrics.span("think"):
+                with metrics.span("prompt"):
+                    predict_params = await self.prepare_prediction(use_function_calls)
 
-            # Update the list of messages
-            messages = [system_message] + self.messages
-            self.current_messages = messages
-
-            # Retrieve the last message from a user
-            user_message = next(
-                (message for message in reversed(self.current_messages) 
-                if isinstance(message, dict) and message.get('role') == 'user'), None
-            )
-            # user_message = next((message for message in reversed(self.current_messages) if message['role'] == 'user'), None)
-            user_message_content = user_message['content'] if user_message else None
-
-            # Limit the number of messages to the last 10, if necessary
-            limited_messages = self.current_messages[-10:] if len(self.current_messages) > 10 else self.current_messages
-
-            # Prepare parameters for the model's predict method
-            predict_params = {
-                "prompt": user_message_content,
-                "messages": limited_messages,
-                "model": getattr(self.model, "name", None)
-            }
-
-            if use_function_calls:
-                predict_params.update({"tools": self.actions, "tool_choice": "auto"})
-
-            # Make a decision using the model
-            decision = self.model.predict(predict_params)
-            return decision
+                # Make a decision using the model
+                decision = await self.model.predict(predict_params)
+                return decision
 
         except Exception as error:
             exc_type, exc_obj, exc_tb = sys.exc_info()
@@ -147,6 +309,15 @@ class Agent:
             print(exc_type, fname, exc_tb.tb_lineno)
             return str(error)
 
+    async def think_stream(self, use_function_calls=True):
+        """
+        Like `think`, but yield the model's content deltas and tool calls as they arrive.
+        """
+        with metrics.span("prompt"):
+            predict_params = await self.prepare_prediction(use_function_calls)
+        async for event in self.model.predict_stream(predict_params):
+            yield event
+
     async def speak(self, text, use_local=False):
         """
         Asynchronously convert text to speech and play it.
@@ -160,9 +331,11 @@ class Agent:
                 ],
                 'model': os.environ.get('OPENAI_MODEL', 'gpt-4-1106-preview'),
                 'max_tokens': 64,
-                'temperature': 0.8
+                'temperature': 0.8,
+                # Any rewrite of the same text will do, reuse it when caching is enabled
+                'cache': True
             })
-            text = response.get('text', text)
+            text = getattr(response, 'text', None) or text
 
         if platform.system() == 'Darwin':
             # On macOS, use `say` command for speech synthesis
@@ -172,6 +345,7 @@ class Agent:
             filename = await self.functions["text_to_speech"].run({'text': text})
             # Play the audio file
             # Initialize pygame mixer
+            import pygame
             pygame.mixer.init()
             pygame.mixer.music.load(filename)
             pygame.mixer.music.play()
@@ -184,32 +358,31 @@ class Agent:
         """
         Display a message in the terminal, rendering Markdown content.
         """
-        console = Console()
-        md = Markdown(message)
-        console.print(md)
+        from rich.markdown import Markdown
+
+        with metrics.span("render"):
+            md = Markdown(message)
+            self.console.print(md)
+
+    def stream_display(self):
+        """
+        Return a display that renders Markdown incrementally as content is streamed.
+        """
+        from .display import MarkdownStream
+
+        return MarkdownStream(self.console)
 
     def load_all_functions(self, actions_path):
         """
-        Load all action modules from the specified directory.
+        Register all action modules from the specified directory.
+        Modules are imported lazily, the first time an action is used.
         """
         actions_dir = pathlib.Path(__file__).parent.resolve() / actions_path
-        for file_path in actions_dir.glob('*.py'):
-            if file_path.name == "__init__.py":
-                continue
-
-            module_name = file_path.stem
-            spec = importlib.util.spec_from_file_location(module_name, file_path)
-            module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(module)
-            action_class_name = ''.join(word.title() for word in module_name.split('_')) + 'Action'
-            action_class = getattr(module, action_class_name, None)
-            if action_class:
-                action_instance = action_class(self)
-                self.functions[action_instance.name] = action_instance
+        self.functions = ActionRegistry(self, actions_dir)
 
     def load_functions(self, actions_path):
         """
-        Load specific action modules from the specified directory based on the .saiku configuration.
+        Register specific action modules from the specified directory based on the .saiku configuration.
         """
         actions_dir = pathlib.Path(__file__).parent.resolve() / actions_path
 
@@ -223,24 +396,7 @@ class Agent:
                 saiku = json.load(file)
                 activated_actions.extend(saiku.get('activatedActions', []))
 
-        # Iterate through each Python file in the directory
-        for file_path in actions_dir.glob('*.py'):
-            if file_path.name == "__init__.py":
-                continue
-
-            # Dynamically import the module
-            module_name = file_path.stem  # Extracts module name without '.py'
-            spec = importlib.util.spec_from_file_location(module_name, file_path)
-            module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(module)
-
-            # Instantiate the action class if it's in the list of activated actions
-            action_class_name = ''.join(word.title() for word in module_name.split('_')) + 'Action'
-            action_class = getattr(module, action_class_name, None)
-            if action_class:
-                action_instance = action_class(self)
-                if action_instance.name in activated_actions:
-                    self.functions[action_instance.name] = action_instance
+        self.functions = ActionRegistry(self, actions_dir, only=activated_actions)
 
     def get_all_functions(self):
         """
@@ -270,47 +426,18 @@ class Agent:
 
     async def sense(self):
         """
-        Gather and return various system and environment information.
-        """
-        # System and environment information
-        system_info = {
-            "agent": {
-                "name": "Saiku"
-            },
-            "os": platform.system(),
-            "arch": platform.machine(),
-            "version": platform.version(),
-            "memory": {
-                "total": psutil.virtual_memory().total,
-                "used": psutil.virtual_memory().used
-            },
-            "cpu": {
-                "percent": psutil.cpu_percent(interval=1)
-            },
-            "uptime": psutil.boot_time(),
-            "date": datetime.now().strftime("%Y-%m-%d"),
-            "start_time": datetime.now().strftime("%H:%M:%S"),
-            "cwd": os.getcwd(),
-            "current_user": {
-                "name": os.environ.get("ME"),
-                "country": os.environ.get("COUNTRY"),
-                "city": os.environ.get("CITY"),
-                "company": os.environ.get("COMPANY"),
-                "phone": os.environ.get("PHONE")
-            },
-            "api_services": {
-                "weather": os.environ.get("WEATHER_API_KEY"),
-                "gitlab": {
-                    "version": os.environ.get("GITLAB_VERSION"),
-                    "username": os.environ.get("GITLAB_USERNAME"),
-                    "api_version": os.environ.get("GITLAB_API_VERSION")
-                }
-            },
+        Return the cached system and environment information.
+        The snapshot is refreshed by a background sampler, see `EnvironmentSampler`.
+        """
+        system_info = self.sampler.snapshot()
+        self.sampler.start()
+
+        return {
+            **system_info,
+            "sense_age": self.sampler.ages(),
             **self.memory
         }
 
-        return system_info
-
     async def act(self, action_name, args):
         """
         Execute a specified action and handle success or failure.
@@ -321,7 +448,7 @@ class Agent:
 
             if action:
                 try:
-                    output = await action.run(args)
+                    output = await self.run_action(action_name, action, args)
                     self.update_memory({
                         "": action_name,
                         "last_action_status": "success",
@@ -341,6 +468,31 @@ class Agent:
         except Exception as error:
             return json.dumps({"error": str(error)})
 
+    async def run_action(self, action_name, action, args):
+        """
+        Run an action, honouring the `max_concurrency` limit declared on its class.
+        """
+        limit = getattr(action, 'max_concurrency', None)
+        if not limit:
+            with metrics.span("act", action=action_name):
+                return await self.call_action(action, args)
+
+        semaphore = self.action_semaphores.get(action_name)
+        if semaphore is None:
+            semaphore = self.action_semaphores[action_name] = asyncio.Semaphore(limit)
+        async with semaphore:
+            # Time spent waiting for the semaphore is not part of the action's latency
+            with metrics.span("act", action=action_name):
+                return await self.call_action(action, args)
+
+    async def call_action(self, action, args):
+        """
+        Await an async-native action, hand a blocking or CPU-bound one to the executor.
+        """
+        if self.executor.mode(action) == 'async':
+            return await action.run(args)
+        return await self.executor.run(action, args)
+
     def evaluate_performance(self):
         """
         Evaluate the agent's performance based on its objectives.
@@ -391,7 +543,10 @@ class Agent:
         """
         Interact with the agent's model.
         """
-        return await self.model.interact(delegate)
+        if self.profiler is None:
+            return await self.model.interact(delegate)
+        with self.profiler.turn():
+            return await self.model.interact(delegate)
 
     def get_functions_definitions(self):
         """
@@ -399,13 +554,7 @@ class Agent:
         """
         actions_definitions = []
 
-        for action in self.functions.values():
-            action_def = {
-                "name": getattr(action, "name", "Unnamed"),
-                "description": getattr(action, "description", ""),
-                "parameters": getattr(action, "parameters", [])
-            }
-
+        for action_def in self.functions.definitions():
             function_def = {
                 "type": "function",
                 "function": {
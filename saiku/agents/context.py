@@ -0,0 +1,253 @@
+import json
+from collections import OrderedDict, deque
+
+from ..utils import message_to_dict
+
+try:
+    import tiktoken
+except ImportError:  # Token counts fall back to a characters-per-token estimate.
+    tiktoken = None
+
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class TokenCounter:
+    def __init__(self, model=None, cache_size=4096):
+        """
+        Count tokens per message, caching the counts of messages already seen.
+        """
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model or "gpt-4")
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+
+    def encode(self, text):
+        """
+        Return the tokens of a text, or fixed-size character chunks without tiktoken.
+        """
+        if self.encoding is not None:
+            return self.encoding.encode(text, disallowed_special=())
+        return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+    def decode(self, tokens):
+        if self.encoding is not None:
+            return self.encoding.decode(tokens)
+        return "".join(tokens)
+
+    def count_text(self, text):
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+    def count(self, message):
+        """
+        Return the number of tokens a message costs in a request.
+        """
+        content = message.get("content")
+        if content is not None and not isinstance(content, str):
+            content = json.dumps(content)
+        tool_calls = message.get("tool_calls")
+        if tool_calls:
+            tool_calls = json.dumps(tool_calls, sort_keys=True)
+
+        # Strings cache their hash, so repeated lookups of the same message are cheap.
+        key = (message.get("role"), message.get("name"), content, tool_calls)
+        count = self.cache.get(key)
+        if count is not None:
+            self.cache.move_to_end(key)
+            return count
+
+        count = MESSAGE_OVERHEAD_TOKENS
+        for text in (message.get("role"), message.get("name"), content, tool_calls):
+            if text:
+                count += self.count_text(text)
+
+        self.cache[key] = count
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return count
+
+
+class ContextWindow:
+    def __init__(self, max_tokens=16000, reserve_tokens=1024, model=None, history_size=100, counter=None):
+        """
+        Select the messages sent to the model so they fit in a token budget.
+
+        Leading system messages are always kept. The rest of the history is
+        split into groups that must stay together, an assistant message with
+        `tool_calls` and its `tool` replies, and groups are kept from the newest
+        back. The first group that does not fit is compressed, older ones are dropped.
+        A `counter` can be shared between windows, its cache only holds token counts.
+        """
+        self.max_tokens = max_tokens
+        self.reserve_tokens = reserve_tokens
+        self.counter = counter or TokenCounter(model)
+        self.tools_tokens = (None, 0)
+        self.history = deque(maxlen=history_size)
+        self.stats = {
+            "turns": 0,
+            "total_tokens": 0,
+            "last_tokens": 0,
+            "dropped_messages": 0,
+            "compressed_messages": 0
+        }
+
+    def count_tools(self, tools):
+        if not tools:
+            return 0
+        tools_key, count = self.tools_tokens
+        if tools_key != id(tools):
+            count = self.counter.count_text(json.dumps(tools))
+            self.tools_tokens = (id(tools), count)
+        return count
+
+    def fit(self, messages, tools=None, trailing=None):
+        """
+        Return the messages to send, within the token budget.
+        `trailing` messages are always appended after the history.
+        """
+        messages = [message_to_dict(message) for message in messages if message is not None]
+        trailing = trailing or []
+
+        pinned = []
+        while len(pinned) < len(messages) and messages[len(pinned)].get("role") == "system":
+            pinned.append(messages[len(pinned)])
+
+        tools_tokens = self.count_tools(tools)
+        used = tools_tokens + sum(self.counter.count(message) for message in pinned + trailing)
+        budget = self.max_tokens - self.reserve_tokens - used
+
+        kept = []
+        compressed = 0
+        groups = self.groups(messages[len(pinned):])
+        while groups:
+            group = groups[-1]
+            cost = sum(self.counter.count(message) for message in group)
+            if cost > budget:
+                # The newest group is always sent, older ones only if they fit once compressed.
+                if kept and budget <= MESSAGE_OVERHEAD_TOKENS * len(group):
+                    break
+                group, group_compressed = self.compress(group, max(budget, 0))
+                cost = sum(self.counter.count(message) for message in group)
+                if kept and cost > budget:
+                    break
+                compressed += group_compressed
+            groups.pop()
+            kept[:0] = group
+            budget -= cost
+        dropped = sum(len(group) for group in groups)
+
+        selected = pinned + kept + trailing
+        tokens = self.max_tokens - self.reserve_tokens - budget
+        self.record(tokens, tools_tokens, len(selected), dropped, compressed)
+        return selected
+
+    def groups(self, messages):
+        """
+        Split messages into groups of an assistant tool call and its replies.
+        Tool replies without their assistant message are left out.
+        """
+        groups = []
+        for message in messages:
+            if message.get("role") == "tool":
+                if groups and groups[-1][0].get("tool_calls"):
+                    groups[-1].append(message)
+                continue
+            groups.append([message])
+        return groups
+
+    def compress(self, group, budget):
+        """
+        Shorten the largest contents of a group, keeping their head and tail, to fit a budget.
+        Contents are measured with the same counter as `fit`.
+        """
+        overhead = sum(self.counter.count({**message, "content": ""}) for message in group)
+        sizes = [self.counter.count_text(message.get("content") or "") if isinstance(message.get("content"), str) else 0 for message in group]
+        total = sum(sizes)
+        if not total:
+            return group, 0
+
+        allowed = max(budget - overhead, 0)
+        compressed = []
+        count = 0
+        for message, size in zip(group, sizes):
+            limit = allowed * size // total
+            if size > limit:
+                message = {**message, "content": truncate(message["content"], limit, self.counter)}
+                count += 1
+            compressed.append(message)
+        return compressed, count
+
+    def record(self, tokens, tools_tokens, messages, dropped, compressed):
+        self.stats["turns"] += 1
+        self.stats["total_tokens"] += tokens
+        self.stats["last_tokens"] = tokens
+        self.stats["dropped_messages"] += dropped
+        self.stats["compressed_messages"] += compressed
+        self.history.append({
+            "tokens": tokens,
+            "tools_tokens": tools_tokens,
+            "messages": messages,
+            "dropped": dropped,
+            "compressed": compressed
+        })
+
+
+class PrefixTracker:
+    def __init__(self, counter):
+        """
+        Measure how much of a request's leading content is identical to the previous one.
+        Provider-side prompt caching only applies to a byte-identical prefix.
+        """
+        self.counter = counter
+        self.previous = None
+        self.stats = {"matched_tokens": 0, "total_tokens": 0, "ratio": 0.0}
+
+    def update(self, messages, tools=None):
+        """
+        Compare a request with the previous one and return the prefix stats.
+        """
+        # Tools are rendered ahead of the messages by the provider.
+        prompt = json.dumps(tools or []) + json.dumps(messages)
+        matched = common_prefix_length(self.previous, prompt) if self.previous is not None else 0
+        total_tokens = self.counter.count_text(prompt)
+        matched_tokens = self.counter.count_text(prompt[:matched]) if matched else 0
+        self.previous = prompt
+        self.stats = {
+            "matched_tokens": matched_tokens,
+            "total_tokens": total_tokens,
+            "ratio": round(matched_tokens / total_tokens, 3) if total_tokens else 0.0
+        }
+        return self.stats
+
+
+def common_prefix_length(a, b):
+    """
+    Return the length of the common prefix of two strings, comparing slices by bisection.
+    """
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def truncate(text, limit, counter):
+    """
+    Keep the head and tail of a text within a number of tokens.
+    """
+    tokens = counter.encode(text)
+    if len(tokens) <= limit:
+        return text
+    marker = f"\n[... {len(tokens) - limit} tokens omitted ...]\n"
+    head = max(limit - counter.count_text(marker), 0) // 2
+    tail = max(limit - counter.count_text(marker) - head, 0)
+    return counter.decode(tokens[:head]) + marker + (counter.decode(tokens[-tail:]) if tail else "")
@@ -0,0 +1,43 @@
+import time
+
+from rich.live import Live
+from rich.markdown import Markdown
+
+
+class MarkdownStream:
+    def __init__(self, console, refresh_interval=0.1):
+        """
+        Render streamed Markdown in place, re-parsing at most every `refresh_interval` seconds.
+        """
+        self.console = console
+        self.refresh_interval = refresh_interval
+        self.chunks = []
+        self.live = None
+        self.rendered_at = 0
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+    def update(self, delta):
+        """
+        Append a content delta and refresh the display if it is due.
+        """
+        self.chunks.append(delta)
+        if self.live is None:
+            self.live = Live(console=self.console, auto_refresh=False, vertical_overflow="visible")
+            self.live.start()
+
+        now = time.monotonic()
+        if now - self.rendered_at >= self.refresh_interval:
+            self.live.update(Markdown(self.text), refresh=True)
+            self.rendered_at = now
+
+    def close(self):
+        """
+        Render the complete text and release the terminal.
+        """
+        if self.live is not None:
+            self.live.update(Markdown(self.text), refresh=True)
+            self.live.stop()
+            self.live = None
@@ -0,0 +1,101 @@
+import asyncio
+import importlib.util
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from ..metrics import metrics
+
+DEFAULT_THREADS = 8
+MODES = ('async', 'blocking', 'cpu')
+
+# Action modules imported by a process pool worker, by path
+worker_modules = {}
+
+
+class ActionTimeout(Exception):
+    pass
+
+
+def run_in_worker(path, qualname, args):
+    """
+    Call the static `execute` of an action class in a process pool worker,
+    importing its module by path since action modules are not importable by name.
+    """
+    module = worker_modules.get(path)
+    if module is None:
+        name = os.path.splitext(os.path.basename(path))[0]
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        worker_modules[path] = module
+    target = module
+    for part in qualname.split('.'):
+        target = getattr(target, part)
+    return target(args)
+
+
+class ActionExecutor:
+    def __init__(self, threads=None, processes=None, timeout=None):
+        """
+        Run the synchronous `execute` of actions off the event loop: blocking
+        actions on a bounded thread pool, CPU-bound ones on a process pool.
+        Both pools are created on first use and shared by every session of
+        an agent. `timeout` is the default, in seconds, for actions that do
+        not declare their own.
+        """
+        self.threads = threads or DEFAULT_THREADS
+        self.processes = processes or os.cpu_count() or 1
+        self.timeout = timeout
+        self.thread_pool = None
+        self.process_pool = None
+
+    def mode(self, action):
+        mode = getattr(action, 'execution', 'async')
+        if mode not in MODES:
+            raise ValueError(f"Unknown execution mode for {getattr(action, 'name', action)}: {mode}")
+        return mode
+
+    async def run(self, action, args):
+        """
+        Run a blocking or CPU-bound action and return its result.
+
+        Past the timeout, or when the caller is cancelled, the result is
+        dropped and ActionTimeout or CancelledError raised. A thread cannot be
+        stopped, so it keeps its pool slot until `execute` returns, and a pool
+        process until its call does.
+        """
+        loop = asyncio.get_running_loop()
+        mode = self.mode(action)
+        if mode == 'blocking':
+            if self.thread_pool is None:
+                self.thread_pool = ThreadPoolExecutor(self.threads, thread_name_prefix='saiku-action')
+            future = loop.run_in_executor(self.thread_pool, action.execute, args)
+        elif mode == 'cpu':
+            if self.process_pool is None:
+                # Spawned rather than forked, the parent has running threads
+                self.process_pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'))
+            execute = type(action).execute
+            future = loop.run_in_executor(
+                self.process_pool, run_in_worker, execute.__code__.co_filename, execute.__qualname__, args
+            )
+        else:
+            raise ValueError(f"{getattr(action, 'name', action)} is async-native, await its run method instead")
+
+        metrics.increment(f"executor_{mode}_calls")
+        timeout = getattr(action, 'timeout', None) or self.timeout
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            metrics.increment("executor_timeouts")
+            raise ActionTimeout(f"{getattr(action, 'name', 'The action')} did not finish within {timeout} seconds")
+
+    def shutdown(self):
+        """
+        Stop the pools without waiting for running actions, queued ones are cancelled.
+        """
+        for pool in (self.thread_pool, self.process_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self.thread_pool = None
+        self.process_pool = None
@@ -0,0 +1,270 @@
+import ast
+import copy
+import hashlib
+import importlib.util
+import json
+import os
+import pathlib
+from collections.abc import MutableMapping
+
+from ..utils import cache_dir
+
+MANIFEST_VERSION = 1
+
+
+def action_class_name(module_name):
+    """
+    Return the action class name expected in a module, e.g. execute_code -> ExecuteCodeAction.
+    """
+    return ''.join(word.title() for word in module_name.split('_')) + 'Action'
+
+
+def default_manifest_path(actions_dir):
+    """
+    Return the manifest cache file used for an actions directory.
+    """
+    digest = hashlib.sha1(str(actions_dir).encode('utf-8')).hexdigest()[:12]
+    return cache_dir() / f"actions-{digest}.json"
+
+
+class ActionRegistry(MutableMapping):
+    """
+    A mapping of action name to action instance that imports action modules lazily.
+
+    Tool definitions are served from a cached manifest of each action's name,
+    description and parameters. A module is only imported, and its action
+    instantiated, the first time the action is looked up.
+    """
+
+    def __init__(self, agent, actions_dir, only=None, manifest_path=None):
+        self.agent = agent
+        self.actions_dir = pathlib.Path(actions_dir).resolve()
+        self.only = only
+        self.manifest_path = pathlib.Path(manifest_path) if manifest_path else default_manifest_path(self.actions_dir)
+        self.entries = {}
+        self.instances = {}
+        self.modules = {}
+        self.scan()
+
+    def scan(self):
+        """
+        Build the action entries from the manifest, re-reading only changed files.
+        """
+        manifest = self._read_manifest()
+        files = {}
+        changed = False
+
+        for file_path in sorted(self.actions_dir.glob('*.py')):
+            if file_path.name == "__init__.py":
+                continue
+
+            stat = file_path.stat()
+            cached = manifest.get(file_path.name)
+            if cached and cached['mtime'] == stat.st_mtime_ns and cached['size'] == stat.st_size:
+                record = cached
+            else:
+                digest = hashlib.sha256(file_path.read_bytes()).hexdigest()
+                if cached and cached['hash'] == digest:
+                    record = {**cached, 'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+                else:
+                    record = {
+                        'mtime': stat.st_mtime_ns,
+                        'size': stat.st_size,
+                        'hash': digest,
+                        'actions': self._describe(file_path)
+                    }
+                changed = True
+            files[file_path.name] = record
+
+            for action in record['actions']:
+                if self.only is not None and action['name'] not in self.only:
+                    continue
+                self.entries[action['name']] = {**action, 'path': str(file_path)}
+
+        if changed or files.keys() != manifest.keys():
+            self._write_manifest(files)
+
+    def definitions(self):
+        """
+        Return the name, description and parameters of every registered action.
+        """
+        definitions = [
+            {key: entry[key] for key in ('name', 'description', 'parameters')}
+            for entry in self.entries.values()
+        ]
+        for name, action in self.instances.items():
+            if name not in self.entries:
+                definitions.append({
+                    "name": getattr(action, "name", "Unnamed"),
+                    "description": getattr(action, "description", ""),
+                    "parameters": getattr(action, "parameters", [])
+                })
+        return definitions
+
+    def load(self, name):
+        """
+        Import the module of an action and instantiate it.
+        """
+        entry = self.entries[name]
+        path = pathlib.Path(entry['path'])
+        module = self.modules.get(path.stem)
+        if module is None:
+            module = self._import(path)
+        action_class = getattr(module, entry['class_name'])
+        action_instance = action_class(self.agent)
+        self.instances[name] = action_instance
+        return action_instance
+
+    def load_all(self):
+        """
+        Instantiate every registered action, as the eager loader used to.
+        """
+        for name in list(self.entries):
+            if name not in self.instances:
+                self.load(name)
+        return dict(self.instances)
+
+    def fork(self, agent):
+        """
+        Return a registry for another agent, sharing the scanned entries and
+        imported modules but instantiating its own actions.
+        """
+        registry = copy.copy(self)
+        registry.agent = agent
+        registry.entries = dict(self.entries)
+        registry.instances = {}
+        return registry
+
+    def __getitem__(self, name):
+        if name in self.instances:
+            return self.instances[name]
+        if name in self.entries:
+            return self.load(name)
+        raise KeyError(name)
+
+    def __setitem__(self, name, action):
+        self.instances[name] = action
+
+    def __delitem__(self, name):
+        found = name in self.entries or name in self.instances
+        self.entries.pop(name, None)
+        self.instances.pop(name, None)
+        if not found:
+            raise KeyError(name)
+
+    def __contains__(self, name):
+        return name in self.entries or name in self.instances
+
+    def __iter__(self):
+        yield from self.entries
+        for name in self.instances:
+            if name not in self.entries:
+                yield name
+
+    def __len__(self):
+        return len(self.entries.keys() | self.instances.keys())
+
+    def _import(self, path):
+        spec = importlib.util.spec_from_file_location(path.stem, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        self.modules[path.stem] = module
+        return module
+
+    def _describe(self, file_path):
+        """
+        Extract the action definitions of a module, statically when possible.
+        """
+        class_name = action_class_name(file_path.stem)
+        try:
+            tree = ast.parse(file_path.read_text(encoding='utf-8'))
+            for node in tree.body:
+                if isinstance(node, ast.ClassDef) and node.name == class_name:
+                    return [{'class_name': class_name, **_static_attributes(node)}]
+            return []
+        except (SyntaxError, ValueError, KeyError):
+            pass
+
+        # The attributes are computed at runtime, fall back to importing the module.
+        module = self._import(file_path)
+        action_class = getattr(module, class_name, None)
+        if action_class is None:
+            return []
+        action_instance = action_class(self.agent)
+        if self.only is None or action_instance.name in self.only:
+            self.instances[action_instance.name] = action_instance
+        return [{
+            'class_name': class_name,
+            'name': action_instance.name,
+            'description': getattr(action_instance, 'description', ''),
+            'parameters': getattr(action_instance, 'parameters', [])
+        }]
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get('version') != MANIFEST_VERSION:
+            return {}
+        return manifest.get('files', {})
+
+    def _write_manifest(self, files):
+        try:
+            self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.manifest_path.with_suffix('.tmp')
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump({'version': MANIFEST_VERSION, 'files': files}, file)
+            os.replace(temp_path, self.manifest_path)
+        except OSError as error:
+            print(f"Unable to write the actions manifest: {error}")
+
+
+def _static_attributes(class_node):
+    """
+    Evaluate the literal name, description and parameters assigned in __init__.
+    """
+    attributes = {}
+    dynamic = set()
+    for node in class_node.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            try:
+                attributes[node.targets[0].id] = _literal(node.value, attributes)
+            except ValueError:
+                pass
+        if isinstance(node, ast.FunctionDef) and node.name == '__init__':
+            for statement in node.body:
+                if not (isinstance(statement, ast.Assign) and len(statement.targets) == 1):
+                    continue
+                target = statement.targets[0]
+                if isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name) and target.value.id == 'self':
+                    try:
+                        attributes[target.attr] = _literal(statement.value, attributes)
+                        dynamic.discard(target.attr)
+                    except ValueError:
+                        attributes.pop(target.attr, None)
+                        dynamic.add(target.attr)
+
+    if dynamic & {'name', 'description', 'parameters'}:
+        raise ValueError(f"Computed action attributes: {', '.join(sorted(dynamic))}")
+
+    return {
+        'name': attributes['name'],
+        'description': attributes.get('description', ''),
+        'parameters': attributes.get('parameters', [])
+    }
+
+
+def _literal(node, attributes):
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == 'self':
+        if node.attr in attributes:
+            return attributes[node.attr]
+        raise ValueError(f"Unknown attribute: {node.attr}")
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_literal(element, attributes) for element in node.elts]
+    if isinstance(node, ast.Dict):
+        if None in node.keys:
+            raise ValueError("Dict unpacking is not a literal")
+        return {_literal(key, attributes): _literal(value, attributes) for key, value in zip(node.keys, node.values)}
+    return ast.literal_eval(node)
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import platform
+import time
+from datetime import datetime
+
+
+class SenseField:
+    def __init__(self, name, collect, ttl=None, volatile=False):
+        """
+        A single environment fact. A ttl of None means the value never expires.
+        Volatile facts may change from one turn, or one run, to the next, and
+        are sent after the history, out of request fingerprints.
+        """
+        self.name = name
+        self.collect = collect
+        self.ttl = ttl
+        self.volatile = volatile
+
+
+def default_fields():
+    """
+    The system and environment facts reported by the agent.
+    """
+    return [
+        SenseField("agent", lambda: {"name": "Saiku"}),
+        SenseField("os", platform.system),
+        SenseField("arch", platform.machine),
+        SenseField("version", platform.version),
+        SenseField("memory", lambda: _memory(), ttl=5, volatile=True),
+        SenseField("cpu", lambda: _cpu(), ttl=5, volatile=True),
+        SenseField("uptime", lambda: _boot_time(), volatile=True),
+        SenseField("date", lambda: datetime.now().strftime("%Y-%m-%d"), ttl=1, volatile=True),
+        SenseField("start_time", lambda: datetime.now().strftime("%H:%M:%S"), ttl=1, volatile=True),
+        SenseField("cwd", os.getcwd, ttl=1, volatile=True),
+        SenseField("current_user", lambda: {
+            "name": os.environ.get("ME"),
+            "country": os.environ.get("COUNTRY"),
+            "city": os.environ.get("CITY"),
+            "company": os.environ.get("COMPANY"),
+            "phone": os.environ.get("PHONE")
+        }, ttl=60),
+        SenseField("api_services", lambda: {
+            "weather": os.environ.get("WEATHER_API_KEY"),
+            "gitlab": {
+                "version": os.environ.get("GITLAB_VERSION"),
+                "username": os.environ.get("GITLAB_USERNAME"),
+                "api_version": os.environ.get("GITLAB_API_VERSION")
+            }
+        }, ttl=60),
+    ]
+
+
+# psutil is imported when a field is collected, not when the agent loads
+def _memory():
+    import psutil
+    memory = psutil.virtual_memory()
+    return {
+        "total": memory.total,
+        "used": memory.used
+    }
+
+
+def _cpu():
+    import psutil
+    return {"percent": psutil.cpu_percent(interval=None)}
+
+
+def _boot_time():
+    import psutil
+    return psutil.boot_time()
+
+
+class EnvironmentSampler:
+    def __init__(self, interval=5.0, fields=None):
+        """
+        Keep a cached snapshot of environment facts, refreshed in the background.
+        """
+        self.interval = interval
+        self.fields = {field.name: field for field in (fields or default_fields())}
+        self.values = {}
+        self.sampled_at = {}
+        self.task = None
+        # cpu_percent(interval=None) compares against the previous call, prime it once.
+        if "cpu" in self.fields:
+            _cpu()
+
+    def refresh(self, force=False):
+        """
+        Re-collect every field whose TTL has expired.
+
+        Runs in an executor thread while `snapshot` and `ages` read on the
+        loop, so new dicts are built and swapped in, never mutated in place.
+        """
+        now = time.monotonic()
+        values = dict(self.values)
+        sampled = dict(self.sampled_at)
+        for name, field in self.fields.items():
+            sampled_at = sampled.get(name)
+            expired = sampled_at is None or (field.ttl is not None and now - sampled_at >= field.ttl)
+            if not (force or expired):
+                continue
+            try:
+                values[name] = field.collect()
+            except Exception as error:
+                print(f"Error while sensing {name}: {error}")
+                values.setdefault(name, None)
+            sampled[name] = now
+        self.values, self.sampled_at = values, sampled
+
+    def snapshot(self):
+        """
+        Return the cached facts without blocking.
+        """
+        if not self.values:
+            self.refresh()
+        return dict(self.values)
+
+    def stable_fields(self):
+        """
+        Return the names of the fields that are not volatile.
+        """
+        return [name for name, field in self.fields.items() if not field.volatile]
+
+    def ages(self):
+        """
+        Return how old each cached field is, in seconds.
+        """
+        now = time.monotonic()
+        return {name: round(now - sampled_at, 1) for name, sampled_at in self.sampled_at.items()}
+
+    def start(self):
+        """
+        Start the background sampler on the running event loop.
+        """
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._run())
+        return self.task
+
+    async def stop(self):
+        """
+        Stop the background sampler.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Collectors may touch /proc or the filesystem, keep them off the loop.
+            await loop.run_in_executor(None, self.refresh)
+            await asyncio.sleep(self.interval)
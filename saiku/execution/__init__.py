@@ -0,0 +1,10 @@
+from .capture import OutputCapture
+from .kernel import KernelResult, PythonKernel
+from .limits import ExecutionLimits, ResourceMonitor
+from .process import ProcessResult, run_process
+from .shell import ShellPool, ShellSession
+
+__all__ = [
+    "ExecutionLimits", "KernelResult", "OutputCapture", "ProcessResult", "PythonKernel", "ResourceMonitor",
+    "ShellPool", "ShellSession", "run_process"
+]
@@ -0,0 +1,203 @@
+import os
+import tempfile
+import time
+from collections import deque
+
+from ..utils import cache_dir
+
+DEFAULT_MAX_BYTES = 16 * 1024
+DEFAULT_MAX_TOKENS = 4000
+# Share of the budget kept from the start of the output, the rest is kept from its end.
+HEAD_FRACTION = 0.5
+# Spill files older than this, in seconds, are deleted when a new one is created.
+SPILL_MAX_AGE = 24 * 3600
+CHARS_PER_TOKEN = 4
+
+pruned = set()
+
+
+def default_spill_dir():
+    return cache_dir() / "outputs"
+
+
+def prune_spills(directory, max_age=SPILL_MAX_AGE):
+    """
+    Delete the spill files left by earlier runs, once per directory and process.
+    """
+    if directory in pruned:
+        return
+    pruned.add(directory)
+    limit = time.time() - max_age
+    for entry in os.scandir(directory):
+        try:
+            if entry.name.startswith("output-") and entry.stat().st_mtime < limit:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def byte_prefix(text, size):
+    return text.encode('utf-8')[:size].decode('utf-8', errors='ignore')
+
+
+def byte_suffix(text, size):
+    data = text.encode('utf-8')
+    return data[len(data) - size:].decode('utf-8', errors='ignore') if size > 0 else ''
+
+
+def line_prefix(text):
+    """
+    Drop a partial last line, unless that would drop most of the text.
+    """
+    end = text.rfind('\n') + 1
+    return text[:end] if end > len(text) // 2 else text
+
+
+class OutputCapture:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, max_tokens=DEFAULT_MAX_TOKENS, count_tokens=None, spill=True, spill_dir=None, head_fraction=HEAD_FRACTION):
+        """
+        Collect the output of executed code within a budget of `max_bytes`
+        and `max_tokens`, counted with `count_tokens(text)`.
+
+        Output within the budget is kept as is. Past it, only the head and
+        the tail are kept in memory, and with `spill` the whole output is
+        written to a file whose path and size are given in `text()`. Either
+        budget may be None for no limit.
+        """
+        self.max_bytes = max_bytes
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens or estimate_tokens
+        self.spill = spill
+        self.spill_dir = spill_dir
+        self.head_fraction = head_fraction
+        self.buffer = []
+        self.total_bytes = 0
+        self.truncated = False
+        self.head = ''
+        self.tail = deque()
+        self.tail_bytes = 0
+        self.spill_file = None
+        self.spill_path = None
+        self.closed = False
+
+    def derive(self):
+        """
+        Return a capture with the same budget that does not spill, e.g. for stdout and stderr alone.
+        """
+        return OutputCapture(self.max_bytes, self.max_tokens, self.count_tokens, spill=False, head_fraction=self.head_fraction)
+
+    @property
+    def head_budget(self):
+        return int(self.max_bytes * self.head_fraction)
+
+    @property
+    def tail_budget(self):
+        return self.max_bytes - self.head_budget
+
+    def append(self, text):
+        size = len(text.encode('utf-8'))
+        self.total_bytes += size
+        if not self.truncated:
+            self.buffer.append(text)
+            if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+                self.truncate(''.join(self.buffer))
+            return
+        if self.spill_file is not None:
+            self.spill_file.write(text)
+        self.tail.append(text)
+        self.tail_bytes += size
+        self.trim_tail(self.tail_budget)
+
+    def truncate(self, text):
+        """
+        Switch from keeping everything to keeping the head and tail of `text`, the output so far.
+        """
+        self.truncated = True
+        self.buffer = []
+        if self.spill:
+            self.open_spill(text)
+        head_budget = self.head_budget if self.max_bytes is not None else len(text.encode('utf-8')) // 2
+        self.head = line_prefix(byte_prefix(text, head_budget))
+        rest = text[len(self.head):]
+        self.tail = deque([rest])
+        self.tail_bytes = len(rest.encode('utf-8'))
+        self.trim_tail(self.max_bytes - head_budget if self.max_bytes is not None else self.tail_bytes)
+
+    def trim_tail(self, budget):
+        while self.tail_bytes > budget and self.tail:
+            first = self.tail[0]
+            size = len(first.encode('utf-8'))
+            if self.tail_bytes - size >= budget:
+                self.tail.popleft()
+                self.tail_bytes -= size
+            else:
+                # Keep the end of a line larger than what is left of the budget
+                kept = byte_suffix(first, budget - (self.tail_bytes - size))
+                self.tail[0] = kept
+                self.tail_bytes += len(kept.encode('utf-8')) - size
+
+    def open_spill(self, text):
+        directory = str(self.spill_dir or default_spill_dir())
+        try:
+            os.makedirs(directory, exist_ok=True)
+            prune_spills(directory)
+            self.spill_file = tempfile.NamedTemporaryFile(
+                'w', encoding='utf-8', dir=directory, prefix='output-', suffix='.log', delete=False
+            )
+        except OSError as error:
+            print(f"Could not create a spill file for the output: {error}")
+            return
+        self.spill_path = self.spill_file.name
+        self.spill_file.write(text)
+
+    def close(self):
+        """
+        Apply the token budget and finish the spill file.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if self.max_tokens is not None:
+            self.fit_tokens()
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+
+    def fit_tokens(self):
+        text = self.text(close=False)
+        for _ in range(8):
+            tokens = self.count_tokens(text)
+            if tokens <= self.max_tokens:
+                return
+            if not self.truncated:
+                self.truncate(text)
+            kept = len(self.head.encode('utf-8')) + self.tail_bytes
+            # Shrink the kept bytes in proportion to the excess tokens, with some margin
+            budget = int(kept * self.max_tokens / tokens * 0.9)
+            head_budget = int(budget * self.head_fraction)
+            self.head = line_prefix(byte_prefix(self.head, head_budget))
+            self.trim_tail(budget - head_budget)
+            text = self.text(close=False)
+
+    @property
+    def omitted_bytes(self):
+        if not self.truncated:
+            return 0
+        return self.total_bytes - len(self.head.encode('utf-8')) - self.tail_bytes
+
+    def text(self, close=True):
+        """
+        Return the captured output, with a note on what was left out when it was truncated.
+        """
+        if close:
+            self.close()
+        if not self.truncated:
+            return ''.join(self.buffer)
+        note = f"{self.omitted_bytes} of {self.total_bytes} bytes omitted"
+        if self.spill_path:
+            note += f", the full output is in {self.spill_path}"
+        return f"{self.head}\n... [{note}] ...\n{''.join(self.tail)}"
@@ -0,0 +1,290 @@
+import asyncio
+import json
+import os
+import secrets
+import signal
+import time
+
+from .limits import ResourceMonitor
+from .process import KILL_GRACE, StreamedCall, emit_line, kill_group, pump_lines, terminate
+
+WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kernel_worker.py')
+
+
+class KernelResult:
+    def __init__(self, stdout, stderr, output, error, duration, timed_out=False, notes=None, rss_mb=None, limit=None, usage=None):
+        """
+        The outcome of `PythonKernel.execute`. `error` is the traceback of an
+        uncaught exception, `notes` tell about restarts that dropped the
+        kernel's state, `limit` names the `ExecutionLimits` limit that
+        stopped the call and `usage` is what the call used.
+        """
+        self.stdout = stdout
+        self.stderr = stderr
+        self.output = output
+        self.error = error
+        self.duration = duration
+        self.timed_out = timed_out
+        self.notes = notes or []
+        self.rss_mb = rss_mb
+        self.limit = limit
+        self.usage = usage or {}
+
+    @property
+    def ok(self):
+        return self.error is None and not self.timed_out and not self.limit
+
+    def __repr__(self):
+        return f"KernelResult(ok={self.ok}, timed_out={self.timed_out}, duration={self.duration:.3f})"
+
+
+class PythonKernel:
+    def __init__(self, python='python3', max_calls=None, max_memory_mb=None, cwd=None, env=None, interrupt_grace=KILL_GRACE, limits=None):
+        """
+        A long-lived Python worker process running snippets in one namespace,
+        so imports, data and variables carry over between calls.
+
+        The worker starts with the first call. It is restarted after
+        `max_calls` calls, or once its resident memory passes
+        `max_memory_mb`, and when it dies. Every restart is reported in the
+        `notes` of the call's result since it drops the namespace.
+
+        With `ExecutionLimits`, the worker gets the memory and open file
+        rlimits, and a call is interrupted when it runs past the wall time or
+        its sampled CPU time or memory pass the limits.
+        """
+        self.python = python
+        self.max_calls = max_calls
+        self.max_memory_mb = max_memory_mb
+        self.cwd = cwd
+        self.env = env
+        self.interrupt_grace = interrupt_grace
+        self.limits = limits
+        self.process = None
+        self.commands = None
+        self.results = None
+        self.tasks = []
+        self.current = None
+        self.next_id = 0
+        self.started = False
+        self.rss_mb = None
+        # Created on first use, on the loop that runs the calls
+        self.lock = None
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self):
+        if self.alive:
+            return
+        await self.close()
+        self.token = f"__saiku_kernel_{secrets.token_hex(8)}__"
+        command_read, self.commands = os.pipe()
+        result_read, result_write = os.pipe()
+        env = {**os.environ, "PYTHONIOENCODING": "utf-8", **(self.env or {})}
+        try:
+            # CPU time is counted per call by the monitor, rlimits would count the worker's lifetime
+            argv = [self.python, '-u', WORKER, str(command_read), str(result_write), self.token]
+            if self.limits is not None:
+                argv = self.limits.wrap(argv, cpu=False)
+            self.process = await asyncio.create_subprocess_exec(
+                *argv,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                pass_fds=(command_read, result_write),
+                start_new_session=hasattr(os, 'killpg'),
+                cwd=self.cwd,
+                env=env
+            )
+        except BaseException:
+            os.close(self.commands)
+            os.close(result_read)
+            self.commands = None
+            raise
+        finally:
+            os.close(command_read)
+            os.close(result_write)
+
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        self.results, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(result_read, 'rb', 0)
+        )
+        self.tasks = [
+            asyncio.ensure_future(self._pump(self.process.stdout, 'stdout')),
+            asyncio.ensure_future(self._pump(self.process.stderr, 'stderr')),
+            asyncio.ensure_future(self._read_results(reader)),
+            asyncio.ensure_future(self._watch(self.process))
+        ]
+        self.started = True
+
+    async def execute(self, code, on_line=None, timeout=None, capture=None):
+        """
+        Run a snippet and return a `KernelResult`, calls are run one at a time.
+
+        Output lines are passed to `on_line(line, "stdout" | "stderr")` as they
+        are printed. After `timeout` seconds the snippet is interrupted, which
+        keeps the namespace, and the worker is restarted if it does not stop.
+        Output is kept whole unless an `OutputCapture` with a budget is given.
+        """
+        if self.limits is not None and self.limits.wall_time:
+            timeout = min(timeout, self.limits.wall_time) if timeout else self.limits.wall_time
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            notes = []
+            if not self.alive:
+                if self.started:
+                    notes.append("The Python kernel had exited and was restarted, variables from earlier calls are gone.")
+                await self.start()
+
+            self.next_id += 1
+            call = self.current = StreamedCall(self.next_id, on_line, capture)
+            start = time.perf_counter()
+            monitor = ResourceMonitor(self.process.pid, self.limits, lambda name: self._stop(call)).start()
+            self._send({'id': call.id, 'code': code})
+            timed_out = False
+            try:
+                data = await asyncio.wait_for(self._finish(call), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                data = await self._interrupt(call, notes)
+            except BaseException:
+                await self._interrupt(call, notes)
+                raise
+            finally:
+                self.current = None
+                # Closes the spill file when the call fails or is cancelled
+                call.output.close()
+                usage = await monitor.stop()
+
+            limit = 'wall_time' if timed_out else monitor.hit
+            if limit is None and self.limits is not None:
+                limit = self.limits.limit_hit(None, (data.get('error') or '') + call.stderr.text(), usage)
+            if monitor.hit and not self.alive:
+                await self.start()
+                notes.append("The Python kernel did not stop at the limit and was restarted, variables from earlier calls are gone.")
+
+            self.rss_mb = data.get('rss_mb')
+            reason = None
+            if self.max_calls and data.get('calls', 0) >= self.max_calls:
+                reason = f"after {data['calls']} calls"
+            elif self.max_memory_mb and (self.rss_mb or 0) > self.max_memory_mb:
+                reason = f"at {self.rss_mb:.0f} MB of memory"
+            if reason and self.alive:
+                await self.close()
+                await self.start()
+                notes.append(f"The Python kernel was restarted {reason}, variables defined so far are gone.")
+
+            return KernelResult(
+                call.stdout.text(),
+                call.stderr.text(),
+                call.output.text(),
+                data.get('error'),
+                time.perf_counter() - start,
+                timed_out,
+                notes,
+                self.rss_mb,
+                limit,
+                usage
+            )
+
+    def interrupt(self):
+        """
+        Interrupt the running snippet with SIGINT, as Ctrl-C would.
+        """
+        if self.current is not None and self.alive:
+            kill_group(self.process, signal.SIGINT)
+
+    async def restart(self):
+        """
+        Replace the worker with a fresh one, a running call fails.
+        """
+        await self.close()
+        await self.start()
+
+    async def close(self):
+        process, self.process = self.process, None
+        if process is not None:
+            await terminate(process, self.interrupt_grace)
+        if self.commands is not None:
+            os.close(self.commands)
+            self.commands = None
+        if self.results is not None:
+            self.results.close()
+            self.results = None
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def _send(self, request):
+        data = (json.dumps(request) + '\n').encode('utf-8')
+        # The worker is waiting for a request, the write does not block for long
+        while data:
+            data = data[os.write(self.commands, data):]
+
+    async def _finish(self, call):
+        data = await asyncio.shield(call.result)
+        # The end markers follow the last output of the call on each stream
+        for event in call.streams_done.values():
+            await event.wait()
+        return data
+
+    async def _stop(self, call):
+        """
+        Stop a call that passed a limit: interrupt it, then kill the worker if it goes on.
+        """
+        self.interrupt()
+        try:
+            await asyncio.wait_for(asyncio.shield(call.result), self.interrupt_grace)
+        except asyncio.TimeoutError:
+            if self.alive:
+                kill_group(self.process, signal.SIGKILL)
+
+    async def _interrupt(self, call, notes):
+        """
+        Stop a call that ran out of time or whose caller was cancelled.
+        """
+        self.interrupt()
+        try:
+            return await asyncio.wait_for(self._finish(call), self.interrupt_grace)
+        except asyncio.TimeoutError:
+            await self.restart()
+            notes.append("The Python kernel did not stop when interrupted and was restarted, variables from earlier calls are gone.")
+            return {'id': call.id, 'error': 'The execution was stopped'}
+
+    async def _pump(self, stream, name):
+        await pump_lines(stream, lambda line: self._deliver(name, line))
+
+    async def _deliver(self, name, text):
+        call = self.current
+        if call is None:
+            return  # Printed between calls, e.g. by a background thread
+        if self.token in text:
+            text, _, marker = text.partition(self.token)
+            if marker.strip() == str(call.id):
+                call.streams_done[name].set()
+            if not text:
+                return
+        await emit_line(text, name, call.stdout if name == 'stdout' else call.stderr, call.output, call.on_line)
+
+    async def _read_results(self, reader):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            data = json.loads(line)
+            call = self.current
+            if call is not None and data.get('id') == call.id and not call.result.done():
+                call.result.set_result(data)
+
+    async def _watch(self, process):
+        code = await process.wait()
+        # Let the pumps pass on what the worker printed before it died
+        await asyncio.wait(self.tasks[:2], timeout=0.5)
+        call = self.current
+        if call is not None and self.process in (process, None):
+            call.finish({'id': call.id, 'error': f"The Python kernel exited with code {code}"})
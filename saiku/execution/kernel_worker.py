@@ -0,0 +1,103 @@
+"""
+The worker process of `PythonKernel`, run as a script with only the standard library.
+
+    python kernel_worker.py COMMAND_FD RESULT_FD TOKEN
+
+Each line read from COMMAND_FD is a JSON request {"id", "code"}. The code runs
+in one namespace kept for the life of the process, so globals and imports
+carry over between requests. Once it has run, the worker writes TOKEN and the
+request id on a line of its own to stdout and to stderr, then the JSON result
+{"id", "error", "rss_mb", "calls"} to RESULT_FD. SIGINT interrupts the running
+code without ending the worker.
+"""
+import ast
+import json
+import os
+import sys
+import traceback
+
+
+def rss_mb():
+    """
+    The resident memory of the process, in megabytes.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+    except ImportError:
+        return 0.0
+
+
+def run(code, namespace):
+    """
+    Run a snippet like the interactive interpreter does, printing the value of a trailing expression.
+    """
+    tree = ast.parse(code, '<kernel>', 'exec')
+    last = None
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        last = ast.Expression(tree.body.pop().value)
+    exec(compile(tree, '<kernel>', 'exec'), namespace)
+    if last is not None:
+        value = eval(compile(last, '<kernel>', 'eval'), namespace)
+        if value is not None:
+            namespace['_'] = value
+            print(repr(value))
+
+
+def format_error():
+    kind, error, tb = sys.exc_info()
+    # Drop the worker's own frames, keep the snippet's
+    while tb is not None and tb.tb_frame.f_code.co_filename == __file__:
+        tb = tb.tb_next
+    return ''.join(traceback.format_exception(kind, error, tb))
+
+
+def main():
+    commands = os.fdopen(int(sys.argv[1]), 'r', encoding='utf-8')
+    results = os.fdopen(int(sys.argv[2]), 'w', encoding='utf-8')
+    token = sys.argv[3]
+    # Imports resolve from the working directory, as in the interactive interpreter, not from this package
+    sys.path[0] = ''
+    namespace = {'__name__': '__main__', '__builtins__': __builtins__}
+    calls = 0
+    while True:
+        try:
+            line = commands.readline()
+        except KeyboardInterrupt:
+            # An interrupt that arrived after the code finished
+            continue
+        if not line:
+            break
+        request = json.loads(line)
+        calls += 1
+        error = None
+        try:
+            try:
+                run(request['code'], namespace)
+            except KeyboardInterrupt:
+                error = 'KeyboardInterrupt: the execution was interrupted'
+            except SystemExit as exit:
+                # sys.exit() ends the snippet, not the worker, and 0 or no code is a success
+                if exit.code not in (0, None):
+                    error = f'SystemExit: {exit.code}'
+            except BaseException:
+                error = format_error()
+            for stream in (sys.stdout, sys.stderr):
+                stream.flush()
+                stream.write(f"{token}{request['id']}\n")
+                stream.flush()
+        except KeyboardInterrupt:
+            pass
+        results.write(json.dumps({'id': request['id'], 'error': error, 'rss_mb': rss_mb(), 'calls': calls}) + '\n')
+        results.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+import asyncio
+import signal
+import sys
+import time
+
+
+try:
+    import resource
+except ImportError:  # Without rlimits, CPU time and memory are only enforced by the monitor.
+    resource = None
+
+# Seconds between two samples of a process tree's CPU time and memory.
+SAMPLE_INTERVAL = 0.1
+# Seconds between the soft and hard CPU limits, SIGXCPU first, then SIGKILL.
+CPU_GRACE = 1
+# Output that tells an allocation or file limit was hit.
+MEMORY_ERRORS = ('MemoryError', 'Cannot allocate memory', 'cannot allocate memory', 'std::bad_alloc', 'out of memory')
+FILE_ERRORS = ('Too many open files',)
+LIMIT_NAMES = {
+    'wall_time': ('wall time', 's'),
+    'cpu_time': ('CPU time', 's'),
+    'memory': ('memory', 'MB'),
+    'open_files': ('open files', '')
+}
+# Run as `python -c LAUNCHER LIMITS COMMAND...`: sets the rlimits, then execs the command in its place.
+LAUNCHER = '''
+import os, resource, sys
+for spec in sys.argv[1].split(","):
+    name, soft, hard = map(int, spec.split(":"))
+    current_hard = resource.getrlimit(name)[1]
+    # Never raise a limit the parent already has
+    if current_hard != resource.RLIM_INFINITY:
+        soft, hard = min(soft, current_hard), min(hard, current_hard)
+    resource.setrlimit(name, (soft, hard))
+try:
+    os.execvp(sys.argv[2], sys.argv[2:])
+except OSError as error:
+    sys.stderr.write(f"{sys.argv[2]}: {error.strerror}\\n")
+    sys.exit(127)
+'''
+
+
+class ExecutionLimits:
+    def __init__(self, wall_time=None, cpu_time=None, memory_mb=None, open_files=None):
+        """
+        Limits on one execution of code: wall time and CPU time in seconds,
+        memory in megabytes and the number of open files. None means no limit.
+        """
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+        self.memory_mb = memory_mb
+        self.open_files = open_files
+
+    @classmethod
+    def from_options(cls, options):
+        return cls(
+            wall_time=options.get('code_timeout'),
+            cpu_time=options.get('code_cpu_time'),
+            memory_mb=options.get('code_memory_mb'),
+            open_files=options.get('code_open_files')
+        )
+
+    @property
+    def monitored(self):
+        return bool(self.cpu_time or self.memory_mb)
+
+    @property
+    def enabled(self):
+        return bool(self.wall_time or self.cpu_time or self.memory_mb or self.open_files)
+
+    def value(self, name):
+        return getattr(self, 'memory_mb' if name == 'memory' else name)
+
+    def describe(self, name):
+        label, unit = LIMIT_NAMES[name]
+        return f"{label} ({self.value(name)} {unit})".replace(' )', ')')
+
+    def rlimits(self, cpu=True):
+        """
+        Return the (resource, soft, hard) limits to set in a new process.
+
+        A long-lived process accumulates CPU time over every call, so `cpu`
+        is off for those and their CPU time is left to `ResourceMonitor`.
+        """
+        if resource is None:
+            return []
+        limits = []
+        if cpu and self.cpu_time:
+            seconds = max(1, int(self.cpu_time + 0.5))
+            limits.append((resource.RLIMIT_CPU, seconds, seconds + CPU_GRACE))
+        if self.memory_mb and hasattr(resource, 'RLIMIT_AS'):
+            size = int(self.memory_mb * 2 ** 20)
+            limits.append((resource.RLIMIT_AS, size, size))
+        if self.open_files:
+            limits.append((resource.RLIMIT_NOFILE, self.open_files, self.open_files))
+        return limits
+
+    def wrap(self, argv, cpu=True):
+        """
+        Return the argument list running `argv` with the rlimits applied.
+
+        The limits are set by a small launcher that then execs the command,
+        not in a `preexec_fn`, which can deadlock the child while the parent runs threads.
+        """
+        limits = self.rlimits(cpu)
+        if not limits:
+            return list(argv)
+        specs = ",".join(f"{name}:{soft}:{hard}" for name, soft, hard in limits)
+        return [sys.executable, '-S', '-E', '-c', LAUNCHER, specs, *argv]
+
+    def limit_hit(self, returncode, text, usage):
+        """
+        Tell which limit, other than wall time, ended an execution, from how it ended and what it printed.
+        """
+        if self.cpu_time and hasattr(signal, 'SIGXCPU'):
+            # Only the CPU rlimit sends SIGXCPU, whatever the last sample said
+            if returncode in (-signal.SIGXCPU, 128 + signal.SIGXCPU):
+                return 'cpu_time'
+            # SIGKILL at the hard limit, when SIGXCPU was ignored
+            if returncode in (-signal.SIGKILL, 128 + signal.SIGKILL) \
+                    and (usage.get('cpu_seconds') or 0) >= self.cpu_time * 0.9:
+                return 'cpu_time'
+        if self.memory_mb and any(error in text for error in MEMORY_ERRORS):
+            return 'memory'
+        if self.open_files and any(error in text for error in FILE_ERRORS):
+            return 'open_files'
+        return None
+
+
+def usage_note(limits, limit, usage):
+    """
+    A line telling the model which limit stopped its code, and what the code used.
+    """
+    if not limit:
+        return ""
+    parts = [f"{usage['wall_seconds']:.2f} s wall time"]
+    if usage.get('cpu_seconds') is not None:
+        parts.append(f"{usage['cpu_seconds']:.2f} s CPU time")
+    if usage.get('peak_rss_mb') is not None:
+        parts.append(f"{usage['peak_rss_mb']:.0f} MB peak memory")
+    return f"\nStopped at the {limits.describe(limit)} limit, after using {', '.join(parts)}."
+
+
+class ResourceMonitor:
+    def __init__(self, pid, limits, on_limit=None, interval=SAMPLE_INTERVAL):
+        """
+        Sample the CPU time and resident memory of a process and its
+        descendants while code runs, and await `on_limit(name)` once the
+        tree passes the CPU time or memory limit.
+
+        Usage is counted from `start()`, so a long-lived process only pays
+        for the current call. Sampling misses processes that live less than
+        an interval, and memory is the sum of the RSS of the tree, counting
+        shared pages more than once: both are approximations. Without any
+        limit, nothing is sampled and only the wall time is reported.
+        """
+        self.pid = pid
+        self.limits = limits
+        self.on_limit = on_limit
+        self.interval = interval
+        self.cpu = {}
+        self.baseline = 0.0
+        self.peak_rss = 0
+        self.hit = None
+        self.task = None
+        self.started = None
+        self.sampling = limits is not None and limits.enabled
+
+    def sample(self):
+        # Imported here, only code run with limits pays for psutil
+        import psutil
+        try:
+            root = psutil.Process(self.pid)
+            processes = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return None
+        rss = 0
+        for process in processes:
+            try:
+                with process.oneshot():
+                    times = process.cpu_times()
+                    # Key by creation time too, pids are reused
+                    self.cpu[(process.pid, process.create_time())] = times.user + times.system
+                    rss += process.memory_info().rss
+            except psutil.Error:
+                pass
+        self.peak_rss = max(self.peak_rss, rss)
+        return rss
+
+    @property
+    def cpu_seconds(self):
+        return max(0.0, sum(self.cpu.values()) - self.baseline)
+
+    def start(self):
+        self.started = time.perf_counter()
+        if not self.sampling:
+            return self
+        self.sample()
+        self.baseline = sum(self.cpu.values())
+        self.peak_rss = 0
+        if self.limits is not None and self.limits.monitored:
+            self.task = asyncio.ensure_future(self._run())
+        return self
+
+    async def stop(self):
+        """
+        Stop sampling and return the usage: wall and CPU seconds, peak RSS in megabytes.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if not self.sampling:
+            return {'wall_seconds': time.perf_counter() - self.started, 'cpu_seconds': None, 'peak_rss_mb': None}
+        self.sample()
+        return {
+            'wall_seconds': time.perf_counter() - self.started,
+            'cpu_seconds': self.cpu_seconds,
+            'peak_rss_mb': self.peak_rss / 2 ** 20 if self.peak_rss else None
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            rss = self.sample()
+            if rss is None:
+                return
+            if self.limits.cpu_time and self.cpu_seconds >= self.limits.cpu_time:
+                self.hit = 'cpu_time'
+            elif self.limits.memory_mb and rss >= self.limits.memory_mb * 2 ** 20:
+                self.hit = 'memory'
+            if self.hit:
+                if self.on_limit is not None:
+                    await self.on_limit(self.hit)
+                return
@@ -0,0 +1,232 @@
+import asyncio
+import codecs
+import os
+import signal
+import time
+
+from .capture import OutputCapture
+from .limits import ResourceMonitor
+# Bytes read from a pipe at a time, lines may be longer.
+CHUNK_SIZE = 64 * 1024
+# Characters of an unfinished long line kept back from delivery, more than an end
+# of call marker with its working directory takes.
+MARKER_ROOM = 8 * 1024
+# Seconds a timed out process group gets between SIGTERM and SIGKILL.
+KILL_GRACE = 2.0
+
+
+class ProcessResult:
+    def __init__(self, returncode, stdout, stderr, output, duration, timed_out=False, cwd=None, notes=None, limit=None, usage=None):
+        """
+        The outcome of `run_process` or `ShellSession.execute`. `output` holds
+        stdout and stderr lines in the order they were read, `returncode` is
+        negative when a signal ended the process. `limit` names the
+        `ExecutionLimits` limit that stopped it, `usage` is what it used.
+        """
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.output = output
+        self.duration = duration
+        self.timed_out = timed_out
+        self.cwd = cwd
+        self.notes = notes or []
+        self.limit = limit
+        self.usage = usage or {}
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.timed_out and not self.limit
+
+    def __repr__(self):
+        return f"ProcessResult(returncode={self.returncode}, timed_out={self.timed_out}, duration={self.duration:.3f})"
+
+
+class StreamedCall:
+    def __init__(self, call_id, on_line, capture=None):
+        """
+        A call to a long-lived worker, collecting its output until the worker
+        marks the end of the call on stdout and stderr and reports a result.
+        """
+        self.id = call_id
+        self.on_line = on_line
+        self.output = capture or OutputCapture(max_bytes=None, max_tokens=None)
+        self.stdout = self.output.derive()
+        self.stderr = self.output.derive()
+        self.streams_done = {'stdout': asyncio.Event(), 'stderr': asyncio.Event()}
+        self.result = asyncio.get_running_loop().create_future()
+
+    def finish(self, data):
+        if not self.result.done():
+            self.result.set_result(data)
+        for event in self.streams_done.values():
+            event.set()
+
+
+async def pump_lines(stream, deliver):
+    """
+    Read a pipe to its end, awaiting `deliver(line)` with each decoded line.
+
+    A line longer than CHUNK_SIZE is delivered in pieces as it is read, so
+    memory stays bounded however long a line without newline gets.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    pending = ''
+    while True:
+        chunk = await stream.read(CHUNK_SIZE)
+        text = decoder.decode(chunk, final=not chunk)
+        if text:
+            # Only the new text is scanned for line ends
+            *complete, rest = text.split('\n')
+            if complete:
+                complete[0] = pending + complete[0]
+                pending = rest
+                for line in complete:
+                    await deliver(line + '\n')
+            else:
+                pending += rest
+            if len(pending) > CHUNK_SIZE:
+                # The end is held back, it may be the start of a worker's end of call marker
+                await deliver(pending[:-MARKER_ROOM])
+                pending = pending[-MARKER_ROOM:]
+        if not chunk:
+            break
+    if pending:
+        await deliver(pending)
+
+
+async def read_lines(stream, name, lines, output, on_line):
+    """
+    Read a pipe to its end, passing each decoded line to `on_line(line, name)`.
+    """
+    await pump_lines(stream, lambda line: emit_line(line, name, lines, output, on_line))
+
+
+async def emit_line(line, name, lines, output, on_line):
+    lines.append(line)
+    output.append(line)
+    if on_line is not None:
+        result = on_line(line, name)
+        if asyncio.iscoroutine(result):
+            await result
+
+
+def stop_reading(readers):
+    readers.cancel()
+    # Mark the outcome as retrieved, nobody awaits the readers anymore
+    readers.add_done_callback(lambda future: future.cancelled() or future.exception())
+
+
+def kill_group(process, sig):
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(process.pid, sig)
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def terminate(process, grace=KILL_GRACE):
+    """
+    Stop a process and everything it started: SIGTERM to its group, SIGKILL after `grace` seconds.
+    """
+    if process.returncode is not None:
+        return
+    kill_group(process, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), grace)
+    except asyncio.TimeoutError:
+        kill_group(process, signal.SIGKILL)
+        await process.wait()
+
+
+async def run_process(command, shell=True, on_line=None, timeout=None, cwd=None, env=None, stdin=None, kill_grace=KILL_GRACE, capture=None, limits=None):
+    """
+    Run a command without blocking the event loop and return a `ProcessResult`.
+
+    stdout and stderr are read concurrently and each line is passed to
+    `on_line(line, "stdout" | "stderr")`, which may be a coroutine function.
+    The process runs in its own process group, so when `timeout` seconds
+    pass, or the caller is cancelled, the whole group is killed. `command`
+    is a shell string, or an argument list with `shell=False`. Every call is
+    independent, any number may run at once. Output is kept whole unless an
+    `OutputCapture` with a budget is given.
+
+    With `ExecutionLimits`, CPU time, memory and open files are limited with
+    rlimits where the platform has them, and the process tree is killed
+    once its sampled CPU time or memory passes the limits.
+    """
+    if limits is not None and limits.wall_time:
+        timeout = min(timeout, limits.wall_time) if timeout else limits.wall_time
+    env = {**os.environ, "PYTHONIOENCODING": "utf-8", **(env or {})}
+    kwargs = dict(
+        stdin=asyncio.subprocess.PIPE if stdin is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        env=env,
+        start_new_session=hasattr(os, 'killpg')
+    )
+    if limits is not None and limits.rlimits():
+        # Started through the rlimits launcher, a shell command with the shell asyncio would use
+        command = limits.wrap(['/bin/sh', '-c', command] if shell else command)
+        shell = False
+    start = time.perf_counter()
+    if shell:
+        process = await asyncio.create_subprocess_shell(command, **kwargs)
+    else:
+        process = await asyncio.create_subprocess_exec(*command, **kwargs)
+
+    async def on_limit(name):
+        kill_group(process, signal.SIGKILL)
+
+    monitor = ResourceMonitor(process.pid, limits, on_limit).start()
+    output = capture or OutputCapture(max_bytes=None, max_tokens=None)
+    stdout, stderr = output.derive(), output.derive()
+    readers = asyncio.gather(
+        read_lines(process.stdout, "stdout", stdout, output, on_line),
+        read_lines(process.stderr, "stderr", stderr, output, on_line)
+    )
+    if stdin is not None:
+        process.stdin.write(stdin.encode('utf-8') if isinstance(stdin, str) else stdin)
+        process.stdin.close()
+
+    timed_out = False
+    try:
+        await asyncio.wait_for(asyncio.shield(readers), timeout)
+        # The pipes may close before the process exits
+        remaining = None if timeout is None else max(0.0, timeout - (time.perf_counter() - start))
+        await asyncio.wait_for(process.wait(), remaining)
+    except asyncio.TimeoutError:
+        timed_out = True
+        await terminate(process, kill_grace)
+        # Children that escaped the group may hold the pipes open, stop reading after the kill
+        try:
+            await asyncio.wait_for(asyncio.shield(readers), kill_grace)
+        except asyncio.TimeoutError:
+            stop_reading(readers)
+    except BaseException:
+        await terminate(process, kill_grace)
+        stop_reading(readers)
+        await monitor.stop()
+        raise
+    finally:
+        # Closes the spill file when the call fails or is cancelled
+        output.close()
+
+    usage = await monitor.stop()
+    text = output.text()
+    limit = 'wall_time' if timed_out else monitor.hit
+    if limit is None and limits is not None:
+        limit = limits.limit_hit(process.returncode, text, usage)
+    return ProcessResult(
+        process.returncode,
+        stdout.text(),
+        stderr.text(),
+        text,
+        time.perf_counter() - start,
+        timed_out,
+        limit=limit,
+        usage=usage
+    )
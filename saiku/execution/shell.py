@@ -0,0 +1,267 @@
+import asyncio
+import os
+import secrets
+import shlex
+import shutil
+import signal
+import time
+
+from .limits import ResourceMonitor
+from .process import KILL_GRACE, ProcessResult, StreamedCall, emit_line, kill_group, pump_lines, terminate
+
+DEFAULT_POOL_SIZE = 2
+
+
+def find_shell():
+    return shutil.which('bash') or '/bin/sh'
+
+
+class ShellSession:
+    def __init__(self, shell=None, cwd=None, env=None, interrupt_grace=KILL_GRACE, limits=None):
+        """
+        A long-lived shell running one command at a time, so `cd`, exported
+        variables and activated virtualenvs carry over between commands.
+
+        Each command is passed through a quoted heredoc and `eval`, with stdin
+        from /dev/null, then the shell prints a per-session marker with the
+        exit code and working directory to stdout and stderr. The shell
+        starts with the first command and is restarted, in its last working
+        directory, when it dies.
+
+        With `ExecutionLimits`, the shell, and so every command, gets the
+        memory and open file rlimits, and a command is interrupted when it
+        runs past the wall time or the sampled CPU time or memory of the
+        shell's process tree pass the limits.
+        """
+        self.shell = shell or find_shell()
+        self.cwd = cwd or os.getcwd()
+        self.env = env
+        self.interrupt_grace = interrupt_grace
+        self.limits = limits
+        self.process = None
+        self.tasks = []
+        self.current = None
+        self.next_id = 0
+        self.started = False
+        # Created on first use, on the loop that runs the commands
+        self.lock = None
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.returncode is None
+
+    @property
+    def busy(self):
+        return self.lock is not None and self.lock.locked()
+
+    async def start(self):
+        if self.alive:
+            return
+        await self.close()
+        self.token = f"__saiku_shell_{secrets.token_hex(8)}__"
+        env = {**os.environ, "PYTHONIOENCODING": "utf-8", **(self.env or {})}
+        cwd = self.cwd if os.path.isdir(self.cwd) else None
+        # CPU time is counted per command by the monitor, rlimits would count the shell's lifetime
+        argv = self.limits.wrap([self.shell], cpu=False) if self.limits is not None else [self.shell]
+        self.process = await asyncio.create_subprocess_exec(
+            *argv,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=hasattr(os, 'killpg'),
+            cwd=cwd,
+            env=env
+        )
+        self.tasks = [
+            asyncio.ensure_future(pump_lines(self.process.stdout, lambda line: self._deliver('stdout', line))),
+            asyncio.ensure_future(pump_lines(self.process.stderr, lambda line: self._deliver('stderr', line))),
+            asyncio.ensure_future(self._watch(self.process))
+        ]
+        # A handler, rather than ignoring SIGINT, so commands can still be interrupted
+        self.process.stdin.write(b"trap ':' INT\n")
+        self.started = True
+
+    async def execute(self, command, on_line=None, timeout=None, cwd=None, capture=None):
+        """
+        Run a command and return a `ProcessResult` with its exit code and the
+        working directory it left, optionally changing to `cwd` first.
+
+        Output lines are passed to `on_line(line, "stdout" | "stderr")` as they
+        are printed. After `timeout` seconds the command gets SIGINT, and the
+        shell is restarted if it does not stop. Output is kept whole unless an
+        `OutputCapture` with a budget is given.
+        """
+        if self.limits is not None and self.limits.wall_time:
+            timeout = min(timeout, self.limits.wall_time) if timeout else self.limits.wall_time
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            notes = []
+            if not self.alive:
+                if self.started:
+                    notes.append(f"The shell had exited and was restarted in {self.cwd}, exported variables were reset.")
+                await self.start()
+
+            self.next_id += 1
+            call = self.current = StreamedCall(self.next_id, on_line, capture)
+            start = time.perf_counter()
+            monitor = ResourceMonitor(self.process.pid, self.limits, lambda name: self._stop(call)).start()
+            self.process.stdin.write(self._script(call.id, command, cwd).encode('utf-8'))
+            timed_out = False
+            try:
+                await self.process.stdin.drain()
+                data = await asyncio.wait_for(self._finish(call), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                data = await self._interrupt(call, notes)
+            except (BrokenPipeError, ConnectionResetError):
+                data = await self._finish(call)
+            except BaseException:
+                await self._interrupt(call, notes)
+                raise
+            finally:
+                self.current = None
+                # Closes the spill file when the call fails or is cancelled
+                call.output.close()
+                usage = await monitor.stop()
+
+            limit = 'wall_time' if timed_out else monitor.hit
+            if limit is None and self.limits is not None:
+                limit = self.limits.limit_hit(data.get('returncode'), call.output.text(), usage)
+            if monitor.hit and not self.alive:
+                await self.start()
+                notes.append(f"The shell did not stop at the limit and was restarted in {self.cwd}, exported variables were reset.")
+            self.cwd = data.get('cwd') or self.cwd
+            return ProcessResult(
+                data.get('returncode'),
+                call.stdout.text(),
+                call.stderr.text(),
+                call.output.text(),
+                time.perf_counter() - start,
+                timed_out,
+                self.cwd,
+                notes,
+                limit,
+                usage
+            )
+
+    def interrupt(self):
+        """
+        Interrupt the running command with SIGINT, as Ctrl-C would.
+        """
+        if self.current is not None and self.alive:
+            kill_group(self.process, signal.SIGINT)
+
+    async def restart(self):
+        await self.close()
+        await self.start()
+
+    async def close(self):
+        process, self.process = self.process, None
+        if process is not None:
+            await terminate(process, self.interrupt_grace)
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def _script(self, call_id, command, cwd):
+        end = f"{self.token}_END"
+        lines = []
+        if cwd:
+            lines.append(f"cd -- {shlex.quote(cwd)}")
+        lines += [
+            f"__saiku_command=$(cat <<'{end}'",
+            command,
+            end,
+            ")",
+            'eval "$__saiku_command" < /dev/null',
+            "__saiku_status=$?",
+            f"printf '%s%s %s %s\\n' '{self.token}' {call_id} \"$__saiku_status\" \"$PWD\"",
+            f"printf '%s%s\\n' '{self.token}' {call_id} >&2",
+        ]
+        return "\n".join(lines) + "\n"
+
+    async def _finish(self, call):
+        data = await asyncio.shield(call.result)
+        for event in call.streams_done.values():
+            await event.wait()
+        return data
+
+    async def _stop(self, call):
+        """
+        Stop a command that passed a limit: interrupt it, then kill the shell if it goes on.
+        """
+        self.interrupt()
+        try:
+            await asyncio.wait_for(asyncio.shield(call.result), self.interrupt_grace)
+        except asyncio.TimeoutError:
+            if self.alive:
+                kill_group(self.process, signal.SIGKILL)
+
+    async def _interrupt(self, call, notes):
+        self.interrupt()
+        try:
+            return await asyncio.wait_for(self._finish(call), self.interrupt_grace)
+        except asyncio.TimeoutError:
+            await self.restart()
+            notes.append(f"The shell did not stop when interrupted and was restarted in {self.cwd}, exported variables were reset.")
+            return {'returncode': -signal.SIGKILL}
+
+    async def _deliver(self, name, text):
+        call = self.current
+        if call is None:
+            return  # Printed between commands, e.g. by a background job
+        if self.token in text:
+            text, _, marker = text.partition(self.token)
+            parts = marker.rstrip('\n').split(' ', 2)
+            if parts[0] == str(call.id):
+                if name == 'stdout' and len(parts) == 3 and not call.result.done():
+                    call.result.set_result({'returncode': int(parts[1]), 'cwd': parts[2]})
+                call.streams_done[name].set()
+            if not text:
+                return
+        await emit_line(text, name, call.stdout if name == 'stdout' else call.stderr, call.output, call.on_line)
+
+    async def _watch(self, process):
+        code = await process.wait()
+        # Let the pumps pass on what the shell printed before it exited
+        await asyncio.wait(self.tasks[:2], timeout=0.5)
+        call = self.current
+        if call is not None and self.process in (process, None):
+            call.finish({'returncode': code})
+
+
+class ShellPool:
+    def __init__(self, size=DEFAULT_POOL_SIZE, **options):
+        """
+        A primary `ShellSession`, whose state carries over between commands,
+        and up to `size - 1` more for commands arriving while it is busy.
+        Those run in the primary's working directory, but their own changes
+        to it or to the environment are not carried over.
+        """
+        self.size = max(1, size)
+        self.options = options
+        self.sessions = [ShellSession(**options)]
+
+    @property
+    def primary(self):
+        return self.sessions[0]
+
+    def pick(self):
+        for session in self.sessions:
+            if not session.busy:
+                return session
+        if len(self.sessions) < self.size:
+            session = ShellSession(**self.options)
+            self.sessions.append(session)
+            return session
+        return self.primary
+
+    async def execute(self, command, on_line=None, timeout=None, capture=None):
+        session = self.pick()
+        cwd = None if session is self.primary else self.primary.cwd
+        return await session.execute(command, on_line=on_line, timeout=timeout, cwd=cwd, capture=capture)
+
+    async def close(self):
+        await asyncio.gather(*(session.close() for session in self.sessions))
@@ -0,0 +1,37 @@
+from typing import Any, Dict, List, Optional
+
+
+class Action:
+    """
+    The contract of an action, declaring how its work runs.
+
+    `execution` is one of:
+    - "async": the action awaits its I/O, it overrides `run`.
+    - "blocking": `execute(args)` blocks on the network, files or other
+      processes, it runs on the agent's thread pool.
+    - "cpu": `execute(args)` is CPU-bound, it runs in a process pool worker.
+      It must be a staticmethod, it does not have the agent there, and its
+      arguments and result must be picklable.
+
+    `max_concurrency` limits how many calls of the action run at once,
+    `timeout` is how many seconds a blocking or CPU-bound call may take.
+    """
+    name: str = None
+    description: str = ''
+    parameters: List[Dict[str, Any]] = []
+    dependencies: List[str] = []
+    execution: str = 'async'
+    max_concurrency: Optional[int] = None
+    timeout: Optional[float] = None
+
+    def __init__(self, agent):
+        self.agent = agent
+
+    async def run(self, args: Dict[str, Any]) -> Any:
+        """
+        Run the action. Blocking and CPU-bound actions are handed to the agent's executor.
+        """
+        return await self.agent.executor.run(self, args)
+
+    def execute(self, args: Dict[str, Any]) -> Any:
+        raise NotImplementedError(f"{type(self).__name__} implements neither run nor execute")
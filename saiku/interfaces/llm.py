@@ -25,5 +25,5 @@ class LLM(ABC):
         pass
 
     @abstractmethod
-    def predict(self, request: PredictionRequest) -> PredictionResponse:
+    async def predict(self, request: PredictionRequest) -> PredictionResponse:
         pass
\ No newline at end of file
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from ..utils import SAMPLE_MESSAGE_NAME, cache_dir, message_to_dict
+
+# Request keys that do not change the completion.
+NON_KEY_FIELDS = ("prompt", "cache", "stream", "timeout")
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 7 * 24 * 3600
+
+
+def fingerprint(request):
+    """
+    Return a canonical hash of a chat completion request: model, messages, tools and sampling parameters.
+    The volatile environment sample is left out, it changes every turn. The
+    stable environment facts are kept, an answer depends on the machine it is for.
+    """
+    payload = {key: value for key, value in request.items() if key not in NON_KEY_FIELDS}
+    payload["messages"] = [
+        message for message in map(message_to_dict, request.get("messages") or [])
+        if message.get("name") != SAMPLE_MESSAGE_NAME
+    ]
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def is_deterministic(request):
+    """
+    Only requests sampled at temperature 0 produce repeatable completions,
+    agent turns are sent at the `llm_temperature` option.
+    """
+    return request.get("temperature") == 0 and request.get("n", 1) == 1
+
+
+class ResponseCache:
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        """
+        An on-disk cache of chat completion responses, stored compressed in SQLite,
+        bounded in size with least-recently-used eviction and expiring after `ttl` seconds.
+
+        `get` and `set` block on SQLite, callers on an event loop run them in
+        a thread. A lock keeps calls from several threads one at a time.
+        """
+        self.path = str(path or cache_dir() / "llm-responses.sqlite")
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bypass = os.environ.get("SAIKU_LLM_CACHE_BYPASS") == "1"
+        self.stats = {"hits": 0, "misses": 0, "skips": 0, "evictions": 0}
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def key(self, request):
+        """
+        Return the cache key of a request, or None if it must not be cached.
+        A request's "cache" key forces (True) or bypasses (False) the cache.
+        """
+        use_cache = request.get("cache")
+        if self.bypass or use_cache is False or (use_cache is None and not is_deterministic(request)):
+            self.stats["skips"] += 1
+            return None
+        return fingerprint(request)
+
+    def get(self, key):
+        with self.lock:
+            return self._get(key)
+
+    def _get(self, key):
+        row = self.db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+            if row is not None:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.stats["misses"] += 1
+            return None
+
+        self.db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self.stats["hits"] += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, key, value):
+        with self.lock:
+            self._set(key, value)
+
+    def _set(self, key, value):
+        blob = zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+            (key, blob, len(blob), now, now)
+        )
+        self.evict()
+
+    def evict(self):
+        """
+        Remove expired entries, then the least recently used ones until the cache fits `max_bytes`.
+        """
+        if self.ttl is not None:
+            self.db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.stats["evictions"] += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM responses")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,52 @@
+import asyncio
+import os
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+DEFAULT_TIMEOUT = 600.0
+
+_clients = {}
+
+
+def get_async_client(api_key=None, base_url=None, max_connections=None,
+                     max_keepalive_connections=None, keepalive_expiry=None, timeout=None):
+    """
+    Return a shared AsyncOpenAI client backed by a pooled HTTP client.
+
+    Clients are shared per event loop and configuration, so every session
+    running on a loop reuses the same connection pool.
+    """
+    max_connections = max_connections or int(os.environ.get('OPENAI_MAX_CONNECTIONS', DEFAULT_MAX_CONNECTIONS))
+    max_keepalive_connections = max_keepalive_connections or int(os.environ.get('OPENAI_MAX_KEEPALIVE_CONNECTIONS', DEFAULT_MAX_KEEPALIVE_CONNECTIONS))
+    keepalive_expiry = keepalive_expiry or float(os.environ.get('OPENAI_KEEPALIVE_EXPIRY', DEFAULT_KEEPALIVE_EXPIRY))
+    timeout = timeout or float(os.environ.get('OPENAI_TIMEOUT', DEFAULT_TIMEOUT))
+    loop = asyncio.get_running_loop()
+    key = (id(loop), api_key, base_url, max_connections, max_keepalive_connections, keepalive_expiry, timeout)
+
+    # The loop is kept alongside its client so its id cannot be reused while cached.
+    _, client = _clients.get(key, (None, None))
+    if client is None or client.is_closed():
+        # Imported here, the openai package is slow to import and only needed once a request is made
+        import httpx
+        from openai import AsyncOpenAI
+
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        http_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        client = AsyncOpenAI(api_key=api_key or None, base_url=base_url or None, http_client=http_client, timeout=timeout)
+        _clients[key] = (loop, client)
+    return client
+
+
+async def close_async_clients():
+    """
+    Close the shared clients created on the running event loop.
+    """
+    loop_id = id(asyncio.get_running_loop())
+    for key in [key for key in _clients if key[0] == loop_id]:
+        _, client = _clients.pop(key)
+        await client.close()
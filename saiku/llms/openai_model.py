@@ -1,13 +1,18 @@
 # llms/openai_model.py
 
+import asyncio
+import copy
 import json
 import os
 import sys
-from openai import OpenAI
+import time
 from typing import Any, Dict, Optional, Union
 from ..interfaces.llm import LLM, PredictionRequest, PredictionResponse
-
-openai = OpenAI()
+from ..metrics import metrics
+from ..utils import message_to_dict
+from .cache import DEFAULT_MAX_BYTES, DEFAULT_TTL, ResponseCache
+from .client import get_async_client
+from .transport import create_transport
 
 class OpenAIPredictionRequest(PredictionRequest):
     def __init__(self, model: str, messages: list, max_tokens: Optional[int] = None,
@@ -30,8 +35,24 @@ class OpenAIModel(LLM):
     def __init__(self, agent, opts: Dict[str, Optional[str]]):
         self.agent = agent
         self.api_key = opts.get("apiKey", os.environ.get("OPENAI_API_KEY", ""))
+        self.base_url = opts.get("baseURL", os.environ.get("OPENAI_BASE_URL"))
+        self.timeout = opts.get("timeout")
+        self.cache = self.create_cache(opts)
+        self.transport = create_transport(
+            self,
+            mode=opts.get("transport") or os.environ.get("SAIKU_TRANSPORT"),
+            cassette=opts.get("cassette") or os.environ.get("SAIKU_CASSETTE"),
+            latency=float(opts.get("replayLatency") or os.environ.get("SAIKU_REPLAY_LATENCY", 0))
+        )
+        self.pool = {
+            "max_connections": opts.get("maxConnections"),
+            "max_keepalive_connections": opts.get("maxKeepaliveConnections"),
+            "keepalive_expiry": opts.get("keepaliveExpiry"),
+        }
         
         self.name = os.environ.get("OPENAI_MODEL", "gpt-4-1106-preview")
+        # Confirmation prompts are asked one at a time, created on first use
+        self.confirm_lock = None
         self.messages = [
             {
                 "role": "system",
@@ -39,22 +60,69 @@ class OpenAIModel(LLM):
             },
         ]
 
-    def predict(self, request):
+    def fork(self, agent):
+        """
+        Return a model for another agent, sharing the response cache, the transport and the connection pool.
+        """
+        model = copy.copy(self)
+        model.agent = agent
+        model.messages = [
+            {
+                "role": "system",
+                "content": agent.system_message or "You are a helpful assistant",
+            },
+        ]
+        return model
+
+    def create_cache(self, opts):
+        """
+        Create the response cache when enabled, with a path or True ("1" in SAIKU_LLM_CACHE).
+        """
+        cache = opts.get("cache")
+        if cache is None:
+            cache = os.environ.get("SAIKU_LLM_CACHE")
+        if cache in (None, False, "", "0"):
+            return None
+        ttl = opts.get("cacheTTL")
+        if ttl is None:
+            ttl = DEFAULT_TTL
+        elif ttl <= 0:
+            ttl = None  # Entries are kept until evicted
+        return ResponseCache(
+            path=None if cache in (True, "1") else cache,
+            max_bytes=opts.get("cacheMaxBytes") or DEFAULT_MAX_BYTES,
+            ttl=ttl
+        )
+
+    @property
+    def client(self):
+        """
+        The shared, pooled async client for the running event loop.
+        """
+        return get_async_client(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout, **self.pool)
+
+    async def predict(self, request):
         try:
-            # Remove 'prompt' key from the request if it exists
-            filtered_request = {k: v for k, v in request.items() if k != 'prompt'}
+            # Remove 'prompt' and 'cache' keys from the request if they exist
+            filtered_request = {k: v for k, v in request.items() if k not in ('prompt', 'cache')}
             model = request.get("model", "gpt-4-1106-preview")
+
+            cache_key = self.cache.key(request) if self.cache else None
+            if cache_key:
+                # SQLite blocks, keep it off the event loop
+                cached = await asyncio.to_thread(self.cache.get, cache_key)
+                if cached is not None:
+                    metrics.increment("predict_cache_hits")
+                    return prediction_response(cached, model)
             
-            # Make an asynchronous call to OpenAI API
-            response = openai.chat.completions.create(**filtered_request)
+            # Make an asynchronous call to OpenAI API, a "timeout" key overrides the client timeout
+            with metrics.span("predict", model=model, stream="false"):
+                response = await self.transport.complete(filtered_request)
             if response and hasattr(response, 'choices') and response.choices:
-                choice = response.choices[0].message
-                tool_calls = getattr(choice, 'tool_calls', [])
-                content = getattr(choice, 'content', '')
-
-                text = tool_calls if tool_calls else content or ""
-
-                return OpenAIPredictionResponse(text=text, model=model, message=choice, other_metadata=None)
+                message = message_to_dict(response.choices[0].message)
+                if cache_key:
+                    await asyncio.to_thread(self.cache.set, cache_key, message)
+                return prediction_response(message, model)
             else:
                 return OpenAIPredictionResponse(text="", model= model, message=None, other_metadata=None)
 
@@ -65,7 +133,78 @@ class OpenAIModel(LLM):
             print(f"An error occurred: {e}")
             raise
 
+    async def predict_stream(self, request):
+        """
+        Stream a completion, yielding events as they arrive:
+        `content` events with each delta, a `tool_call` event as soon as a
+        tool call's arguments are complete, and a final `done` event with the
+        assembled prediction response.
+        """
+        filtered_request = {k: v for k, v in request.items() if k not in ('prompt', 'cache')}
+        model = request.get("model", "gpt-4-1106-preview")
+
+        cache_key = self.cache.key(request) if self.cache else None
+        cached = await asyncio.to_thread(self.cache.get, cache_key) if cache_key else None
+        if cached is not None:
+            metrics.increment("predict_cache_hits")
+            response = prediction_response(cached, model)
+            if cached.get("content"):
+                yield {"type": "content", "delta": cached["content"]}
+            for tool_call in response.text if isinstance(response.text, list) else []:
+                yield {"type": "tool_call", "tool_call": tool_call}
+            yield {"type": "done", "response": response}
+            return
+
+        content = []
+        fragments = {}
+        tool_calls = []
+        current = None
+        start = time.perf_counter()
+        first_chunk = True
+        # The span covers the whole stream, including the time the consumer takes between chunks
+        with metrics.span("predict", model=model, stream="true"):
+            async for chunk in self.transport.stream(filtered_request):
+                if first_chunk:
+                    metrics.observe("predict_first_chunk", time.perf_counter() - start, model=model)
+                    first_chunk = False
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content.append(delta.content)
+                    yield {"type": "content", "delta": delta.content}
+
+                for fragment in delta.tool_calls or []:
+                    # Tool calls are streamed one after the other, a new index completes the previous one
+                    if current is not None and fragment.index != current:
+                        tool_calls.append(build_tool_call(fragments[current]))
+                        yield {"type": "tool_call", "tool_call": tool_calls[-1]}
+                    current = fragment.index
+                    call = fragments.setdefault(fragment.index, {"id": None, "name": "", "arguments": ""})
+                    if fragment.id:
+                        call["id"] = fragment.id
+                    if fragment.function:
+                        call["name"] += fragment.function.name or ""
+                        call["arguments"] += fragment.function.arguments or ""
+
+        if current is not None:
+            tool_calls.append(build_tool_call(fragments[current]))
+            yield {"type": "tool_call", "tool_call": tool_calls[-1]}
+
+        # Same shape as a non-streamed message, so both produce the same history
+        message = {"role": "assistant"}
+        if content:
+            message["content"] = "".join(content)
+        if tool_calls:
+            message["tool_calls"] = [message_to_dict(tool_call) for tool_call in tool_calls]
+        if cache_key:
+            await asyncio.to_thread(self.cache.set, cache_key, message)
+        yield {"type": "done", "response": prediction_response(message, model)}
+
     async def interact(self, use_delegate: bool = False) -> Union[str, None]:
+        if self.agent.options.get('stream'):
+            return await self.interact_stream(use_delegate)
+
         decision = await self.agent.think()
         if isinstance(decision.text, list):
             tool_calls = decision.text
@@ -73,7 +212,10 @@ class OpenAIModel(LLM):
             tool_calls = []
 
         content = decision.text if isinstance(decision.text, str) else None
-        self.agent.messages.append(decision.message)
+        if decision.message is not None:
+            self.agent.messages.append(message_to_dict(decision.message))
+        if content and self.agent.listeners:
+            await self.agent.emit("content", {"delta": content})
 
         if content:
             if use_delegate:
@@ -83,35 +225,157 @@ class OpenAIModel(LLM):
                     await self.agent.speak(content)
                 self.agent.display_message(content)
         else:
-            for tool_call in tool_calls:
-                action_name = tool_call.function.name if tool_call.function and tool_call.function.name else ""
-                args = tool_call.function.arguments if tool_call.function and tool_call.function.arguments else ""
-                result = ""
-                if (self.agent.memory.last_action == action_name and 
-                    self.agent.memory.last_action_status == "failure"):
-                    continue  # Skip the repeated action if it previously failed
-
-                try:
-                    args = json.loads(args)
-                    if not self.agent.options["allow_code_execution"]:
-                        # Prompt logic for execution confirmation
-                        # This might be different in Python. You might need to use an alternative to 'prompts'
-                        answer = input(f"Do you want to execute the code? (y/n): ").lower() == 'y'
-                        if not answer:
-                            result = "Code execution cancelled for current action only"
-                        else:
-                            result = await self.agent.act(action_name, args)
-                    else:
-                        result = await self.agent.act(action_name, args)
-                except Exception as e:
-                    print(f"An error occurred: {e}")
-                    result = str(e)
-
-                self.agent.messages.append({
-                    "tool_call_id": tool_call.id,
-                    "role": "tool",
-                    "name": action_name,
-                    "content": result
-                })
-
-            return await self.interact(use_delegate)
\ No newline at end of file
+            calls = [self.dispatch_tool_call(tool_call) for tool_call in tool_calls]
+            await self.append_tool_results(calls)
+            return await self.interact(use_delegate)
+
+    async def interact_stream(self, use_delegate: bool = False) -> Union[str, None]:
+        """
+        Interact with the model in streaming mode: content is rendered as it
+        arrives and each tool call starts as soon as its arguments are complete.
+        """
+        display = None if use_delegate else self.agent.stream_display()
+        calls = []
+        decision = None
+        # Set once the response is complete, confirmation prompts wait for it
+        streamed = asyncio.Event()
+        try:
+            async for event in self.agent.think_stream():
+                if event["type"] == "content":
+                    if display:
+                        display.update(event["delta"])
+                    if self.agent.listeners:
+                        await self.agent.emit("content", {"delta": event["delta"]})
+                elif event["type"] == "tool_call":
+                    if display:
+                        display.close()
+                    calls.append(self.dispatch_tool_call(event["tool_call"], streamed))
+                else:
+                    decision = event["response"]
+        except BaseException:
+            for call in calls:
+                if call:
+                    call[2].cancel()
+            raise
+        finally:
+            if display:
+                display.close()
+        streamed.set()
+
+        self.agent.messages.append(decision.message)
+        if calls:
+            await self.append_tool_results(calls)
+            return await self.interact(use_delegate)
+
+        content = decision.text
+        if use_delegate:
+            return content
+        if content and ("both" in self.agent.options['speech'] or "output" in self.agent.options['speech']):
+            await self.agent.speak(content)
+
+    def dispatch_tool_call(self, tool_call, streamed=None):
+        """
+        Start a tool call in the background, returning None when it is skipped.
+        A call needing confirmation waits for the `streamed` event before asking.
+        """
+        action_name = tool_call.function.name if tool_call.function and tool_call.function.name else ""
+        args = tool_call.function.arguments if tool_call.function and tool_call.function.arguments else ""
+        if (self.agent.memory.last_action == action_name and 
+            self.agent.memory.last_action_status == "failure"):
+            return None  # Skip the repeated action if it previously failed
+
+        prepared = self.prepare_tool_call(args)
+        return (tool_call, action_name, asyncio.ensure_future(self.run_tool_call(action_name, prepared, tool_call.id, streamed)))
+
+    async def append_tool_results(self, calls):
+        """
+        Wait for dispatched tool calls and add their results in the order of the response.
+        """
+        calls = [call for call in calls if call]
+        # Independent tool calls run concurrently
+        results = await asyncio.gather(*[task for _, _, task in calls])
+        for (tool_call, action_name, _), result in zip(calls, results):
+            self.agent.messages.append({
+                "tool_call_id": tool_call.id,
+                "role": "tool",
+                "name": action_name,
+                "content": result
+            })
+
+    def prepare_tool_call(self, args):
+        """
+        Parse the arguments of a tool call and tell whether it needs confirmation.
+        """
+        try:
+            args = json.loads(args)
+            return {"args": args, "confirm": not self.agent.options.get("allow_code_execution")}
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return {"result": str(e)}
+
+    async def confirm_execution(self):
+        """
+        Ask the user whether to execute a tool call, one prompt at a time, in
+        a thread so the event loop goes on. Denied when nobody can answer:
+        the agent is not interactive or stdin is not a terminal.
+        """
+        if not self.agent.options.get("interactive", True) or sys.stdin is None or not sys.stdin.isatty():
+            return False
+        if self.confirm_lock is None:
+            self.confirm_lock = asyncio.Lock()
+        async with self.confirm_lock:
+            answer = await asyncio.get_running_loop().run_in_executor(None, input, "Do you want to execute the code? (y/n): ")
+        return answer.strip().lower() == 'y'
+
+    async def run_tool_call(self, action_name, prepared, tool_call_id=None, streamed=None):
+        if "result" in prepared:
+            return prepared["result"]
+        if prepared["confirm"]:
+            # Prompting while the response streams would mix the prompt into the rendered content
+            if streamed is not None:
+                await streamed.wait()
+            if not await self.confirm_execution():
+                return "Code execution cancelled for current action only"
+        if not self.agent.listeners:
+            return await self.call_action(action_name, prepared["args"])
+
+        await self.agent.emit("tool_started", {"id": tool_call_id, "name": action_name, "arguments": prepared["args"]})
+        start = time.perf_counter()
+        result = await self.call_action(action_name, prepared["args"])
+        await self.agent.emit("tool_finished", {
+            "id": tool_call_id,
+            "name": action_name,
+            "duration": round(time.perf_counter() - start, 4)
+        })
+        return result
+
+    async def call_action(self, action_name, args):
+        try:
+            return await self.agent.act(action_name, args)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return str(e)
+
+
+def prediction_response(message, model):
+    """
+    Build a prediction response from an assistant message dict.
+    """
+    from openai.types.chat import ChatCompletionMessageToolCall
+
+    tool_calls = [ChatCompletionMessageToolCall.model_validate(tool_call) for tool_call in message.get("tool_calls") or []]
+    text = tool_calls if tool_calls else message.get("content") or ""
+    return OpenAIPredictionResponse(text=text, model=model, message=message, other_metadata=None)
+
+
+def build_tool_call(fragment):
+    """
+    Build a tool call object from the fragments accumulated while streaming.
+    """
+    from openai.types.chat import ChatCompletionMessageToolCall
+
+    return ChatCompletionMessageToolCall.model_validate({
+        "id": fragment["id"],
+        "type": "function",
+        "function": {"name": fragment["name"], "arguments": fragment["arguments"]}
+    })
@@ -0,0 +1,180 @@
+import asyncio
+import json
+from collections import defaultdict, deque
+
+from ..utils import ENVIRONMENT_MESSAGE_NAME, SAMPLE_MESSAGE_NAME, message_to_dict
+from .cache import fingerprint
+
+# Content written to cassettes instead of the environment facts, which hold API keys and personal details.
+REDACTED = "[redacted]"
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+class OpenAITransport:
+    def __init__(self, model):
+        """
+        Send requests to the OpenAI API with the model's pooled client.
+        """
+        self.model = model
+
+    async def complete(self, request):
+        return await self.model.client.chat.completions.create(**request)
+
+    async def stream(self, request):
+        response = await self.model.client.chat.completions.create(**request, stream=True)
+        async for chunk in response:
+            yield chunk
+
+
+class RecordTransport:
+    def __init__(self, inner, path):
+        """
+        Forward requests to another transport and append each request/response pair to a JSONL cassette.
+        """
+        self.inner = inner
+        self.path = path
+
+    async def complete(self, request):
+        response = await self.inner.complete(request)
+        self.write(request, {"response": response.model_dump(exclude_none=True)})
+        return response
+
+    async def stream(self, request):
+        chunks = []
+        async for chunk in self.inner.stream(request):
+            chunks.append(chunk.model_dump(exclude_none=True))
+            yield chunk
+        self.write(request, {"chunks": chunks})
+
+    def write(self, request, recorded):
+        request = {key: value for key, value in request.items() if key != "timeout"}
+        entry = {"fingerprint": fingerprint(request), "request": redact(request), **recorded}
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(entry, default=str) + "\n")
+
+
+def redact(request):
+    """
+    Return a copy of a request without the content of the environment messages.
+    Replay matches the fingerprint, computed before redacting.
+    """
+    messages = []
+    for message in map(message_to_dict, request.get("messages") or []):
+        if message.get("name") in (ENVIRONMENT_MESSAGE_NAME, SAMPLE_MESSAGE_NAME):
+            message = {**message, "content": REDACTED}
+        messages.append(message)
+    return {**request, "messages": messages}
+
+
+class ReplayTransport:
+    def __init__(self, path, latency=0.0, chunk_latency=0.0):
+        """
+        Serve responses from a JSONL cassette, matched by request fingerprint.
+
+        Responses recorded for the same fingerprint are served in order, the
+        last one is repeated once they run out. `latency` simulates the time to
+        the first byte and `chunk_latency` the delay between streamed chunks.
+        """
+        self.path = path
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.entries = defaultdict(deque)
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.entries[entry["fingerprint"]].append(entry)
+
+    def match(self, request):
+        key = fingerprint(request)
+        entries = self.entries.get(key)
+        if not entries:
+            raise CassetteMiss(f"No recorded response for request {key} in {self.path}")
+        return entries.popleft() if len(entries) > 1 else entries[0]
+
+    async def complete(self, request):
+        from openai.types.chat import ChatCompletion
+
+        entry = self.match(request)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if "response" in entry:
+            return ChatCompletion.model_validate(entry["response"])
+        return ChatCompletion.model_validate(assemble_chunks(entry["chunks"]))
+
+    async def stream(self, request):
+        from openai.types.chat import ChatCompletionChunk
+
+        entry = self.match(request)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        chunks = entry["chunks"] if "chunks" in entry else [response_chunk(entry["response"])]
+        for chunk in chunks:
+            yield ChatCompletionChunk.model_validate(chunk)
+            if self.chunk_latency:
+                await asyncio.sleep(self.chunk_latency)
+
+
+def create_transport(model, mode=None, cassette=None, latency=0.0):
+    """
+    Return the transport for a mode: None for the API, "record" or "replay" with a cassette path.
+    """
+    if mode in (None, "", "openai"):
+        return OpenAITransport(model)
+    if not cassette:
+        raise ValueError(f"The {mode} transport needs a cassette path")
+    if mode == "record":
+        return RecordTransport(OpenAITransport(model), cassette)
+    if mode == "replay":
+        return ReplayTransport(cassette, latency=latency)
+    raise ValueError(f"Unknown transport: {mode}")
+
+
+def assemble_chunks(chunks):
+    """
+    Rebuild a chat completion from recorded stream chunks.
+    """
+    content = []
+    tool_calls = {}
+    for chunk in chunks:
+        for choice in chunk.get("choices", []):
+            delta = choice.get("delta", {})
+            content.append(delta.get("content") or "")
+            for fragment in delta.get("tool_calls") or []:
+                call = tool_calls.setdefault(fragment["index"], {"id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+                call["id"] = fragment.get("id") or call["id"]
+                function = fragment.get("function") or {}
+                call["function"]["name"] += function.get("name") or ""
+                call["function"]["arguments"] += function.get("arguments") or ""
+
+    message = {"role": "assistant", "content": "".join(content) or None}
+    if tool_calls:
+        message["tool_calls"] = [tool_calls[index] for index in sorted(tool_calls)]
+    first = chunks[0] if chunks else {}
+    return {
+        "id": first.get("id", "replay"),
+        "object": "chat.completion",
+        "created": first.get("created", 0),
+        "model": first.get("model", ""),
+        "choices": [{"index": 0, "finish_reason": "tool_calls" if tool_calls else "stop", "message": message}]
+    }
+
+
+def response_chunk(response):
+    """
+    Turn a recorded chat completion into a single stream chunk.
+    """
+    message = response["choices"][0]["message"]
+    delta = {"role": "assistant", "content": message.get("content")}
+    if message.get("tool_calls"):
+        delta["tool_calls"] = [{"index": index, **tool_call} for index, tool_call in enumerate(message["tool_calls"])]
+    return {
+        "id": response.get("id", "replay"),
+        "object": "chat.completion.chunk",
+        "created": response.get("created", 0),
+        "model": response.get("model", ""),
+        "choices": [{"index": 0, "delta": delta, "finish_reason": response["choices"][0].get("finish_reason")}]
+    }
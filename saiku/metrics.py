@@ -0,0 +1,215 @@
+import json
+import os
+import threading
+import time
+
+# Latency buckets in seconds, from sub-millisecond prompt building to slow model calls.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        A bucketed histogram, with exact count, sum, min and max.
+        """
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percent):
+        """
+        Estimate a percentile by interpolating inside the bucket it falls in.
+        """
+        if not self.count:
+            return None
+        rank = percent / 100 * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                upper = self.max if bound == float("inf") else min(bound, self.max)
+                lower = max(lower, self.min)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            **{f"p{percent}": self.percentile(percent) for percent in PERCENTILES}
+        }
+
+
+class Span:
+    def __init__(self, registry, name, labels):
+        """
+        Time a block and record it in the registry, counting errors separately.
+        """
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            self.registry.increment(f"{self.name}_errors", **self.labels)
+        return False
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class MetricsRegistry:
+    def __init__(self, enabled=True, prefix="saiku"):
+        """
+        Collect timing spans into histograms, plus counters and gauges, keyed by name and labels.
+        """
+        self.enabled = enabled
+        self.prefix = prefix
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def span(self, name, **labels):
+        """
+        Return a context manager timing a block as the `name` histogram, in seconds.
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, labels)
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        if not self.enabled:
+            return
+        self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
+
+    def snapshot(self):
+        """
+        Return every metric as a JSON-serializable dict.
+        """
+        with self.lock:
+            return {
+                "histograms": [
+                    {"name": name, "labels": dict(labels), **histogram.to_dict()}
+                    for (name, labels), histogram in sorted(self.histograms.items())
+                ],
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "gauges": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.gauges.items())
+                ]
+            }
+
+    def prometheus(self):
+        """
+        Render the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            for name, series in group_by_name(self.histograms).items():
+                metric = f"{self.prefix}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for labels, histogram in series:
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{metric}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{metric}_sum{format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{metric}_count{format_labels(labels)} {histogram.count}")
+            for name, series in group_by_name(self.counters).items():
+                metric = f"{self.prefix}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.extend(f"{metric}{format_labels(labels)} {value}" for labels, value in series)
+            for name, series in group_by_name(self.gauges).items():
+                metric = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.extend(f"{metric}{format_labels(labels)} {value}" for labels, value in series)
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """
+        Write a JSON snapshot of the metrics to a file.
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+
+def group_by_name(metrics):
+    grouped = {}
+    for (name, labels), value in sorted(metrics.items()):
+        grouped.setdefault(name, []).append((labels, value))
+    return grouped
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+# The process-wide registry, SAIKU_METRICS=0 turns collection off.
+metrics = MetricsRegistry(enabled=os.environ.get("SAIKU_METRICS", "1") != "0")
+
+
+def span(name, **labels):
+    return metrics.span(name, **labels)
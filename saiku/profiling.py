@@ -0,0 +1,125 @@
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from .utils import cache_dir
+
+
+# The profiler's own allocations are left out of the reports.
+IGNORED_FILES = (tracemalloc.__file__, pstats.__file__, cProfile.__file__, __file__)
+
+
+def default_profile_dir():
+    return cache_dir() / "profiles" / datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+class TurnProfiler:
+    def __init__(self, directory=None, top=25, frames=1):
+        """
+        Profile each interact() turn with cProfile and tracemalloc snapshots.
+
+        Every turn writes `turn-NNNN.prof` (loadable with pstats or snakeviz)
+        and `turn-NNNN.txt` with its hot functions and allocation sites;
+        `close()` writes `summary.txt` aggregated over all turns. cProfile only
+        sees the event loop thread, work handed to executors is not profiled.
+        """
+        self.directory = str(directory or default_profile_dir())
+        self.top = top
+        self.turns = 0
+        self.active = False
+        self.stats = None
+        self.allocations = {}
+        self.durations = []
+        os.makedirs(self.directory, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    @contextmanager
+    def turn(self):
+        # Turns overlap when the server handles several clients, only one can own the profiler
+        if self.active:
+            yield
+            return
+
+        self.active = True
+        self.turns += 1
+        name = os.path.join(self.directory, f"turn-{self.turns:04d}")
+        profile = cProfile.Profile()
+        before = tracemalloc.take_snapshot()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            duration = time.perf_counter() - start
+            after = tracemalloc.take_snapshot()
+            self.active = False
+            self.record(name, profile, before, after, duration)
+
+    def record(self, name, profile, before, after, duration):
+        profile.dump_stats(name + ".prof")
+        ignored = [tracemalloc.Filter(False, filename) for filename in IGNORED_FILES]
+        allocations = after.filter_traces(ignored).compare_to(before.filter_traces(ignored), "lineno")
+        for stat in allocations:
+            site = str(stat.traceback[0])
+            size, count = self.allocations.get(site, (0, 0))
+            self.allocations[site] = (size + stat.size_diff, count + stat.count_diff)
+        self.durations.append(duration)
+
+        stats = pstats.Stats(profile)
+        if self.stats is None:
+            self.stats = stats
+        else:
+            self.stats.add(stats)
+
+        with open(name + ".txt", "w", encoding="utf-8") as file:
+            file.write(f"Turn {self.turns}: {duration * 1000:.1f} ms\n\n")
+            file.write(self.hot_functions(pstats.Stats(profile)))
+            file.write("\nTop allocation sites (size difference over the turn):\n")
+            for stat in allocations[:self.top]:
+                file.write(f"{stat}\n")
+
+    def hot_functions(self, stats):
+        output = io.StringIO()
+        stats.stream = output
+        stats.sort_stats("cumulative").print_stats(self.top)
+        stats.sort_stats("tottime").print_stats(self.top)
+        return output.getvalue()
+
+    def summary(self):
+        """
+        Return the hot functions and allocation sites aggregated over all turns.
+        """
+        lines = [f"{self.turns} turns profiled in {self.directory}"]
+        if self.durations:
+            durations = sorted(self.durations)
+            lines.append(
+                f"Turn duration: mean {sum(durations) / len(durations) * 1000:.1f} ms, "
+                f"max {durations[-1] * 1000:.1f} ms"
+            )
+        lines.append("")
+        if self.stats is not None:
+            lines.append(self.hot_functions(self.stats))
+        lines.append("Top allocation sites (net size over all turns):")
+        sites = sorted(self.allocations.items(), key=lambda item: abs(item[1][0]), reverse=True)
+        for site, (size, count) in sites[:self.top]:
+            lines.append(f"{site}: {size / 1024:+.1f} KiB, {count:+d} blocks")
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        """
+        Write the summary and stop tracing allocations.
+        """
+        path = os.path.join(self.directory, "summary.txt")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.summary())
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        print(f"Profile written to {path}")
+        return path
@@ -0,0 +1,10 @@
+from .scheduler import RequestScheduler, SchedulerBusy
+from .sessions import Session, SessionPool
+from .static import StaticAsset, StaticCache
+from .store import SessionStore
+from .workers import PreforkServer
+
+__all__ = [
+    "PreforkServer", "RequestScheduler", "SchedulerBusy", "Session", "SessionPool",
+    "SessionStore", "StaticAsset", "StaticCache"
+]
@@ -0,0 +1,170 @@
+import asyncio
+import time
+from collections import deque
+
+from ..metrics import metrics
+
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 64
+POLICIES = ("reject", "shed")
+
+
+class SchedulerBusy(Exception):
+    def __init__(self, reason, queue_depth):
+        super().__init__(f"Server busy: {reason}")
+        self.reason = reason
+        self.queue_depth = queue_depth
+
+
+class Job:
+    def __init__(self, run, key=None, notify=None):
+        """
+        A queued request: `run` is called with no arguments and awaited by a worker.
+        `notify(position, depth)` is awaited when the job's queue position changes.
+        """
+        self.run = run
+        self.key = key
+        self.notify = notify
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+
+
+class RequestScheduler:
+    def __init__(self, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE, policy="reject"):
+        """
+        Run requests on a fixed number of workers, holding the rest in a bounded FIFO queue.
+
+        Requests with the same key, e.g. from one client, run one at a time:
+        the next one stays in the queue, without taking a worker, until the
+        running one is done, and workers pick up other keys meanwhile.
+
+        When the queue is full, the "reject" policy refuses the new request and
+        the "shed" policy drops the oldest waiting one to make room for it.
+        Either way the refused request fails with `SchedulerBusy`.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.workers = workers
+        self.queue_size = queue_size
+        self.policy = policy
+        self.queue = deque()
+        self.available = None
+        self.tasks = []
+        self.active = 0
+        # Keys with a request running
+        self.running = set()
+
+    @property
+    def depth(self):
+        return len(self.queue)
+
+    def start(self):
+        """
+        Start the workers on the running event loop.
+        """
+        if not self.tasks:
+            self.available = asyncio.Semaphore(0)
+            loop = asyncio.get_running_loop()
+            self.tasks = [loop.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """
+        Stop the workers and fail the requests still waiting.
+        """
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        while self.queue:
+            self.queue.popleft().future.cancel()
+        self.record_depth()
+
+    async def submit(self, run, key=None, notify=None):
+        """
+        Queue a request and return its result once a worker has run it.
+        """
+        self.start()
+        job = Job(run, key, notify)
+        if len(self.queue) >= self.queue_size:
+            if self.policy == "reject" or not self.queue:
+                metrics.increment("scheduler_rejected", reason="queue_full")
+                raise SchedulerBusy("queue_full", len(self.queue))
+            shed = self.queue.popleft()
+            metrics.increment("scheduler_rejected", reason="shed")
+            shed.future.set_exception(SchedulerBusy("shed", len(self.queue)))
+        else:
+            self.available.release()
+
+        self.queue.append(job)
+        self.record_depth()
+        # Tell the client it is waiting, unless a worker is free to pick it up
+        if self.active + len(self.queue) > self.workers or (key is not None and key in self.running):
+            await self.notify_positions()
+        return await job.future
+
+    def cancel(self, key):
+        """
+        Drop the waiting requests of a key, e.g. when a client disconnects.
+        """
+        for job in [job for job in self.queue if job.key == key]:
+            self.queue.remove(job)
+            job.future.cancel()
+        self.record_depth()
+
+    async def notify_positions(self):
+        depth = len(self.queue)
+        for position, job in enumerate(list(self.queue), start=1):
+            if job.notify is None:
+                continue
+            try:
+                await job.notify(position, depth)
+            except Exception as error:
+                print(f"Error while notifying queue position: {error}")
+
+    def record_depth(self):
+        metrics.set_gauge("scheduler_queue_depth", len(self.queue))
+        metrics.set_gauge("scheduler_active_workers", self.active)
+
+    def next_job(self):
+        """
+        Remove and return the oldest waiting job whose key has nothing running, or None.
+        """
+        for job in self.queue:
+            if job.key is None or job.key not in self.running:
+                self.queue.remove(job)
+                return job
+        return None
+
+    async def _work(self):
+        while True:
+            await self.available.acquire()
+            # Cancelled jobs leave the semaphore ahead of the queue, and jobs
+            # whose key is running are left for the worker that finishes it
+            job = self.next_job()
+            if job is None or job.future.done():
+                continue
+            if job.key is not None:
+                self.running.add(job.key)
+            metrics.observe("scheduler_wait", time.monotonic() - job.enqueued)
+            self.active += 1
+            self.record_depth()
+            if self.queue:
+                asyncio.ensure_future(self.notify_positions())
+            try:
+                result = await job.run()
+                if not job.future.done():
+                    job.future.set_result(result)
+            except asyncio.CancelledError:
+                job.future.cancel()
+                raise
+            except Exception as error:
+                if not job.future.done():
+                    job.future.set_exception(error)
+            finally:
+                self.active -= 1
+                if job.key is not None:
+                    self.running.discard(job.key)
+                    # A job of this key may have been passed over, wake a worker for it
+                    if any(waiting.key == job.key for waiting in self.queue):
+                        self.available.release()
+                self.record_depth()
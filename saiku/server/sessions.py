@@ -0,0 +1,209 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from ..metrics import metrics
+
+DEFAULT_MAX_SESSIONS = 100
+DEFAULT_IDLE_TIMEOUT = 30 * 60
+
+
+class SessionLimitReached(Exception):
+    def __init__(self, max_sessions):
+        super().__init__(f"All {max_sessions} sessions are busy")
+        self.max_sessions = max_sessions
+
+
+class Session:
+    def __init__(self, session_id, agent):
+        """
+        A client's conversation, with its own agent. Turns of a session run one at a time.
+        """
+        self.id = session_id
+        self.agent = agent
+        # Sequence number of the last client message applied, and the reply it got
+        self.seq = 0
+        self.last_reply = None
+        self.lock = asyncio.Lock()
+        # Set when the client went away during a turn, the session closes once the turn is over
+        self.closing = False
+        self.created = time.monotonic()
+        self.last_used = self.created
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    def restore(self, state):
+        """
+        Replace the session's conversation with a stored state.
+        """
+        self.agent.messages = state["messages"]
+        self.agent.memory.clear()
+        self.agent.memory.update(state["memory"])
+        self.seq = state["seq"]
+        self.last_reply = state["last_reply"]
+
+    @property
+    def busy(self):
+        return self.lock.locked()
+
+
+class SessionPool:
+    def __init__(self, agent, max_sessions=DEFAULT_MAX_SESSIONS, idle_timeout=DEFAULT_IDLE_TIMEOUT, sweep_interval=60, store=None):
+        """
+        Keep a bounded set of sessions, each with an agent spawned from `agent`.
+
+        The least recently used idle session is evicted when the pool is full,
+        and sessions unused for `idle_timeout` seconds are closed by a
+        background sweep. Busy sessions are never evicted, so a new session
+        is refused with `SessionLimitReached` when every session is busy.
+
+        With a `store`, see `SessionStore`, sessions are saved after each turn
+        and sessions unknown to this process are resumed from it.
+        """
+        self.agent = agent
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.sessions = OrderedDict()
+        self.store = store
+        self.task = None
+        # Closes waiting for a turn to finish
+        self.pending = set()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self.sessions
+
+    async def get(self, session_id):
+        """
+        Return the session with this id, creating it if needed.
+        Raises `SessionLimitReached` when the pool is full of busy sessions.
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            await self.make_room()
+            # Another request may have created it while room was made
+            session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = Session(session_id, self.agent.spawn())
+            metrics.increment("sessions_created")
+            metrics.set_gauge("sessions", len(self.sessions))
+        else:
+            self.sessions.move_to_end(session_id)
+            session.closing = False
+        self.sync(session)
+        session.touch()
+        return session
+
+    def sync(self, session):
+        """
+        Load the stored state of a session when another process has moved it further.
+        """
+        if self.store is None or session.busy or self.store.seq(session.id) <= session.seq:
+            return
+        state = self.store.load(session.id)
+        if state is not None:
+            session.restore(state)
+            metrics.increment("sessions_restored")
+
+    def save(self, session):
+        if self.store is not None:
+            self.store.save(session)
+
+    def find(self, session_id):
+        """
+        Return the session with this id, or None if it does not exist (anymore).
+        """
+        session = self.sessions.get(session_id)
+        if session is None and self.store is not None and self.store.seq(session_id):
+            # Resumed from the store, e.g. after reconnecting to another worker
+            session = self.sessions[session_id] = Session(session_id, self.agent.spawn())
+            metrics.set_gauge("sessions", len(self.sessions))
+        if session is not None:
+            self.sessions.move_to_end(session_id)
+            self.sync(session)
+            session.touch()
+        return session
+
+    async def make_room(self):
+        while len(self.sessions) >= self.max_sessions:
+            idle = next((session for session in self.sessions.values() if not session.busy), None)
+            if idle is None:
+                metrics.increment("sessions_refused")
+                raise SessionLimitReached(self.max_sessions)
+            await self.close(idle.id, reason="evicted")
+
+    async def close(self, session_id, reason="closed"):
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return
+        metrics.increment("sessions_closed", reason=reason)
+        metrics.set_gauge("sessions", len(self.sessions))
+        await session.agent.close()
+
+    async def release(self, session_id):
+        """
+        Close a session whose client went away, after its running turn when there is one.
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            return
+        if not session.busy:
+            await self.close(session_id)
+            return
+        session.closing = True
+        task = asyncio.ensure_future(self.close_after_turn(session))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def close_after_turn(self, session):
+        # The lock is handed over in order, this runs once the current turn releases it
+        async with session.lock:
+            if session.closing and self.sessions.get(session.id) is session:
+                await self.close(session.id)
+
+    async def evict_idle(self):
+        """
+        Close the sessions that have not been used for `idle_timeout` seconds.
+        """
+        deadline = time.monotonic() - self.idle_timeout
+        for session in list(self.sessions.values()):
+            if session.last_used < deadline and not session.busy:
+                await self.close(session.id, reason="idle")
+
+    def start(self):
+        """
+        Start the idle sweep on the running event loop.
+        """
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._run())
+        return self.task
+
+    async def stop(self):
+        """
+        Stop the idle sweep and close every session.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        for task in list(self.pending):
+            task.cancel()
+        await asyncio.gather(*self.pending, return_exceptions=True)
+        for session_id in list(self.sessions):
+            await self.close(session_id)
+        if self.store is not None:
+            self.store.close()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            await self.evict_idle()
+            if self.store is not None:
+                self.store.prune()
@@ -0,0 +1,135 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:  # Assets are only pre-compressed with gzip.
+    brotli = None
+
+# How often, in seconds, a file is checked for changes.
+CHECK_INTERVAL = 1.0
+# Smaller bodies are not worth compressing.
+MIN_COMPRESS_SIZE = 512
+
+
+class StaticAsset:
+    def __init__(self, path=None, content=None, content_type=None, check_interval=CHECK_INTERVAL):
+        """
+        A file, or in-memory content, held in memory with its gzip and brotli
+        encodings and served with ETag/Last-Modified validation. A file is
+        reloaded when its modification time or size change.
+        """
+        self.path = str(path) if path else None
+        self.content_type = content_type or (mimetypes.guess_type(self.path)[0] if self.path else None) or 'text/html'
+        self.check_interval = check_interval
+        self.checked = 0.0
+        self.stat = None
+        if self.path:
+            self.reload()
+        else:
+            self.load(content.encode('utf-8') if isinstance(content, str) else content or b'', time.time())
+
+    def load(self, body, modified):
+        self.body = body
+        self.etag = 'W/"' + hashlib.sha1(body).hexdigest() + '"'
+        # HTTP dates have a one second resolution
+        self.modified = int(modified)
+        self.last_modified = formatdate(self.modified, usegmt=True)
+        self.encodings = {}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            self.encodings['gzip'] = gzip.compress(body, compresslevel=9)
+            if brotli is not None:
+                self.encodings['br'] = brotli.compress(body)
+
+    def reload(self):
+        stat = os.stat(self.path)
+        with open(self.path, 'rb') as file:
+            body = file.read()
+        self.stat = (stat.st_mtime_ns, stat.st_size)
+        self.load(body, stat.st_mtime)
+
+    def refresh(self):
+        """
+        Reload the file if it changed, checking at most every `check_interval` seconds.
+        """
+        if not self.path:
+            return
+        now = time.monotonic()
+        if now - self.checked < self.check_interval:
+            return
+        self.checked = now
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return  # Keep serving the last version
+        if (stat.st_mtime_ns, stat.st_size) != self.stat:
+            self.reload()
+
+    def not_modified(self, request):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            # Weak comparison, the same tag is used for every encoding
+            return '*' in tags or self.etag in tags or self.etag[2:] in tags
+        if_modified_since = request.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= self.modified
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def encoding(self, request):
+        accepted = request.headers.get('Accept-Encoding', '')
+        accepted = {part.split(';')[0].strip() for part in accepted.split(',')}
+        for encoding in ('br', 'gzip'):
+            if encoding in accepted and encoding in self.encodings:
+                return encoding
+        return None
+
+    def response(self, request):
+        """
+        Return the response to a GET or HEAD request, 304 when the client's copy is current.
+        """
+        self.refresh()
+        headers = {
+            'ETag': self.etag,
+            'Last-Modified': self.last_modified,
+            # Clients keep the asset but revalidate it, which is a cheap 304 when unchanged
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding'
+        }
+        if self.not_modified(request):
+            return web.Response(status=304, headers=headers)
+
+        encoding = self.encoding(request)
+        body = self.body
+        if encoding:
+            headers['Content-Encoding'] = encoding
+            body = self.encodings[encoding]
+        charset = 'utf-8' if self.content_type.startswith('text/') else None
+        return web.Response(body=body, headers=headers, content_type=self.content_type, charset=charset)
+
+
+class StaticCache:
+    def __init__(self):
+        """
+        The assets loaded so far, by path, shared by every server of the process.
+        """
+        self.assets = {}
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        asset = self.assets.get(path)
+        if asset is None:
+            asset = self.assets[path] = StaticAsset(path)
+        return asset
+
+
+assets = StaticCache()
@@ -0,0 +1,67 @@
+import json
+import os
+import sqlite3
+import time
+import zlib
+
+from ..utils import cache_dir, message_to_dict
+
+DEFAULT_TTL = 7 * 24 * 3600
+
+
+def default_store_path():
+    return cache_dir() / "sessions.sqlite"
+
+
+class SessionStore:
+    def __init__(self, path=None, ttl=DEFAULT_TTL):
+        """
+        Session state, messages, memory and sequence number, kept in SQLite so
+        that every worker process of a server can resume any conversation.
+        Open one store per process, after forking.
+        """
+        self.path = str(path or default_store_path())
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path, isolation_level=None, timeout=10, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, seq INTEGER NOT NULL, state BLOB NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def seq(self, session_id):
+        """
+        Return the sequence number of a stored session, 0 when it is not stored.
+        """
+        row = self.db.execute("SELECT seq FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def load(self, session_id):
+        row = self.db.execute("SELECT state FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def save(self, session):
+        state = {
+            "seq": session.seq,
+            "messages": [message_to_dict(message) for message in session.agent.messages],
+            "memory": dict(session.agent.memory),
+            "last_reply": session.last_reply
+        }
+        blob = zlib.compress(json.dumps(state, separators=(",", ":"), default=str).encode("utf-8"))
+        self.db.execute(
+            "INSERT OR REPLACE INTO sessions (id, seq, state, updated) VALUES (?, ?, ?, ?)",
+            (session.id, session.seq, blob, time.time())
+        )
+
+    def prune(self):
+        """
+        Delete the sessions not updated for `ttl` seconds.
+        """
+        if self.ttl is not None:
+            self.db.execute("DELETE FROM sessions WHERE updated < ?", (time.time() - self.ttl,))
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,96 @@
+import os
+import signal
+import socket
+import sys
+import time
+
+# Workers that exit sooner than this after starting are not restarted, they would likely fail again.
+MIN_UPTIME = 5.0
+
+
+def bind_socket(host, port, backlog=1024):
+    """
+    Create the listening socket shared by every worker.
+    """
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+class PreforkServer:
+    def __init__(self, workers, host, port, run_worker):
+        """
+        Bind one socket, then fork `workers` processes that all accept on it.
+
+        `run_worker(sock, index)` runs in each child and must serve until it is
+        told to stop. A client's connection, and so a websocket-only socket.io
+        session, stays on the worker that accepted it. Workers that crash are
+        restarted. SIGINT and SIGTERM are forwarded to the workers.
+        """
+        if not hasattr(os, 'fork'):
+            raise RuntimeError("Multiple workers need os.fork, which this platform does not provide")
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.run_worker = run_worker
+        self.children = {}
+        self.stopping = False
+        self.sock = None
+
+    def spawn(self, index):
+        pid = os.fork()
+        if pid == 0:
+            # The child exits on SIGTERM through SystemExit, so its cleanup still runs
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            code = 0
+            try:
+                self.run_worker(self.sock, index)
+            except (KeyboardInterrupt, SystemExit):
+                pass
+            except BaseException as error:
+                print(f"Worker {index} failed: {error}", file=sys.stderr)
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        self.children[pid] = (index, time.monotonic())
+        return pid
+
+    def stop(self, signum=signal.SIGTERM, frame=None):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def serve(self):
+        self.sock = bind_socket(self.host, self.port)
+        print(f"Serving on http://{self.host}:{self.port} with {self.workers} workers", flush=True)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        for index in range(self.workers):
+            self.spawn(index)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            index, started = self.children.pop(pid, (None, 0))
+            if index is None or self.stopping:
+                continue
+            if time.monotonic() - started < MIN_UPTIME:
+                print(f"Worker {index} exited right after starting, not restarting it", file=sys.stderr)
+                continue
+            print(f"Worker {index} exited with status {status}, restarting it", file=sys.stderr)
+            self.spawn(index)
+        self.sock.close()
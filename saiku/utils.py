@@ -0,0 +1,25 @@
+import os
+import pathlib
+
+# Name of the system message carrying stable environment facts: OS, architecture, user, API services...
+ENVIRONMENT_MESSAGE_NAME = "environment"
+# Name of the trailing system message carrying volatile facts sampled each turn.
+SAMPLE_MESSAGE_NAME = "environment_sample"
+
+
+def message_to_dict(message):
+    """
+    Convert a chat message, e.g. an OpenAI ChatCompletionMessage, to a plain dict.
+    """
+    if message is None or isinstance(message, dict):
+        return message
+    if hasattr(message, 'model_dump'):
+        return message.model_dump(exclude_none=True)
+    return dict(message)
+
+
+def cache_dir():
+    """
+    Return the directory where saiku keeps its caches.
+    """
+    return pathlib.Path(os.environ.get('SAIKU_CACHE_DIR', pathlib.Path.home() / '.cache' / 'saiku'))
@@ -0,0 +1,127 @@
+import os
+
+import pytest
+
+from saiku.llms import cache as cache_module
+from saiku.llms.cache import ResponseCache, fingerprint, is_deterministic
+from saiku.utils import SAMPLE_MESSAGE_NAME
+
+REQUEST = {
+    'model': 'gpt-4',
+    'temperature': 0,
+    'messages': [{'role': 'system', 'content': 'Be brief.'}, {'role': 'user', 'content': 'Hello'}]
+}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def make_cache(tmp_path, monkeypatch):
+    monkeypatch.delenv('SAIKU_LLM_CACHE_BYPASS', raising=False)
+    caches = []
+
+    def make(**options):
+        cache = ResponseCache(tmp_path / 'responses.sqlite', **options)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        cache.close()
+
+
+def value(index):
+    # Random text does not compress, so every entry has about the same size
+    return {'index': index, 'content': os.urandom(512).hex()}
+
+
+def test_only_deterministic_requests_are_cached(make_cache):
+    cache = make_cache()
+    assert is_deterministic(REQUEST)
+    assert cache.key(REQUEST) == fingerprint(REQUEST)
+    assert cache.key({**REQUEST, 'temperature': 0.7}) is None
+    assert cache.key({key: item for key, item in REQUEST.items() if key != 'temperature'}) is None
+    assert cache.key({**REQUEST, 'n': 2}) is None
+    assert cache.stats['skips'] == 3
+
+
+def test_cache_flag_forces_or_bypasses(make_cache, monkeypatch):
+    cache = make_cache()
+    assert cache.key({**REQUEST, 'temperature': 0.7, 'cache': True}) is not None
+    assert cache.key({**REQUEST, 'cache': False}) is None
+
+    monkeypatch.setenv('SAIKU_LLM_CACHE_BYPASS', '1')
+    assert make_cache().key(REQUEST) is None
+
+
+def test_fingerprint_leaves_out_the_environment_sample_and_transport_fields():
+    sample = {'role': 'system', 'name': SAMPLE_MESSAGE_NAME, 'content': '{"cwd": "/tmp"}'}
+    request = {**REQUEST, 'messages': REQUEST['messages'] + [sample], 'stream': True, 'timeout': 10}
+    assert fingerprint(request) == fingerprint(REQUEST)
+    assert fingerprint({**REQUEST, 'model': 'gpt-3.5-turbo'}) != fingerprint(REQUEST)
+
+
+def test_get_returns_what_was_set(make_cache, clock):
+    cache = make_cache()
+    key = cache.key(REQUEST)
+    assert cache.get(key) is None
+    cache.set(key, {'content': 'Hi'})
+    assert cache.get(key) == {'content': 'Hi'}
+    assert cache.stats['hits'] == 1 and cache.stats['misses'] == 1
+
+
+def test_entries_expire_after_the_ttl(make_cache, clock):
+    cache = make_cache(ttl=60)
+    cache.set('key', {'content': 'Hi'})
+    clock.now += 59
+    assert cache.get('key') == {'content': 'Hi'}
+    clock.now += 2
+    assert cache.get('key') is None
+    assert cache.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 0
+
+
+def test_no_ttl_never_expires(make_cache, clock):
+    cache = make_cache(ttl=None)
+    cache.set('key', {'content': 'Hi'})
+    clock.now += 365 * 24 * 3600
+    assert cache.get('key') == {'content': 'Hi'}
+
+
+def test_least_recently_used_entries_are_evicted(make_cache, clock):
+    cache = make_cache(max_bytes=10 ** 9)
+    cache.set('probe', value(0))
+    size = cache.db.execute("SELECT size FROM responses").fetchone()[0]
+    cache.clear()
+
+    # Room for three entries, not four
+    cache.max_bytes = int(size * 3.5)
+    for index, key in enumerate(('a', 'b', 'c')):
+        clock.now += 1
+        cache.set(key, value(index))
+    clock.now += 1
+    # Reading 'a' makes 'b' the least recently used
+    assert cache.get('a') is not None
+    clock.now += 1
+    cache.set('d', value(3))
+
+    assert cache.stats['evictions'] == 1
+    assert cache.get('b') is None
+    assert all(cache.get(key) is not None for key in ('a', 'c', 'd'))
+
+
+def test_entries_persist_across_instances(make_cache):
+    make_cache().set('key', {'content': 'Hi'})
+    assert make_cache().get('key') == {'content': 'Hi'}
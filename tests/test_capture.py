@@ -0,0 +1,60 @@
+import os
+
+from saiku.execution.capture import OutputCapture
+
+LINES = [f"line {index:04d}\n" for index in range(1000)]
+
+
+def capture(tmp_path, **options):
+    output = OutputCapture(spill_dir=tmp_path, **options)
+    for line in LINES:
+        output.append(line)
+    return output
+
+
+def test_output_within_the_budget_is_kept_whole(tmp_path):
+    output = capture(tmp_path, max_bytes=None, max_tokens=None)
+    assert output.text() == ''.join(LINES)
+    assert not output.truncated
+    assert os.listdir(tmp_path) == []
+
+
+def test_output_past_the_budget_keeps_head_tail_and_spills(tmp_path):
+    output = capture(tmp_path, max_bytes=1024, max_tokens=None)
+    text = output.text()
+    head, marker, tail = text.partition('\n... [')
+
+    total = len(''.join(LINES))
+    assert output.truncated
+    assert head.startswith(LINES[0]) and head.endswith(LINES[50])
+    assert tail.endswith(LINES[-1])
+    assert f"{output.omitted_bytes} of {total} bytes omitted" in tail
+    assert 0 < output.omitted_bytes < total
+    assert len(head.encode('utf-8')) + output.tail_bytes <= 1024
+    assert LINES[500] not in text
+
+    # The whole output is in the spill file named in the marker
+    assert f"the full output is in {output.spill_path}" in tail
+    assert os.path.dirname(output.spill_path) == str(tmp_path)
+    with open(output.spill_path, encoding='utf-8') as file:
+        assert file.read() == ''.join(LINES)
+
+
+def test_token_budget_is_applied_on_close(tmp_path):
+    output = capture(tmp_path, max_bytes=None, max_tokens=600, count_tokens=len)
+    text = output.text()
+    assert output.truncated
+    assert len(text) <= 600
+    assert 'bytes omitted' in text
+    assert text.startswith(LINES[0]) and text.endswith(LINES[-1])
+    with open(output.spill_path, encoding='utf-8') as file:
+        assert file.read() == ''.join(LINES)
+
+
+def test_derived_captures_do_not_spill(tmp_path):
+    output = OutputCapture(max_bytes=64, max_tokens=None, spill_dir=tmp_path).derive()
+    for line in LINES:
+        output.append(line)
+    assert output.truncated and output.spill_path is None
+    assert 'the full output is in' not in output.text()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,45 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# Seconds `saikupy --help` may take on top of a bare interpreter start.
+HELP_BUDGET = float(os.environ.get('SAIKU_HELP_BUDGET', '0.5'))
+HEAVY_MODULES = ['openai', 'httpx', 'rich', 'pygame', 'psutil', 'aiohttp', 'socketio', 'saiku.agents.agent']
+
+RUN_HELP = """
+import json, runpy, sys
+sys.argv = ['saikupy'] + sys.argv[1:]
+try:
+    runpy.run_path('bin/cli.py', run_name='__main__')
+except SystemExit:
+    pass
+print(json.dumps(sorted(sys.modules)), file=sys.stderr)
+"""
+
+
+def run(*args):
+    env = {**os.environ, 'PYTHONPATH': str(ROOT)}
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True)
+    return result, time.perf_counter() - start
+
+
+def best_of(runs, *args):
+    return min(run(*args)[1] for _ in range(runs))
+
+
+def test_help_lists_commands_without_importing_them():
+    result, _ = run('-c', RUN_HELP, '--help')
+    assert 'serve' in result.stdout
+    modules = set(json.loads(result.stderr.strip().splitlines()[-1]))
+    assert [module for module in HEAVY_MODULES if module in modules] == []
+
+
+def test_help_within_budget():
+    interpreter = best_of(3, '-c', 'pass')
+    elapsed = best_of(3, 'bin/cli.py', '--help')
+    assert elapsed - interpreter < HELP_BUDGET, f"--help took {elapsed - interpreter:.3f}s over interpreter startup"
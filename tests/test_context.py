@@ -0,0 +1,132 @@
+from saiku.agents.context import MESSAGE_OVERHEAD_TOKENS, ContextWindow, TokenCounter
+
+
+class CharCounter(TokenCounter):
+    """
+    One token per character, so budgets are easy to reason about.
+    """
+    def __init__(self):
+        super().__init__()
+        self.encoding = None
+
+    def encode(self, text):
+        return list(text)
+
+    def decode(self, tokens):
+        return ''.join(tokens)
+
+    def count_text(self, text):
+        return len(text)
+
+
+SYSTEM = {'role': 'system', 'content': 'Be brief.'}
+
+
+def user(text):
+    return {'role': 'user', 'content': text}
+
+
+def tool_call(call_id):
+    return {'role': 'assistant', 'content': None, 'tool_calls': [{'id': call_id, 'type': 'function', 'function': {'name': 'f', 'arguments': '{}'}}]}
+
+
+def tool_reply(call_id, text):
+    return {'role': 'tool', 'tool_call_id': call_id, 'content': text}
+
+
+def window(max_tokens):
+    return ContextWindow(max_tokens=max_tokens, reserve_tokens=0, counter=CharCounter())
+
+
+def cost(context, messages):
+    return sum(context.counter.count(message) for message in messages)
+
+
+def test_everything_is_kept_within_the_budget():
+    context = window(1000)
+    messages = [SYSTEM, user('one'), user('two')]
+    trailing = [{'role': 'system', 'name': 'environment_sample', 'content': '{}'}]
+    assert context.fit(messages, trailing=trailing) == messages + trailing
+    assert context.stats['last_tokens'] == cost(context, messages + trailing)
+    assert context.stats['dropped_messages'] == 0
+
+
+def test_oldest_messages_are_dropped_first():
+    context = window(1000)
+    messages = [SYSTEM] + [user(str(index) * 100) for index in range(20)]
+    selected = context.fit(messages)
+    assert selected[0] == SYSTEM
+    # The oldest message kept may be compressed, the newer ones are whole
+    assert selected[2:] == messages[-(len(selected) - 2):]
+    assert cost(context, selected) <= 1000
+    assert context.stats['dropped_messages'] == len(messages) - len(selected)
+
+
+def test_trailing_messages_count_against_the_budget():
+    messages = [SYSTEM] + [user(str(index) * 100) for index in range(20)]
+    without = window(1000).fit(messages)
+    context = window(1000)
+    trailing = [{'role': 'system', 'content': 'x' * 300}]
+    selected = context.fit(messages, trailing=trailing)
+    assert selected[-1] == trailing[0]
+    assert len(selected) - 1 < len(without)
+    assert cost(context, selected) <= 1000
+
+
+def test_tool_calls_and_their_replies_stay_together():
+    call = [tool_call('a'), tool_reply('a', 'r' * 200), tool_reply('a', 'r' * 200)]
+    messages = [SYSTEM, user('question')] + call + [user('next')]
+    context = window(cost(window(0), [SYSTEM, user('next')] + call) + 10)
+    selected = context.fit(messages)
+    # The question does not fit, the whole group does
+    assert selected == [SYSTEM] + call + [user('next')]
+
+    # Short of room, the group is compressed as a whole
+    context = window(cost(context, [SYSTEM, user('next'), call[0]]) + 100)
+    selected = context.fit(messages)
+    assert [message['role'] for message in selected] == ['system', 'assistant', 'tool', 'tool', 'user']
+    assert all('tokens omitted' in message['content'] for message in selected[2:4])
+    assert cost(context, selected) <= context.max_tokens
+
+    # Without room for its overhead, none of it is sent
+    context = window(cost(context, [SYSTEM, user('next')]) + MESSAGE_OVERHEAD_TOKENS * len(call))
+    selected = context.fit(messages)
+    assert selected == [SYSTEM, user('next')]
+    assert context.stats['dropped_messages'] == len(call) + 1
+
+
+def test_replies_without_their_tool_call_are_left_out():
+    messages = [SYSTEM, tool_reply('a', 'orphan'), user('question')]
+    assert window(1000).fit(messages) == [SYSTEM, user('question')]
+
+
+def test_newest_message_is_compressed_to_fit():
+    context = window(500)
+    long = 'head ' + 'x' * 5000 + ' tail'
+    selected = context.fit([SYSTEM, user('old'), user(long)])
+    assert selected[0] == SYSTEM and len(selected) == 2
+    content = selected[1]['content']
+    assert content.startswith('head ') and content.endswith(' tail')
+    assert 'tokens omitted' in content
+    # Measured with the window's counter, the compressed message fits
+    assert cost(context, selected) <= 500
+    assert context.stats['compressed_messages'] == 1
+    assert context.stats['dropped_messages'] == 1
+
+
+def test_older_group_is_compressed_when_it_fits_once_shortened():
+    context = window(600)
+    older = user('a' * 2000)
+    newest = user('question')
+    selected = context.fit([SYSTEM, older, newest])
+    assert selected[-1] == newest
+    assert len(selected) == 3 and 'tokens omitted' in selected[1]['content']
+    assert cost(context, selected) <= 600
+    assert context.stats['compressed_messages'] == 1
+
+
+def test_old_group_is_dropped_without_room_for_its_overhead():
+    context = window(cost(window(0), [SYSTEM, user('question')]) + MESSAGE_OVERHEAD_TOKENS)
+    selected = context.fit([SYSTEM, user('a' * 2000), user('question')])
+    assert selected == [SYSTEM, user('question')]
+    assert context.stats['dropped_messages'] == 1
@@ -0,0 +1,95 @@
+import asyncio
+import importlib.util
+import os
+import time
+
+import pytest
+
+from saiku.agents.executor import ActionExecutor, ActionTimeout
+from saiku.interfaces.action import Action
+
+CPU_ACTION = '''
+import os
+from saiku.interfaces.action import Action
+
+
+class CountAction(Action):
+    execution = 'cpu'
+
+    @staticmethod
+    def execute(args):
+        return sum(range(args['n'])), os.getpid()
+'''
+
+
+class SleepAction(Action):
+    name = 'sleep'
+    execution = 'blocking'
+
+    def execute(self, args):
+        time.sleep(args['seconds'])
+        return 'slept'
+
+
+class FakeAgent:
+    def __init__(self, executor):
+        self.executor = executor
+
+
+def load_action(path, class_name):
+    # Action modules are loaded by path, as the registry does
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, class_name)
+
+
+def run(coroutine_function):
+    executor = ActionExecutor(threads=2)
+    try:
+        return asyncio.run(coroutine_function(FakeAgent(executor)))
+    finally:
+        executor.shutdown()
+
+
+def test_blocking_action_does_not_block_the_loop():
+    async def main(agent):
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.ensure_future(tick())
+        results = await asyncio.gather(SleepAction(agent).run({'seconds': 0.3}), SleepAction(agent).run({'seconds': 0.3}))
+        ticker.cancel()
+        return results, ticks
+
+    results, ticks = run(main)
+    assert results == ['slept', 'slept']
+    assert ticks >= 10
+
+
+def test_blocking_action_timeout():
+    async def main(agent):
+        action = SleepAction(agent)
+        action.timeout = 0.1
+        await action.run({'seconds': 1})
+
+    with pytest.raises(ActionTimeout):
+        run(main)
+
+
+def test_cpu_action_runs_in_a_worker_process(tmp_path):
+    path = tmp_path / 'count.py'
+    path.write_text(CPU_ACTION)
+    action_class = load_action(path, 'CountAction')
+
+    async def main(agent):
+        return await action_class(agent).run({'n': 1000})
+
+    total, pid = run(main)
+    assert total == sum(range(1000))
+    assert pid != os.getpid()
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from saiku.server.scheduler import RequestScheduler, SchedulerBusy
+
+
+def run(main, **options):
+    async def wrapper():
+        scheduler = RequestScheduler(**options)
+        try:
+            return await main(scheduler)
+        finally:
+            await scheduler.stop()
+
+    return asyncio.run(wrapper())
+
+
+def test_requests_of_one_key_run_in_order_one_at_a_time():
+    async def main(scheduler):
+        events = []
+
+        def job(name):
+            async def run_job():
+                events.append(('start', name))
+                await asyncio.sleep(0.02)
+                events.append(('end', name))
+                return name
+            return run_job
+
+        results = await asyncio.gather(*(scheduler.submit(job(name), key='a') for name in (1, 2, 3)))
+        return results, events
+
+    results, events = run(main, workers=3)
+    assert results == [1, 2, 3]
+    assert events == [('start', 1), ('end', 1), ('start', 2), ('end', 2), ('start', 3), ('end', 3)]
+
+
+def test_requests_of_different_keys_overlap():
+    async def main(scheduler):
+        started = {'a': asyncio.Event(), 'b': asyncio.Event()}
+
+        def job(key, other):
+            async def run_job():
+                started[key].set()
+                # Only returns if the other key's request runs at the same time
+                await asyncio.wait_for(started[other].wait(), 1)
+                return key
+            return run_job
+
+        return await asyncio.gather(scheduler.submit(job('a', 'b'), key='a'), scheduler.submit(job('b', 'a'), key='b'))
+
+    assert run(main, workers=2) == ['a', 'b']
+
+
+def test_waiting_request_of_a_busy_key_does_not_take_a_worker():
+    async def main(scheduler):
+        release = asyncio.Event()
+
+        async def blocked():
+            await release.wait()
+            return 'first'
+
+        async def quick():
+            return 'quick'
+
+        first = asyncio.ensure_future(scheduler.submit(blocked, key='a'))
+        second = asyncio.ensure_future(scheduler.submit(quick, key='a'))
+        # The second worker is free for another key while 'a' is running
+        other = await asyncio.wait_for(scheduler.submit(quick, key='b'), 1)
+        assert not second.done()
+        release.set()
+        return await first, await second, other
+
+    assert run(main, workers=2) == ('first', 'quick', 'quick')
+
+
+def test_cancel_drops_the_waiting_requests_of_a_key():
+    async def main(scheduler):
+        release = asyncio.Event()
+
+        async def blocked():
+            await release.wait()
+            return 'running'
+
+        async def never():
+            raise AssertionError('a cancelled request ran')
+
+        running = asyncio.ensure_future(scheduler.submit(blocked, key='a'))
+        waiting = asyncio.ensure_future(scheduler.submit(never, key='a'))
+        await asyncio.sleep(0.01)
+        scheduler.cancel('a')
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        return await running, scheduler.depth
+
+    assert run(main, workers=1) == ('running', 0)
+
+
+def test_full_queue_rejects_or_sheds():
+    async def main(scheduler):
+        release = asyncio.Event()
+
+        async def blocked():
+            await release.wait()
+
+        running = asyncio.ensure_future(scheduler.submit(blocked, key='a'))
+        await asyncio.sleep(0.01)
+        oldest = asyncio.ensure_future(scheduler.submit(blocked, key='b'))
+        await asyncio.sleep(0.01)
+        newest = asyncio.ensure_future(scheduler.submit(blocked, key='c'))
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(running, oldest, newest, return_exceptions=True)
+
+    results = run(main, workers=1, queue_size=1, policy='reject')
+    assert results[0] is None and results[1] is None
+    assert isinstance(results[2], SchedulerBusy) and results[2].reason == 'queue_full'
+
+    results = run(main, workers=1, queue_size=1, policy='shed')
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], SchedulerBusy) and results[1].reason == 'shed'